@@ -0,0 +1,148 @@
+import os
+from datetime import date, timedelta
+from typing import Dict, Optional
+
+from sqlalchemy import and_, func, literal, or_, select, text
+from sqlalchemy.orm import Session
+
+from . import models, tz_util
+
+# Antigüedad (en días, por list_for_date) a partir de la cual una lista se archiva
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "365"))
+
+LISTS = models.ShoppingList.__table__
+ITEMS = models.ListItem.__table__
+BLAMES = models.Blame.__table__
+NOTIFICATIONS = models.Notification.__table__
+TOMBSTONES = models.ListItemTombstone.__table__
+
+# Tabla caliente -> tabla de archivo
+ARCHIVE_TABLES = {
+    LISTS: models.ShoppingListArchive.__table__,
+    ITEMS: models.list_items_archive,
+    BLAMES: models.blames_archive,
+    NOTIFICATIONS: models.notifications_archive,
+}
+
+
+def cutoff_for(older_than_days: int = ARCHIVE_AFTER_DAYS) -> date:
+    return tz_util.today() - timedelta(days=older_than_days)
+
+
+def _archivable_lists(cutoff: date):
+    # Las listas sin fecha se juzgan por created_at
+    return or_(
+        LISTS.c.list_for_date < cutoff,
+        and_(LISTS.c.list_for_date.is_(None), LISTS.c.created_at < cutoff),
+    )
+
+
+def _batch_filters(list_ids) -> Dict:
+    """
+    Filas que acompañan a un lote de listas: sus ítems, los blames de la lista y de
+    sus ítems y los tombstones (que solo sirven para sincronizar y se descartan).
+    """
+    item_ids = select(ITEMS.c.id).where(ITEMS.c.list_id.in_(list_ids))
+    return {
+        LISTS: LISTS.c.id.in_(list_ids),
+        ITEMS: ITEMS.c.list_id.in_(list_ids),
+        BLAMES: or_(
+            and_(BLAMES.c.entity_type == "lista", BLAMES.c.entity_id.in_(list_ids)),
+            and_(BLAMES.c.entity_type == "item", BLAMES.c.entity_id.in_(item_ids)),
+        ),
+        TOMBSTONES: TOMBSTONES.c.list_id.in_(list_ids),
+    }
+
+
+def _archivable_notifications(cutoff: date):
+    # Solo las ya leídas: las pendientes siguen apareciendo en la campana
+    return and_(NOTIFICATIONS.c.is_read.is_(True), NOTIFICATIONS.c.created_at < cutoff)
+
+
+def _average_row_bytes(db: Session, table) -> Optional[float]:
+    """
+    Tamaño medio de fila según el motor: information_schema en MySQL/MariaDB y
+    dbstat en SQLite. None si no se puede estimar.
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect == "mysql":
+        value = db.execute(text(
+            "SELECT AVG_ROW_LENGTH FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :name"
+        ), {"name": table.name}).scalar()
+        return float(value) if value else None
+    if dialect == "sqlite":
+        try:
+            size = db.execute(text("SELECT SUM(pgsize) FROM dbstat WHERE name = :name"), {"name": table.name}).scalar()
+        except Exception:
+            # SQLite compilado sin SQLITE_ENABLE_DBSTAT_VTAB
+            db.rollback()
+            return None
+        rows = db.execute(select(func.count()).select_from(table)).scalar()
+        return size / rows if size and rows else None
+    return None
+
+
+def archive_report(db: Session, cutoff: date) -> Dict:
+    """
+    Dry run: filas que se moverían (o descartarían, en el caso de los tombstones) y
+    bytes estimados con el tamaño medio de fila de cada tabla.
+    """
+    list_ids = select(LISTS.c.id).where(_archivable_lists(cutoff))
+    filters = _batch_filters(list_ids)
+    filters[NOTIFICATIONS] = _archivable_notifications(cutoff)
+
+    tables = {}
+    for table, condition in filters.items():
+        rows = db.execute(select(func.count()).select_from(table).where(condition)).scalar()
+        average = _average_row_bytes(db, table) if rows else None
+        tables[table.name] = {"rows": rows, "bytes": int(rows * average) if average else None}
+    return {
+        "cutoff": cutoff.isoformat(),
+        "tables": tables,
+        "total_rows": sum(entry["rows"] for entry in tables.values()),
+        "total_bytes": sum(entry["bytes"] or 0 for entry in tables.values()),
+    }
+
+
+def _move(db: Session, table, condition, archived_at):
+    columns = [column.name for column in table.columns]
+    db.execute(ARCHIVE_TABLES[table].insert().from_select(
+        [*columns, "archived_at"],
+        select(*table.columns, literal(archived_at, models.ShoppingListArchive.archived_at.type)).where(condition),
+    ))
+    return db.execute(table.delete().where(condition)).rowcount
+
+
+def archive_lists(db: Session, cutoff: date, batch_size: int = 500) -> Dict[str, int]:
+    """
+    Mueve las listas anteriores a cutoff, con sus ítems y blames, a las tablas de archivo
+    en transacciones de batch_size listas (INSERT ... SELECT + DELETE por tabla), y
+    después las notificaciones leídas anteriores a cutoff. Devuelve las filas movidas.
+    """
+    moved = dict.fromkeys([table.name for table in ARCHIVE_TABLES], 0)
+    moved[TOMBSTONES.name] = 0
+    archived_at = tz_util.now().replace(tzinfo=None)
+
+    while True:
+        list_ids = db.execute(
+            select(LISTS.c.id).where(_archivable_lists(cutoff)).order_by(LISTS.c.id).limit(batch_size)
+        ).scalars().all()
+        if not list_ids:
+            break
+        filters = _batch_filters(list_ids)
+        # Los blames de ítems se localizan por list_items: van antes de borrar los ítems
+        moved[BLAMES.name] += _move(db, BLAMES, filters[BLAMES], archived_at)
+        moved[TOMBSTONES.name] += db.execute(TOMBSTONES.delete().where(filters[TOMBSTONES])).rowcount
+        moved[ITEMS.name] += _move(db, ITEMS, filters[ITEMS], archived_at)
+        moved[LISTS.name] += _move(db, LISTS, filters[LISTS], archived_at)
+        db.commit()
+
+    while True:
+        notification_ids = db.execute(
+            select(NOTIFICATIONS.c.id).where(_archivable_notifications(cutoff)).order_by(NOTIFICATIONS.c.id).limit(batch_size)
+        ).scalars().all()
+        if not notification_ids:
+            break
+        moved[NOTIFICATIONS.name] += _move(db, NOTIFICATIONS, NOTIFICATIONS.c.id.in_(notification_ids), archived_at)
+        db.commit()
+    return moved
@@ -0,0 +1,221 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Dict, FrozenSet, Iterable, NamedTuple, Optional, Set
+
+from sqlalchemy import func
+from sqlalchemy.exc import SQLAlchemyError
+
+from . import models, tz_util
+from .database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "1024"))
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "60"))
+# Cada cuánto lee cada worker, en segundo plano, las revocaciones publicadas por los
+# demás: es el retraso máximo con el que un cambio de permisos llega a todos los procesos
+PRINCIPAL_CACHE_SYNC = float(os.getenv("PRINCIPAL_CACHE_SYNC", "1"))
+# Las revocaciones más antiguas se purgan al publicar otras nuevas
+REVOCATION_RETENTION = timedelta(hours=1)
+
+
+class Principal(NamedTuple):
+    """
+    Snapshot inmutable del usuario autenticado: lo justo para autorizar una petición
+    sin volver a cargar el usuario y sus familias desde la base de datos.
+    """
+    id: int
+    is_admin: bool
+    family_ids: FrozenSet[int]
+    default_family_id: Optional[int]
+
+    @classmethod
+    def from_user(cls, user: models.User) -> "Principal":
+        families = list(user.families)
+        return cls(
+            id=user.id,
+            is_admin=bool(user.is_admin),
+            family_ids=frozenset(f.id for f in families),
+            default_family_id=families[0].id if families else None,
+        )
+
+
+class PrincipalCache:
+    """
+    Cache LRU con TTL que mapea el subject del token (username) a un Principal.
+    Las mutaciones de usuarios y membresías deben invalidar explícitamente; la
+    invalidación se publica en auth_revocations y el resto de workers la aplica en su
+    siguiente sync() (sync_forever, cada PRINCIPAL_CACHE_SYNC segundos). Las peticiones
+    no consultan nada en un hit. El TTL solo acota lo que cambie sin pasar por
+    invalidate_user/clear.
+    """
+
+    def __init__(self, max_size: int = PRINCIPAL_CACHE_SIZE, ttl: float = PRINCIPAL_CACHE_TTL,
+                 sync_interval: float = PRINCIPAL_CACHE_SYNC, session_factory=SessionLocal):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.sync_interval = sync_interval
+        self._session_factory = session_factory
+        self._last_revocation: Optional[int] = None
+        # Publicadas por este proceso: ya aplicadas al invalidar, sync() las salta
+        self._own_revocations: Set[int] = set()
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        # Índice inverso user_id -> subjects, para invalidar por id
+        self._by_user: Dict[int, Set[str]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, subject: str) -> Optional[Principal]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(subject)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, principal = entry
+            if expires_at <= now:
+                self._remove(subject)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(subject)
+            self.hits += 1
+            return principal
+
+    def put(self, subject: str, user: models.User) -> Principal:
+        principal = Principal.from_user(user)
+        if self.max_size <= 0 or self.ttl <= 0:
+            return principal
+        with self._lock:
+            if subject in self._entries:
+                self._remove(subject)
+            self._entries[subject] = (time.monotonic() + self.ttl, principal)
+            self._by_user.setdefault(principal.id, set()).add(subject)
+            while len(self._entries) > self.max_size:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+        return principal
+
+    def invalidate_user(self, user_id: int):
+        self.invalidate_users([user_id])
+
+    def invalidate_users(self, user_ids):
+        user_ids = list(user_ids)
+        with self._lock:
+            for user_id in user_ids:
+                self._drop_user(user_id)
+        self._publish(user_ids)
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+        self._publish([None])
+
+    def sync(self):
+        """
+        Aplica las revocaciones publicadas desde la última sincronización. La primera
+        (en el startup, antes de atender peticiones) solo toma la posición.
+        """
+        revocations = models.AuthRevocation
+        db = self._session_factory()
+        try:
+            if self._last_revocation is None:
+                rows = []
+                last = db.query(func.max(revocations.id)).scalar() or 0
+            else:
+                rows = db.query(revocations.id, revocations.user_id).filter(
+                    revocations.id > self._last_revocation
+                ).order_by(revocations.id).all()
+                last = rows[-1].id if rows else self._last_revocation
+        finally:
+            db.close()
+        with self._lock:
+            for row in rows:
+                if row.id in self._own_revocations:
+                    self._own_revocations.discard(row.id)
+                    continue
+                if row.user_id is None:
+                    self._clear()
+                else:
+                    self._drop_user(row.user_id)
+            self._last_revocation = max(last, self._last_revocation or 0)
+
+    async def sync_forever(self):
+        """
+        Tarea de fondo de cada worker: sync() cada sync_interval segundos en el threadpool.
+        """
+        from starlette.concurrency import run_in_threadpool
+
+        if self.max_size <= 0 or self.ttl <= 0:
+            return
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                await run_in_threadpool(self.sync)
+            except SQLAlchemyError:
+                logger.exception("Could not sync principal cache revocations")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    def _drop_user(self, user_id: int):
+        for subject in list(self._by_user.get(user_id, ())):
+            self._remove(subject)
+            self.invalidations += 1
+
+    def _clear(self):
+        self._entries.clear()
+        self._by_user.clear()
+
+    def _publish(self, user_ids: Iterable[Optional[int]]):
+        # Sesión propia: se llama después del commit de la mutación
+        db = self._session_factory()
+        try:
+            now = tz_util.now().replace(tzinfo=None)
+            revocations = [models.AuthRevocation(user_id=user_id, created_at=now) for user_id in user_ids]
+            db.add_all(revocations)
+            db.query(models.AuthRevocation).filter(
+                models.AuthRevocation.created_at < now - REVOCATION_RETENTION
+            ).delete(synchronize_session=False)
+            db.flush()
+            ids = [revocation.id for revocation in revocations]
+            db.commit()
+            with self._lock:
+                self._own_revocations.update(ids)
+        except SQLAlchemyError:
+            # La invalidación local ya está hecha; en los demás workers caduca con el TTL
+            logger.exception("Could not publish principal cache revocation")
+            db.rollback()
+        finally:
+            db.close()
+
+    def _remove(self, subject: str):
+        entry = self._entries.pop(subject, None)
+        if entry is None:
+            return
+        user_id = entry[1].id
+        subjects = self._by_user.get(user_id)
+        if subjects is not None:
+            subjects.discard(subject)
+            if not subjects:
+                del self._by_user[user_id]
+
+
+principal_cache = PrincipalCache()
@@ -1,60 +1,199 @@
-from sqlalchemy import func
-from sqlalchemy.orm import Session, joinedload
+import base64
+import json
+from sqlalchemy import func, and_, or_, case, select, bindparam, literal
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session, joinedload, selectinload
 from typing import Optional
-from datetime import date
-from . import models, schemas, security
+from datetime import date, datetime, timedelta
+from . import models, schemas, security, tz_util
+from .product_index import ALL_FAMILIES, index_entry, product_index
 
 # CRUD for Products
+def _product_upsert(db: Session, assignments=None):
+    """
+    INSERT sobre products que, si la clave (family_id, normalized_name) ya existe,
+    aplica assignments(fila propuesta) -> [(columna, valor)] o no hace nada.
+    """
+    table = models.Product.__table__
+    if db.get_bind().dialect.name == "mysql":
+        statement = mysql_insert(table)
+        # id = id deja la fila intacta: el equivalente a DO NOTHING
+        return statement.on_duplicate_key_update(assignments(statement.inserted) if assignments else [('id', table.c.id)])
+    statement = sqlite_insert(table)
+    if assignments is None:
+        return statement.on_conflict_do_nothing(index_elements=['family_id', 'normalized_name'])
+    return statement.on_conflict_do_update(index_elements=['family_id', 'normalized_name'], set_=dict(assignments(statement.excluded)))
+
+def _product_upsert_assignments(proposed, mysql: bool) -> list:
+    """
+    Asignaciones del upsert de get_or_create_product sobre un producto existente:
+    categoría y marca si se informan y updated_at solo si alguna cambia.
+    """
+    table = models.Product.__table__
+    category_value = func.coalesce(proposed.category, table.c.category)
+    brand_value = func.coalesce(proposed.brand, table.c.brand)
+    changed = or_(category_value.is_distinct_from(table.c.category), brand_value.is_distinct_from(table.c.brand))
+    # En orden: MySQL evalúa cada asignación con los valores ya actualizados
+    values = [
+        ('updated_at', case((changed, proposed.updated_at), else_=table.c.updated_at)),
+        ('category', category_value),
+        ('brand', brand_value),
+    ]
+    if mysql:
+        # LAST_INSERT_ID(id): lastrowid devuelve también el id de la fila existente
+        values.insert(0, ('id', func.last_insert_id(table.c.id)))
+    return values
+
 def get_or_create_product(db: Session, product_name: str, family_id: int, category: str = None, brand: str = None) -> models.Product:
-    # Check if product exists (case-insensitive)
-    db_product = db.query(models.Product).filter(
-        func.lower(models.Product.name) == func.lower(product_name),
-        models.Product.family_id == family_id
-    ).first()
-    if db_product:
-        # If product exists, update category and brand if they are provided
-        if category and db_product.category != category:
-            db_product.category = category
-        if brand and db_product.brand != brand:
-            db_product.brand = brand
-        db.commit()
-        db.refresh(db_product)
-        return db_product
-    # Create new product if not found
-    db_product = models.Product(name=product_name, family_id=family_id, category=category, brand=brand)
-    db.add(db_product)
-    db.commit()
-    db.refresh(db_product)
+    """
+    Upsert atómico sobre (family_id, normalized_name): dos altas simultáneas de "Leche"
+    y "leche " resuelven al mismo producto. Si se informan, categoría y marca
+    sustituyen a las guardadas. No hace commit: queda en la transacción del llamante.
+    """
+    table = models.Product.__table__
+    mysql = db.get_bind().dialect.name == "mysql"
+
+    key = models.normalize_product_name(product_name)
+    previous = None
+    if category or brand:
+        # Solo entonces pueden cambiar las facetas: hace falta saber de qué valores se parte
+        previous = db.query(models.Product.category, models.Product.brand).filter(
+            models.Product.family_id == family_id, models.Product.normalized_name == key
+        ).first()
+
+    now = tz_util.now().replace(tzinfo=None)
+    statement = _product_upsert(db, lambda proposed: _product_upsert_assignments(proposed, mysql)).values(
+        name=product_name.strip(), normalized_name=key, family_id=family_id,
+        category=category or None, brand=brand or None, created_at=now, updated_at=now,
+    )
+    if mysql:
+        product_id = db.execute(statement).lastrowid
+    else:
+        product_id = db.execute(statement.returning(table.c.id)).scalar_one()
+    db_product = db.get(models.Product, product_id, populate_existing=True)
+    if category or brand:
+        _apply_product_facets(db, family_id, added=_product_facets(db_product.category, db_product.brand),
+                              removed=_product_facets(*previous) if previous else [])
     return db_product
 
-from sqlalchemy import func, or_
-
-def search_products(db: Session, name: str, family_id: int, skip: int = 0, limit: int = 10):
-    lower_name = name.lower()
-    query = db.query(models.Product).options(joinedload(models.Product.family), joinedload(models.Product.shared_image)).filter(
+def find_product_by_name(db: Session, family_id: int, name: str, exclude_id: Optional[int] = None):
+    # Producto de la familia con la misma clave normalizada (para avisar antes del conflicto)
+    query = db.query(models.Product).filter(
         models.Product.family_id == family_id,
-        or_(
-            func.lower(models.Product.name).like(f"%{lower_name}%"),
-            func.lower(models.Product.category).like(f"%{lower_name}%"),
-            func.lower(models.Product.brand).like(f"%{lower_name}%")
-        )
+        models.Product.normalized_name == models.normalize_product_name(name),
     )
-    total = query.count()
-    items = query.offset(skip).limit(limit).all()
-    return {"items": items, "total": total}
+    if exclude_id is not None:
+        query = query.filter(models.Product.id != exclude_id)
+    return query.first()
 
-def search_all_products(db: Session, name: str, skip: int = 0, limit: int = 10):
-    lower_name = name.lower()
-    query = db.query(models.Product).options(joinedload(models.Product.family), joinedload(models.Product.shared_image)).filter(
-        or_(
-            func.lower(models.Product.name).like(f"%{lower_name}%"),
-            func.lower(models.Product.category).like(f"%{lower_name}%"),
-            func.lower(models.Product.brand).like(f"%{lower_name}%")
+# Facetas del catálogo: se mantienen como los contadores de las listas, con deltas en la
+# misma transacción que la escritura del producto y recompute_product_facets para repararlas
+FACET_KINDS = ('category', 'brand')
+
+def _product_facets(category: Optional[str], brand: Optional[str]) -> list:
+    return [(kind, value) for kind, value in zip(FACET_KINDS, (category, brand)) if value]
+
+def _apply_product_facets(db: Session, family_id: Optional[int], added: list = (), removed: list = ()):
+    """
+    Suma 1 a cada (kind, value) de added y resta 1 a los de removed con un upsert por
+    lote. Las filas que bajan a 0 se quedan (se filtran al leer) hasta el próximo recompute.
+    """
+    if family_id is None:
+        return
+    delta = {}
+    for facet in added:
+        delta[facet] = delta.get(facet, 0) + 1
+    for facet in removed:
+        delta[facet] = delta.get(facet, 0) - 1
+    rows = [{"family_id": family_id, "kind": kind, "value": value, "count": count} for (kind, value), count in delta.items() if count]
+    if not rows:
+        return
+    table = models.ProductFacet.__table__
+    if db.get_bind().dialect.name == "mysql":
+        statement = mysql_insert(table)
+        statement = statement.on_duplicate_key_update(count=table.c.count + statement.inserted.count)
+    else:
+        statement = sqlite_insert(table)
+        statement = statement.on_conflict_do_update(index_elements=['family_id', 'kind', 'value'], set_={'count': table.c.count + statement.excluded.count})
+    db.execute(statement, rows)
+
+def recompute_product_facets(db: Session, family_ids: Optional[list] = None) -> int:
+    """
+    Rehace las facetas desde products con un INSERT ... SELECT agrupado por tipo.
+    Sin family_ids rehace todas. Devuelve el número de filas escritas.
+    """
+    table = models.ProductFacet.__table__
+    products = models.Product.__table__
+    delete = table.delete()
+    if family_ids is not None:
+        delete = delete.where(table.c.family_id.in_(family_ids))
+    db.execute(delete)
+    written = 0
+    for kind in FACET_KINDS:
+        column = products.c[kind]
+        source = select(products.c.family_id, literal(kind, table.c.kind.type), column, func.count()).where(
+            products.c.family_id.isnot(None), column.isnot(None), column != ''
         )
+        if family_ids is not None:
+            source = source.where(products.c.family_id.in_(family_ids))
+        written += db.execute(
+            table.insert().from_select(['family_id', 'kind', 'value', 'count'], source.group_by(products.c.family_id, column))
+        ).rowcount
+    db.commit()
+    return written
+
+def get_product_facets(db: Session, family_id: Optional[int], prefix: Optional[str] = None, limit: Optional[int] = None) -> dict:
+    """
+    Categorías y marcas con su número de productos, de más a menos frecuente: una
+    consulta por tipo con el LIMIT en SQL. Con family_id None (administración) suma
+    todas las familias con un GROUP BY. El prefijo no distingue mayúsculas.
+    """
+    table = models.ProductFacet.__table__
+    facets = {}
+    for kind in FACET_KINDS:
+        if family_id is None:
+            count = func.sum(table.c.count).label('count')
+            query = select(table.c.value, count).where(table.c.kind == kind).group_by(table.c.value).having(count > 0)
+        else:
+            count = table.c.count
+            query = select(table.c.value, count).where(table.c.family_id == family_id, table.c.kind == kind, count > 0)
+        if prefix:
+            query = query.where(func.lower(table.c.value).startswith(prefix.lower(), autoescape=True))
+        query = query.order_by(count.desc(), table.c.value)
+        if limit is not None:
+            query = query.limit(limit)
+        facets[kind] = [{"value": row.value, "count": row.count} for row in db.execute(query)]
+    return {"categories": facets['category'], "brands": facets['brand']}
+
+def _product_load_options():
+    # Todo lo que serializa schemas.Product
+    return (
+        selectinload(models.Product.price_history),
+        joinedload(models.Product.shared_image),
+        joinedload(models.Product.family).joinedload(models.Family.owner),
     )
-    total = query.count()
-    items = query.offset(skip).limit(limit).all()
-    return {"items": items, "total": total}
+
+def _search_products(db: Session, name: str, family_id: Optional[int], skip: int, limit: int):
+    """
+    Búsqueda por nombre, marca o categoría sobre el índice de trigramas en memoria
+    (product_index), ordenada por relevancia. Solo se cargan de la base de datos
+    los productos de la página.
+    """
+    ids, total = product_index.search(db, family_id, name, skip, limit)
+    if not ids:
+        return {"items": [], "total": total}
+    loaded = {
+        product.id: product
+        for product in db.query(models.Product).options(*_product_load_options()).filter(models.Product.id.in_(ids))
+    }
+    return {"items": [loaded[product_id] for product_id in ids if product_id in loaded], "total": total}
+
+def search_products(db: Session, name: str, family_id: int, skip: int = 0, limit: int = 10):
+    return _search_products(db, name, family_id, skip, limit)
+
+def search_all_products(db: Session, name: str, skip: int = 0, limit: int = 10):
+    return _search_products(db, name, ALL_FAMILIES, skip, limit)
 
 def get_products_by_family(db: Session, family_id: int, skip: int = 0, limit: int = 100, category: str = None, brand: str = None):
     query = db.query(models.Product).options(joinedload(models.Product.family), joinedload(models.Product.shared_image)).filter(models.Product.family_id == family_id)
@@ -88,8 +227,10 @@ def create_family_product(db: Session, product: schemas.ProductCreate, family_id
         db_product.shared_image_id = product.shared_image_id
 
     db.add(db_product)
+    _apply_product_facets(db, family_id, added=_product_facets(db_product.category, db_product.brand))
     db.commit()
     db.refresh(db_product)
+    product_index.upsert(db_product)
     return db_product
 
 def update_family_product(db: Session, product_id: int, product_update: schemas.ProductCreate):
@@ -102,17 +243,28 @@ def update_family_product(db: Session, product_id: int, product_update: schemas.
     if product_update.shared_image_id is not None: # Check for None explicitly to allow setting to null
         db_product.shared_image_id = product_update.shared_image_id
     
+    old_price = db_product.last_price
+    old_facets = _product_facets(db_product.category, db_product.brand)
     for key, value in update_data.items():
         setattr(db_product, key, value)
+    _apply_product_facets(db, db_product.family_id, added=_product_facets(db_product.category, db_product.brand), removed=old_facets)
+    if not _reprice_product_in_lists(db, db_product.id, old_price, db_product.last_price):
+        touch_product_lists(db, db_product.id)
     db.commit()
     db.refresh(db_product)
+    product_index.upsert(db_product)
     return db_product
 
 def delete_family_product(db: Session, product_id: int):
     db_product = get_product(db, product_id)
     if db_product:
+        # Los ítems quedan sin producto (ON DELETE SET NULL) y pasan a valer 0
+        if not _reprice_product_in_lists(db, product_id, db_product.last_price, None):
+            touch_product_lists(db, product_id)
+        _apply_product_facets(db, db_product.family_id, removed=_product_facets(db_product.category, db_product.brand))
         db.delete(db_product)
         db.commit()
+        product_index.remove(db_product.family_id, product_id)
     return db_product
 
 def safe_delete_product(db: Session, product_id: int):
@@ -125,7 +277,9 @@ def safe_delete_product(db: Session, product_id: int):
     if not db_product:
         return None
 
-    # Step 1: Unlink from existing list items
+    # Step 1: Unlink from existing list items (their unconfirmed price drops to 0)
+    if not _reprice_product_in_lists(db, product_id, db_product.last_price, None):
+        touch_product_lists(db, product_id)
     db.query(models.ListItem).filter(models.ListItem.product_id == product_id).update({
         models.ListItem.product_id: None
     }, synchronize_session=False)
@@ -134,10 +288,80 @@ def safe_delete_product(db: Session, product_id: int):
     db.query(models.PriceHistory).filter(models.PriceHistory.product_id == product_id).delete(synchronize_session=False)
 
     # Step 3: Delete product
+    _apply_product_facets(db, db_product.family_id, removed=_product_facets(db_product.category, db_product.brand))
     db.delete(db_product)
     db.commit()
+    product_index.remove(db_product.family_id, product_id)
     return db_product
 
+# Campos que el producto superviviente hereda de sus duplicados si no los tiene
+MERGED_PRODUCT_FIELDS = ('category', 'brand', 'description', 'shared_image_id', 'last_price')
+
+def merge_duplicate_products(db: Session, dry_run: bool = False, batch_size: int = 5000) -> dict:
+    """
+    Rellena products.normalized_name y fusiona los productos de una familia con la misma
+    clave: sobrevive el más antiguo, que recibe los ítems (también los archivados) y el
+    historial de precios de los demás y hereda sus campos vacíos y el último precio del
+    producto del grupo modificado más recientemente. Después recalcula los contadores de
+    las listas afectadas. Con dry_run solo cuenta.
+    """
+    table = models.Product.__table__
+    groups = {}
+    stale_keys = []
+    for row in db.execute(select(table.c.id, table.c.family_id, table.c.name, table.c.normalized_name).order_by(table.c.id)):
+        key = models.normalize_product_name(row.name)
+        if row.normalized_name != key:
+            stale_keys.append({'b_id': row.id, 'b_key': key})
+        # Sin familia no hay restricción de unicidad: no se fusionan
+        if row.family_id is not None:
+            groups.setdefault((row.family_id, key), []).append(row.id)
+    duplicates = {ids[0]: ids[1:] for ids in groups.values() if len(ids) > 1}
+    report = {
+        "groups": len(duplicates),
+        "merged_products": sum(len(ids) for ids in duplicates.values()),
+        "backfilled": len(stale_keys),
+        "lists": 0,
+    }
+    if dry_run or (not duplicates and not stale_keys):
+        return report
+
+    affected_lists = set()
+    for survivor_id, merged_ids in duplicates.items():
+        group_ids = [survivor_id, *merged_ids]
+        affected_lists.update(row[0] for row in db.query(models.ListItem.list_id).filter(models.ListItem.product_id.in_(group_ids)).distinct())
+        survivor = db.get(models.Product, survivor_id)
+        merged = db.query(models.Product).filter(models.Product.id.in_(merged_ids)).all()
+        by_recency = sorted([survivor, *merged], key=lambda product: product.updated_at or datetime.min, reverse=True)
+        for field in MERGED_PRODUCT_FIELDS:
+            # El precio, del más reciente; el resto, del superviviente si lo tiene
+            candidates = by_recency if field == 'last_price' else [survivor, *by_recency]
+            setattr(survivor, field, next((getattr(product, field) for product in candidates if getattr(product, field) is not None), None))
+        for target in (models.ListItem.__table__, models.list_items_archive, models.PriceHistory.__table__):
+            db.execute(target.update().where(target.c.product_id.in_(merged_ids)).values(product_id=survivor_id))
+        for product in merged:
+            db.expunge(product)
+        db.execute(table.delete().where(table.c.id.in_(merged_ids)))
+    db.flush()
+
+    # Con los duplicados ya borrados la clave no choca con el índice único
+    for start in range(0, len(stale_keys), batch_size):
+        db.execute(
+            table.update().where(table.c.id == bindparam('b_id')).values(normalized_name=bindparam('b_key')),
+            stale_keys[start:start + batch_size],
+        )
+    db.commit()
+    if duplicates:
+        recompute_product_facets(db, family_ids=sorted({family_id for (family_id, _), ids in groups.items() if len(ids) > 1}))
+
+    if affected_lists:
+        report["lists"] = recompute_list_counters(db, list_ids=sorted(affected_lists), batch_size=batch_size)
+        # Los ítems de los productos fusionados toman la versión nueva de su lista (delta sync)
+        for survivor_id in duplicates:
+            _stamp_product_items(db, survivor_id)
+        db.commit()
+    product_index.clear()
+    return report
+
 def get_price_history_for_product(db: Session, product_id: int):
     return db.query(models.PriceHistory).filter(models.PriceHistory.product_id == product_id).order_by(models.PriceHistory.created_at.desc()).all()
 
@@ -154,8 +378,10 @@ def get_user_by_username(db: Session, username: str):
 def get_users(db: Session, skip: int = 0, limit: int = 100):
     return db.query(models.User).offset(skip).limit(limit).all()
 
-def create_user(db: Session, user: schemas.UserCreate):
-    hashed_password = security.get_password_hash(user.password)
+def create_user(db: Session, user: schemas.UserCreate, hashed_password: Optional[str] = None):
+    # Los endpoints async calculan el hash fuera con security.get_password_hash_async
+    if hashed_password is None:
+        hashed_password = security.get_password_hash(user.password)
     db_user = models.User(
         email=user.email,
         username=user.username,
@@ -172,8 +398,14 @@ def create_user(db: Session, user: schemas.UserCreate):
 
 def authenticate_user(db: Session, username: str, password: str):
     user = get_user_by_username(db, username)
-    if not user or not security.verify_password(password, user.hashed_password):
+    if not user:
+        return False
+    valid, new_hash = security.verify_and_update_password(password, user.hashed_password)
+    if not valid:
         return False
+    if new_hash:
+        set_password_hash(db, user, new_hash)
+        security.password_hasher.record_rehash()
     return user
 
 def update_user(db: Session, user_id: int, user_update: schemas.UserUpdateByAdmin):
@@ -203,7 +435,10 @@ def update_me(db: Session, user: models.User, user_update: schemas.UserUpdate):
     return user
 
 def change_password(db: Session, user: models.User, new_password: str):
-    user.hashed_password = security.get_password_hash(new_password)
+    return set_password_hash(db, user, security.get_password_hash(new_password))
+
+def set_password_hash(db: Session, user: models.User, hashed_password: str):
+    user.hashed_password = hashed_password
     db.commit()
     db.refresh(user)
     return user
@@ -247,6 +482,8 @@ def update_family(db: Session, family_id: int, family_update: schemas.FamilyUpda
 def delete_family(db: Session, family_id: int):
     db_family = get_family(db, family_id=family_id)
     if db_family:
+        # Sin depender de ON DELETE CASCADE (SQLite no aplica las FK por defecto)
+        db.query(models.ProductFacet).filter(models.ProductFacet.family_id == family_id).delete(synchronize_session=False)
         db.delete(db_family)
         db.commit()
     return db_family
@@ -261,11 +498,62 @@ def transfer_ownership(db: Session, family: models.Family, new_owner_id: int):
 
 
 # CRUD for Shopping Lists
-def get_list(db: Session, list_id: int):
-    return db.query(models.ShoppingList).options(
-        joinedload(models.ShoppingList.items).joinedload(models.ListItem.product),
-        joinedload(models.ShoppingList.calendar)
-    ).filter(models.ShoppingList.id == list_id).first()
+def _list_models(archived: bool):
+    # (lista, ítem): las tablas de archivo tienen las mismas columnas y son de solo lectura
+    if archived:
+        return models.ShoppingListArchive, models.ListItemArchive
+    return models.ShoppingList, models.ListItem
+
+def get_list(db: Session, list_id: int, archived: bool = False):
+    lista, item = _list_models(archived)
+    return db.query(lista).options(
+        joinedload(lista.items).joinedload(item.product),
+        joinedload(lista.calendar)
+    ).filter(lista.id == list_id).first()
+
+def get_list_access(db: Session, list_id: int, archived: bool = False):
+    """
+    Resuelve lista -> calendario -> familia con una única consulta de columnas,
+    sin hidratar los ítems. calendar_id es None si la lista no tiene calendario.
+    """
+    lista, _ = _list_models(archived)
+    return db.query(
+        lista.id.label("list_id"),
+        lista.owner_id,
+        lista.version,
+        models.Calendar.id.label("calendar_id"),
+        models.Calendar.family_id,
+    ).outerjoin(
+        models.Calendar, models.Calendar.id == lista.calendar_id
+    ).filter(lista.id == list_id).first()
+
+def get_item_access(db: Session, item_id: int):
+    """
+    Igual que get_list_access pero partiendo de un ítem. list_id es None si el ítem
+    apunta a una lista que ya no existe.
+    """
+    return db.query(
+        models.ListItem.id.label("item_id"),
+        models.ShoppingList.id.label("list_id"),
+        models.ShoppingList.owner_id,
+        models.Calendar.id.label("calendar_id"),
+        models.Calendar.family_id,
+    ).outerjoin(
+        models.ShoppingList, models.ShoppingList.id == models.ListItem.list_id
+    ).outerjoin(
+        models.Calendar, models.Calendar.id == models.ShoppingList.calendar_id
+    ).filter(models.ListItem.id == item_id).first()
+
+def _filter_list_dates(query, start_date: Optional[date], end_date: Optional[date], model=models.ShoppingList):
+    """
+    Rango [start_date, end_date] por día. El final es abierto (< end_date + 1 día) para que
+    el predicado sea correcto aunque la columna se haya creado como DATETIME.
+    """
+    if start_date:
+        query = query.filter(model.list_for_date >= start_date)
+    if end_date:
+        query = query.filter(model.list_for_date < end_date + timedelta(days=1))
+    return query
 
 def get_lists_by_calendar(
     db: Session,
@@ -278,57 +566,265 @@ def get_lists_by_calendar(
     query = db.query(models.ShoppingList).filter(
         models.ShoppingList.calendar_id == calendar_id
     )
+    query = _filter_list_dates(query, start_date, end_date)
 
-    if start_date:
-        query = query.filter(models.ShoppingList.list_for_date >= start_date)
-    if end_date:
-        query = query.filter(models.ShoppingList.list_for_date <= end_date)
+    if limit is None:
+        # Sin paginación el total es simplemente el número de filas devueltas
+        items = query.order_by(models.ShoppingList.list_for_date, models.ShoppingList.id).all()
+        return {"items": items, "total": len(items)}
 
     total = query.count()
-
-    if limit is not None:
-        query = query.offset(skip).limit(limit)
-
-    items = query.all()
+    items = query.order_by(models.ShoppingList.list_for_date, models.ShoppingList.id).offset(skip).limit(limit).all()
     return {"items": items, "total": total}
 
 def get_lists_by_family(db: Session, family_id: int, skip: int = 0, limit: int = 100, start_date: date = None, end_date: date = None):
-    query = db.query(models.ShoppingList).join(models.Calendar).filter(models.Calendar.family_id == family_id)
-    if start_date:
-        query = query.filter(models.ShoppingList.list_for_date >= start_date)
-    if end_date:
-        query = query.filter(models.ShoppingList.list_for_date <= end_date)
-    
-    total = query.count()
-    items = query.order_by(models.ShoppingList.created_at.desc()).offset(skip).limit(limit).all()
+    """
+    Listas de la familia, incluidas las movidas a shopping_lists_archive: se pagina sobre
+    la unión de (id, created_at) de ambas tablas y luego se cargan solo las filas de la página.
+    """
+    family_calendars = select(models.Calendar.id).where(models.Calendar.family_id == family_id)
+    branches = []
+    for model, archived in ((models.ShoppingList, False), (models.ShoppingListArchive, True)):
+        branch = db.query(model.id.label("id"), model.created_at.label("created_at"), literal(archived).label("archived")).filter(
+            model.calendar_id.in_(family_calendars)
+        )
+        branches.append(_filter_list_dates(branch, start_date, end_date, model=model))
+    union = branches[0].union_all(branches[1]).subquery()
+
+    total = db.query(func.count()).select_from(union).scalar()
+    page = (
+        db.query(union.c.id, union.c.archived)
+        .order_by(union.c.created_at.desc(), union.c.id.desc())
+        .offset(skip).limit(limit).all()
+    )
+    loaded = {}
+    for model, archived in ((models.ShoppingList, False), (models.ShoppingListArchive, True)):
+        ids = [row.id for row in page if bool(row.archived) == archived]
+        if ids:
+            for db_list in db.query(model).options(joinedload(model.calendar)).filter(model.id.in_(ids)):
+                loaded[(db_list.id, archived)] = db_list
+    items = [loaded[(row.id, bool(row.archived))] for row in page]
     return {"items": items, "total": total}
 
 def get_lists_by_user(db: Session, user_id: int):
     return db.query(models.ShoppingList).filter(models.ShoppingList.owner_id == user_id).all()
 
+def _item_amount():
+    # Precio del ítem: confirmado > último precio del producto > 0, por la cantidad
+    return func.coalesce(models.ListItem.precio_confirmado, models.Product.last_price, 0) * func.coalesce(models.ListItem.cantidad, 0)
+
+def _budget_columns():
+    amount = _item_amount()
+    return (
+        func.coalesce(func.sum(amount), 0).label('total_estimado'),
+        func.coalesce(func.sum(case((models.ListItem.status == 'comprado', amount), else_=0)), 0).label('total_comprado'),
+    )
+
 def get_budget_details_for_list(db: Session, list_id: int):
     """
-    Calculates the estimated and purchased totals for a given shopping list.
+    Calculates the estimated and purchased totals for a given shopping list
+    with a single aggregate query.
     """
-    items = db.query(models.ListItem).options(
-        joinedload(models.ListItem.product)
-    ).filter(models.ListItem.list_id == list_id).all()
+    row = (
+        db.query(*_budget_columns())
+        .select_from(models.ListItem)
+        .outerjoin(models.Product, models.ListItem.product_id == models.Product.id)
+        .filter(models.ListItem.list_id == list_id)
+        .one()
+    )
+    return {"total_estimado": row.total_estimado, "total_comprado": row.total_comprado}
 
-    total_estimado = 0
-    total_comprado = 0
+def get_budget_details_for_calendar(db: Session, calendar_id: int, start_date: Optional[date] = None, end_date: Optional[date] = None):
+    """
+    Totales de todas las listas de un calendario (opcionalmente en un rango de fechas)
+    en una sola consulta agrupada; las listas sin ítems salen con 0.
+    """
+    query = (
+        db.query(models.ShoppingList.id.label('list_id'), models.ShoppingList.budget, *_budget_columns())
+        .outerjoin(models.ListItem, models.ListItem.list_id == models.ShoppingList.id)
+        .outerjoin(models.Product, models.ListItem.product_id == models.Product.id)
+        .filter(models.ShoppingList.calendar_id == calendar_id)
+    )
+    query = _filter_list_dates(query, start_date, end_date)
+
+    rows = query.group_by(models.ShoppingList.id, models.ShoppingList.budget).order_by(models.ShoppingList.id).all()
+    return [
+        {
+            "list_id": row.list_id,
+            "budget": row.budget,
+            "total_estimado": row.total_estimado,
+            "total_comprado": row.total_comprado,
+            "over_budget": row.budget is not None and row.total_estimado > row.budget,
+        }
+        for row in rows
+    ]
+
+# Estado de las listas -> campo del resumen diario (para colorear el calendario)
+LIST_STATUS_SUMMARY = {
+    'pendiente': 'pending_lists',
+    'revisada': 'reviewed_lists',
+    'no revisada': 'not_reviewed_lists',
+}
+
+def get_calendar_summary(db: Session, calendar_id: int, start_date: date, end_date: date):
+    """
+    Resumen por día para la vista mensual: una consulta agrupada sobre shopping_lists
+    (índice (calendar_id, list_for_date)) usando los contadores mantenidos, sin leer ítems.
+    """
+    over_budget = and_(models.ShoppingList.budget.isnot(None), models.ShoppingList.estimated_total > models.ShoppingList.budget)
+    query = db.query(
+        models.ShoppingList.list_for_date.label('day'),
+        func.count(models.ShoppingList.id).label('list_count'),
+        func.coalesce(func.sum(models.ShoppingList.items_count), 0).label('item_count'),
+        func.coalesce(func.sum(models.ShoppingList.purchased_count), 0).label('purchased_count'),
+        func.coalesce(func.sum(models.ShoppingList.estimated_total), 0).label('estimated_total'),
+        func.coalesce(func.sum(case((over_budget, 1), else_=0)), 0).label('over_budget_count'),
+        *[func.coalesce(func.sum(case((models.ShoppingList.status == status, 1), else_=0)), 0).label(key) for status, key in LIST_STATUS_SUMMARY.items()],
+    ).filter(models.ShoppingList.calendar_id == calendar_id)
+    query = _filter_list_dates(query, start_date, end_date)
+
+    days = {}
+    for row in query.group_by(models.ShoppingList.list_for_date).all():
+        if row.day is None:
+            continue
+        # Con una columna DATETIME heredada puede haber varias filas por día: se suman aquí
+        day = row.day.date() if isinstance(row.day, datetime) else row.day
+        keys = ("list_count", "item_count", "purchased_count", "estimated_total", "over_budget_count", *LIST_STATUS_SUMMARY.values())
+        summary = days.setdefault(day, {"day": day, **dict.fromkeys(keys, 0)})
+        for key in keys:
+            summary[key] += getattr(row, key)
+    return [days[day] for day in sorted(days)]
+
+# --- Contadores por lista ---
+STATUS_COUNTERS = {
+    'pendiente': 'pending_count',
+    'comprado': 'purchased_count',
+    'ya no se necesita': 'not_needed_count',
+}
+LIST_COUNTERS = ['items_count', *STATUS_COUNTERS.values(), 'estimated_total', 'purchased_total']
+
+def _item_counters(status: str, cantidad: float, precio_confirmado: Optional[float], last_price: Optional[float]) -> dict:
+    """
+    Aportación de un ítem a los contadores de su lista. Usa el mismo precio que
+    get_budget_details_for_list: confirmado > último precio del producto > 0.
+    """
+    price = precio_confirmado if precio_confirmado is not None else (last_price or 0)
+    amount = price * (cantidad or 0)
+    counters = {'items_count': 1, 'estimated_total': amount, 'purchased_total': amount if status == 'comprado' else 0}
+    if status in STATUS_COUNTERS:
+        counters[STATUS_COUNTERS[status]] = 1
+    return counters
+
+def _product_last_price(db: Session, product_id: Optional[int]) -> Optional[float]:
+    product = db.get(models.Product, product_id) if product_id is not None else None
+    return product.last_price if product else None
+
+def _apply_list_counters(db: Session, list_id: int, added: dict = None, removed: dict = None):
+    """
+    Aplica la diferencia added - removed con un UPDATE atómico (col = col + delta),
+    dentro de la misma transacción que la escritura del ítem. Sube siempre la versión.
+    """
+    deltas = dict.fromkeys(LIST_COUNTERS, 0)
+    for key, value in (added or {}).items():
+        deltas[key] += value
+    for key, value in (removed or {}).items():
+        deltas[key] -= value
+    values = {getattr(models.ShoppingList, key): getattr(models.ShoppingList, key) + delta for key, delta in deltas.items() if delta}
+    values[models.ShoppingList.version] = models.ShoppingList.version + 1
+    db.query(models.ShoppingList).filter(models.ShoppingList.id == list_id).update(values, synchronize_session=False)
+
+def _list_version(list_id: int):
+    # Versión actual de la lista como subconsulta: sella ítems y tombstones en la misma sentencia
+    return select(models.ShoppingList.version).where(models.ShoppingList.id == list_id).scalar_subquery()
+
+def _stamp_product_items(db: Session, product_id: int):
+    # Los ítems del producto cambian en su representación: toman la versión (ya subida) de su lista
+    db.query(models.ListItem).filter(models.ListItem.product_id == product_id).update({
+        models.ListItem.version: select(models.ShoppingList.version).where(models.ShoppingList.id == models.ListItem.list_id).scalar_subquery()
+    }, synchronize_session=False)
 
-    for item in items:
-        # Logic for estimated total: confirmed price > product's last price > 0
-        precio_a_usar = item.precio_confirmado if item.precio_confirmado is not None else (item.product.last_price if item.product else 0)
-        if precio_a_usar is None: # If last_price is also null
-            precio_a_usar = 0
-        total_estimado += (precio_a_usar * item.cantidad)
+def touch_product_lists(db: Session, product_id: int):
+    """
+    Sube la versión de las listas que muestran el producto (nombre, imagen...),
+    sin tocar sus totales. No hace commit.
+    """
+    db.flush()
+    db.query(models.ShoppingList).filter(
+        models.ShoppingList.id.in_(select(models.ListItem.list_id).where(models.ListItem.product_id == product_id))
+    ).update({models.ShoppingList.version: models.ShoppingList.version + 1}, synchronize_session=False)
+    _stamp_product_items(db, product_id)
 
-        # Logic for purchased total: uses the same price logic but only for 'comprado' items
-        if item.status == 'comprado':
-            total_comprado += (precio_a_usar * item.cantidad)
+def _reprice_product_in_lists(db: Session, product_id: int, old_price: Optional[float], new_price: Optional[float]):
+    """
+    Los ítems sin precio confirmado se valoran con product.last_price: al cambiar,
+    se ajustan los totales de todas las listas que contienen el producto en un solo UPDATE.
+    Devuelve False si el precio efectivo no cambia y no se ha tocado ninguna lista.
+    """
+    delta = (new_price or 0) - (old_price or 0)
+    if not delta:
+        return False
+    db.flush()
+    unconfirmed = and_(
+        models.ListItem.list_id == models.ShoppingList.id,
+        models.ListItem.product_id == product_id,
+        models.ListItem.precio_confirmado.is_(None),
+    )
+    quantity = select(func.coalesce(func.sum(models.ListItem.cantidad), 0)).where(unconfirmed).scalar_subquery()
+    purchased_quantity = select(func.coalesce(func.sum(models.ListItem.cantidad), 0)).where(
+        unconfirmed, models.ListItem.status == 'comprado'
+    ).scalar_subquery()
+    affected_lists = select(models.ListItem.list_id).where(
+        models.ListItem.product_id == product_id, models.ListItem.precio_confirmado.is_(None)
+    )
+    db.query(models.ShoppingList).filter(models.ShoppingList.id.in_(affected_lists)).update({
+        models.ShoppingList.estimated_total: models.ShoppingList.estimated_total + delta * quantity,
+        models.ShoppingList.purchased_total: models.ShoppingList.purchased_total + delta * purchased_quantity,
+        models.ShoppingList.version: models.ShoppingList.version + 1,
+    }, synchronize_session=False)
+    _stamp_product_items(db, product_id)
+    return True
 
-    return {"total_estimado": total_estimado, "total_comprado": total_comprado}
+def recompute_list_counters(db: Session, list_ids: Optional[list] = None, batch_size: int = 5000) -> int:
+    """
+    Recalcula los contadores desde list_items con una agregación por lotes de listas.
+    Sin list_ids recorre todas las listas. Devuelve el número de listas procesadas.
+    """
+    price = _item_amount()
+    aggregates = [
+        func.count(models.ListItem.id).label('items_count'),
+        *[func.sum(case((models.ListItem.status == status, 1), else_=0)).label(column) for status, column in STATUS_COUNTERS.items()],
+        func.sum(price).label('estimated_total'),
+        func.sum(case((models.ListItem.status == 'comprado', price), else_=0)).label('purchased_total'),
+    ]
+
+    if list_ids is None:
+        list_ids = [row[0] for row in db.query(models.ShoppingList.id).order_by(models.ShoppingList.id)]
+    processed = 0
+    for start in range(0, len(list_ids), batch_size):
+        batch = list_ids[start:start + batch_size]
+        rows = (
+            db.query(models.ListItem.list_id, *aggregates)
+            .outerjoin(models.Product, models.ListItem.product_id == models.Product.id)
+            .filter(models.ListItem.list_id.in_(batch))
+            .group_by(models.ListItem.list_id)
+            .all()
+        )
+        by_list = {row.list_id: row for row in rows}
+        params = []
+        for list_id in batch:
+            row = by_list.get(list_id)
+            params.append({'b_id': list_id, **{f'b_{column}': (getattr(row, column) or 0) if row else 0 for column in LIST_COUNTERS}})
+        # Los nombres de bindparam no pueden coincidir con los de las columnas del SET
+        table = models.ShoppingList.__table__
+        db.execute(
+            table.update().where(table.c.id == bindparam('b_id')).values(
+                {**{column: bindparam(f'b_{column}') for column in LIST_COUNTERS}, 'version': table.c.version + 1}
+            ),
+            params,
+        )
+        db.commit()
+        processed += len(batch)
+    return processed
 
 def create_shopping_list(db: Session, list_data: schemas.ShoppingListCreate, owner_id: int):
     db_list = models.ShoppingList(**list_data.model_dump(), owner_id=owner_id)
@@ -369,6 +865,7 @@ def update_shopping_list(db: Session, list_id: int, list_update: schemas.Shoppin
         setattr(db_list, key, value)
 
     if blame_details:
+        db_list.version = models.ShoppingList.version + 1
         blame_entry = models.Blame(
             user_id=user_id, action="update", entity_type="lista",
             entity_id=list_id, detalles=". ".join(blame_details)
@@ -411,12 +908,17 @@ def create_list_item(db: Session, item: schemas.ListItemCreate, user_id: int, fa
     db.flush()  # Flush to get the ID
 
     if item.precio_confirmado is not None:
+        old_price = product.last_price
         product.last_price = item.precio_confirmado
         price_history_entry = models.PriceHistory(
             product_id=product.id,
             price=item.precio_confirmado
         )
         db.add(price_history_entry)
+        _reprice_product_in_lists(db, product.id, old_price, product.last_price)
+
+    _apply_list_counters(db, item.list_id, added=_item_counters(db_item.status, db_item.cantidad, db_item.precio_confirmado, product.last_price))
+    db_item.version = _list_version(item.list_id)
 
     blame_entry = models.Blame(
         user_id=user_id,
@@ -436,44 +938,220 @@ def create_list_item(db: Session, item: schemas.ListItemCreate, user_id: int, fa
             message = f"{user.username} ha agregado el producto '{item.nombre}' a la lista '{shopping_list.name}'."
             create_notification_for_family_members(db, family_id=calendar.family_id, message=message, created_by_id=user_id, link=f"/shopping-list/{shopping_list.id}")
 
+    # Producto nuevo, recategorizado o con precio nuevo: se indexa tras el commit
+    indexed = [index_entry(product)]
     db.commit()
+    product_index.upsert_many(indexed)
     db.refresh(db_item)
     # Eagerly load product for the return value
     db.refresh(db_item, attribute_names=['product'])
     return db_item
 
+def _list_item_load_options(item=models.ListItem):
+    # Todo lo que serializa schemas.ListItem, cargado en unas pocas consultas para N ítems
+    return (
+        joinedload(item.creado_por),
+        selectinload(item.product).options(*_product_load_options()),
+    )
+
+def _insert_returning_ids(db: Session, table, rows: list) -> list:
+    """
+    Inserta rows y devuelve sus ids en el mismo orden, sin releer por created_at.
+    SQLite y MariaDB 10.5+ lo hacen con INSERT de varias filas y RETURNING; MySQL no
+    tiene RETURNING y se inserta fila a fila leyendo lastrowid.
+    """
+    dialect = db.get_bind().dialect
+    if dialect.name == "sqlite" and dialect.insert_returning:
+        # sort_by_parameter_order iría fila a fila en SQLite (sin centinela implícito); con
+        # un único escritor los ids de cada lote crecen en el orden de rows
+        return sorted(db.execute(table.insert().returning(table.c.id), rows).scalars())
+    if dialect.insert_executemany_returning:
+        return list(db.execute(table.insert().returning(table.c.id, sort_by_parameter_order=True), rows).scalars())
+    return [db.execute(table.insert(), row).lastrowid for row in rows]
+
+def _insert_new_products(db: Session, rows: list) -> set:
+    """
+    Inserta los productos que aún no existan (clave family_id, normalized_name) y
+    devuelve los ids de los que ha insertado esta sentencia, no los de otra petición.
+    """
+    table = models.Product.__table__
+    dialect = db.get_bind().dialect
+    if dialect.name == "mysql":
+        # IGNORE en vez de ON DUPLICATE KEY UPDATE: con CLIENT_FOUND_ROWS una fila
+        # existente también cuenta 1 en rowcount y no se distinguiría de una nueva
+        statement = mysql_insert(table).prefix_with("IGNORE")
+    else:
+        statement = _product_upsert(db)
+    if dialect.insert_executemany_returning:
+        # Las filas descartadas por el conflicto no salen en RETURNING (SQLite, MariaDB 10.5+)
+        return set(db.execute(statement.returning(table.c.id), rows).scalars())
+    inserted = set()
+    for row in rows:
+        result = db.execute(statement, row)
+        if result.rowcount == 1:
+            inserted.add(result.lastrowid)
+    return inserted
+
 def create_list_items_bulk(db: Session, items: list[schemas.ListItemCreateBulk], list_id: int, user_id: int, family_id: int):
-    new_items = []
+    """
+    Alta masiva en una sola transacción: los productos se resuelven con un único IN
+    sobre los nombres normalizados, los que faltan y los ítems se insertan por lotes
+    (INSERT de varias filas con RETURNING) y los blames con un executemany.
+    """
+    if not items:
+        return []
+
+    # Categoría/marca por nombre: gana el último valor informado, como con get_or_create_product
+    wanted = {}
     for item_data in items:
-        product = get_or_create_product(db, item_data.nombre, family_id, item_data.category, item_data.brand)
-        db_item = models.ListItem(
-            list_id=list_id,
-            product_id=product.id,
-            nombre=item_data.nombre,
-            cantidad=item_data.cantidad,
-            unit=item_data.unit,
-            comentario=item_data.comentario,
-            precio_estimado=item_data.precio_estimado,
-            status='pendiente',
-            creado_por_id=user_id
-        )
-        db.add(db_item)
-        new_items.append(db_item)
-    
-    db.flush()
+        key = models.normalize_product_name(item_data.nombre)
+        category, brand = wanted.get(key, (None, None))
+        wanted[key] = (item_data.category or category, item_data.brand or brand)
 
-    for db_item in new_items:
-        blame_entry = models.Blame(
-            user_id=user_id,
-            action="create",
-            entity_type="item",
-            entity_id=db_item.id,
-            detalles=f"Producto '{db_item.nombre}' agregado a la lista desde una lista anterior."
-        )
-        db.add(blame_entry)
+    def load_products(keys):
+        rows = db.query(models.Product).filter(models.Product.family_id == family_id, models.Product.normalized_name.in_(list(keys)))
+        return {product.normalized_name: product for product in rows}
+
+    products = load_products(wanted)
+
+    # Los que faltan se insertan por lotes sin pasar por el ORM (haría un INSERT por fila).
+    # Si otra petición ha creado el mismo producto entretanto, no se inserta y se relee.
+    now = tz_util.now().replace(microsecond=0, tzinfo=None)
+    missing = {}
+    for item_data in items:
+        key = models.normalize_product_name(item_data.nombre)
+        if key not in products and key not in missing:
+            category, brand = wanted[key]
+            missing[key] = {"name": item_data.nombre.strip(), "normalized_name": key, "family_id": family_id,
+                            "category": category, "brand": brand, "created_at": now, "updated_at": now}
+    added_facets, removed_facets = [], []
+    if missing:
+        inserted_ids = _insert_new_products(db, list(missing.values()))
+        created = load_products(missing)
+        products.update(created)
+        # Solo los insertados aquí suman facetas: los de otra petición ya las sumó ella
+        for product in created.values():
+            if product.id in inserted_ids:
+                added_facets += _product_facets(product.category, product.brand)
+    for key, product in products.items():
+        category, brand = wanted[key]
+        old_facets = _product_facets(product.category, product.brand)
+        if category and product.category != category:
+            product.category = category
+        if brand and product.brand != brand:
+            product.brand = brand
+        new_facets = _product_facets(product.category, product.brand)
+        if new_facets != old_facets:
+            added_facets += new_facets
+            removed_facets += old_facets
+    _apply_product_facets(db, family_id, added=added_facets, removed=removed_facets)
+
+    added = dict.fromkeys(LIST_COUNTERS, 0)
+    item_rows = []
+    for item_data in items:
+        product = products[models.normalize_product_name(item_data.nombre)]
+        item_rows.append({
+            "list_id": list_id,
+            "product_id": product.id,
+            "nombre": item_data.nombre,
+            "cantidad": item_data.cantidad,
+            "unit": item_data.unit,
+            "comentario": item_data.comentario,
+            "precio_estimado": item_data.precio_estimado,
+            "status": 'pendiente',
+            "creado_por_id": user_id,
+            "created_at": now,
+        })
+        for key, value in _item_counters('pendiente', item_data.cantidad, None, product.last_price).items():
+            added[key] += value
+    _apply_list_counters(db, list_id, added=added)
+    version = db.query(models.ShoppingList.version).filter(models.ShoppingList.id == list_id).scalar()
+    for row in item_rows:
+        row["version"] = version
+    item_ids = _insert_returning_ids(db, models.ListItem.__table__, item_rows)
+
+    db.execute(models.Blame.__table__.insert(), [
+        {
+            "user_id": user_id,
+            "action": "create",
+            "entity_type": "item",
+            "entity_id": item_id,
+            "timestamp": now,
+            "detalles": f"Producto '{row['nombre']}' agregado a la lista desde una lista anterior.",
+        }
+        for item_id, row in zip(item_ids, item_rows)
+    ])
+    # Tras el commit los productos quedan expirados: se copian antes para el índice de búsqueda
+    indexed = [index_entry(product) for product in products.values()]
+    db.commit()
+    product_index.upsert_many(indexed)
 
+    loaded = {
+        db_item.id: db_item
+        for db_item in db.query(models.ListItem).options(*_list_item_load_options()).filter(models.ListItem.id.in_(item_ids))
+    }
+    return [loaded[item_id] for item_id in item_ids]
+
+def clone_list_items(db: Session, list_id: int, source_list_id: int, user_id: int,
+                     status: Optional[str] = None, category: Optional[str] = None, item_ids: Optional[list] = None):
+    """
+    Copia los ítems de otra lista con un único INSERT ... SELECT, reutilizando sus
+    product_id. Los ítems copiados quedan pendientes y sin precio confirmado.
+    """
+    source = (
+        select(models.ListItem)
+        .outerjoin(models.Product, models.ListItem.product_id == models.Product.id)
+        .where(models.ListItem.list_id == source_list_id)
+    )
+    if status:
+        source = source.where(models.ListItem.status == status)
+    if category:
+        source = source.where(func.lower(models.Product.category) == category.lower())
+    if item_ids:
+        source = source.where(models.ListItem.id.in_(item_ids))
+
+    # Aportación a los contadores, calculada sobre la misma selección antes de copiar
+    count, estimated = db.execute(
+        source.with_only_columns(
+            func.count(models.ListItem.id),
+            func.coalesce(func.sum(func.coalesce(models.Product.last_price, 0) * func.coalesce(models.ListItem.cantidad, 0)), 0),
+        )
+    ).one()
+    if not count:
+        return {"item_ids": [], "count": 0}
+
+    _apply_list_counters(db, list_id, added={'items_count': count, 'pending_count': count, 'estimated_total': estimated})
+
+    now = tz_util.now().replace(microsecond=0, tzinfo=None)
+    table = models.ListItem.__table__
+    copied = ['product_id', 'nombre', 'cantidad', 'unit', 'comentario', 'precio_estimado', 'shared_image_id']
+    columns = [*copied, 'list_id', 'status', 'creado_por_id', 'created_at', 'version']
+    selection = source.with_only_columns(
+        *[table.c[column] for column in copied],
+        literal(list_id, table.c.list_id.type),
+        literal('pendiente', table.c.status.type),
+        literal(user_id, table.c.creado_por_id.type),
+        literal(now, table.c.created_at.type),
+        _list_version(list_id),
+    ).order_by(models.ListItem.created_at, models.ListItem.id)
+
+    if db.get_bind().dialect.insert_returning:
+        # Los ids salen del propio INSERT: otra copia simultánea a la misma lista no se mezcla
+        new_ids = sorted(db.execute(table.insert().from_select(columns, selection).returning(table.c.id)).scalars())
+    else:
+        # MySQL sin RETURNING: se leen las filas de origen y se insertan con lastrowid
+        new_ids = _insert_returning_ids(db, table, [dict(zip(columns, row)) for row in db.execute(selection)])
+
+    source_name = db.query(models.ShoppingList.name).filter(models.ShoppingList.id == source_list_id).scalar()
+    db.add(models.Blame(
+        user_id=user_id,
+        action="create",
+        entity_type="lista",
+        entity_id=list_id,
+        detalles=f"{count} productos copiados desde la lista '{source_name}'."
+    ))
     db.commit()
-    return new_items
+    return {"item_ids": new_ids, "count": count}
 
 
 def update_item(db: Session, item_id: int, item_update: schemas.ListItemUpdate, user_id: int):
@@ -483,11 +1161,14 @@ def update_item(db: Session, item_id: int, item_update: schemas.ListItemUpdate,
 
     update_data = item_update.model_dump(exclude_unset=True)
     blame_details = []
+    counters_before = _item_counters(db_item.status, db_item.cantidad, db_item.precio_confirmado, db_item.product.last_price if db_item.product else None)
+    repriced_product = None
 
     # shared_image_id handling to enforce global product images
 
     if 'precio_confirmado' in update_data and update_data['precio_confirmado'] is not None:
         if db_item.product:
+            repriced_product = (db_item.product, db_item.product.last_price)
             db_item.product.last_price = update_data['precio_confirmado']
             price_history_entry = models.PriceHistory(
                 product_id=db_item.product.id,
@@ -502,6 +1183,7 @@ def update_item(db: Session, item_id: int, item_update: schemas.ListItemUpdate,
             if db_item.product:
                 db_item.product.shared_image_id = value
                 db.add(db_item.product)
+                touch_product_lists(db, db_item.product.id)
             # Also update item itself if it has the attribute (which it will after models.py fix)
             setattr(db_item, key, value)
             continue
@@ -515,6 +1197,15 @@ def update_item(db: Session, item_id: int, item_update: schemas.ListItemUpdate,
                 blame_details.append(f"'{key}' cambiado de '{original_value}' a '{value}'")
         setattr(db_item, key, value)
 
+    indexed = []
+    if repriced_product is not None:
+        product, old_price = repriced_product
+        _reprice_product_in_lists(db, product.id, old_price, product.last_price)
+        indexed.append(index_entry(product))
+    counters_after = _item_counters(db_item.status, db_item.cantidad, db_item.precio_confirmado, _product_last_price(db, db_item.product_id))
+    _apply_list_counters(db, db_item.list_id, added=counters_after, removed=counters_before)
+    db_item.version = _list_version(db_item.list_id)
+
     if blame_details:
         blame_entry = models.Blame(
             user_id=user_id,
@@ -535,6 +1226,7 @@ def update_item(db: Session, item_id: int, item_update: schemas.ListItemUpdate,
                 create_notification_for_family_members(db, family_id=calendar.family_id, message=message, created_by_id=user_id, link=f"/shopping-list/{shopping_list.id}")
 
     db.commit()
+    product_index.upsert_many(indexed)
     db.refresh(db_item)
     return db_item
 
@@ -542,7 +1234,14 @@ def update_item_status(db: Session, item_id: int, status: str, user_id: int):
     db_item = db.query(models.ListItem).options(joinedload(models.ListItem.product)).filter(models.ListItem.id == item_id).first()
     if db_item:
         original_status = db_item.status
+        last_price = db_item.product.last_price if db_item.product else None
+        _apply_list_counters(
+            db, db_item.list_id,
+            added=_item_counters(status, db_item.cantidad, db_item.precio_confirmado, last_price),
+            removed=_item_counters(original_status, db_item.cantidad, db_item.precio_confirmado, last_price),
+        )
         db_item.status = status
+        db_item.version = _list_version(db_item.list_id)
 
         blame_entry = models.Blame(
             user_id=user_id,
@@ -566,6 +1265,99 @@ def update_item_status(db: Session, item_id: int, status: str, user_id: int):
         db.refresh(db_item)
     return db_item
 
+BATCH_ITEM_FIELDS = ('status', 'cantidad', 'precio_confirmado')
+
+def update_list_items_batch(db: Session, list_id: int, changes: list[schemas.ListItemBatchChange], user_id: int):
+    """
+    Aplica cambios de estado, cantidad y precio a varios ítems de una lista en una
+    sola transacción, con un único blame y una única notificación resumidos.
+    Devuelve (ítems, ids cambiados) o None si algún id no pertenece a la lista.
+    """
+    # Si un id se repite en la cola del cliente, gana el último cambio
+    merged = {}
+    for change in changes:
+        merged.setdefault(change.id, {}).update(change.model_dump(exclude_unset=True, exclude={'id'}))
+    if not merged:
+        return [], []
+
+    db_items = (
+        db.query(models.ListItem)
+        .options(joinedload(models.ListItem.product))
+        .filter(models.ListItem.list_id == list_id, models.ListItem.id.in_(list(merged)))
+        .all()
+    )
+    if len(db_items) != len(merged):
+        return None
+    order = {item_id: position for position, item_id in enumerate(merged)}
+    db_items.sort(key=lambda db_item: order[db_item.id])
+
+    # Los contadores se calculan con los precios previos; el cambio de last_price
+    # lo aplica _reprice_product_in_lists sobre el estado final de los ítems
+    old_prices = {db_item.product_id: db_item.product.last_price if db_item.product else None for db_item in db_items}
+    added = dict.fromkeys(LIST_COUNTERS, 0)
+    removed = dict.fromkeys(LIST_COUNTERS, 0)
+    changed_ids = []
+    details = []
+    repriced = {}
+    for db_item in db_items:
+        last_price = old_prices[db_item.product_id]
+        before = _item_counters(db_item.status, db_item.cantidad, db_item.precio_confirmado, last_price)
+        item_details = []
+        for key, value in merged[db_item.id].items():
+            if key not in BATCH_ITEM_FIELDS or (value is None and key != 'precio_confirmado'):
+                continue
+            original_value = getattr(db_item, key)
+            if original_value == value:
+                continue
+            item_details.append(f"'{key}' de '{original_value}' a '{value}'")
+            setattr(db_item, key, value)
+            if key == 'precio_confirmado' and value is not None and db_item.product:
+                repriced[db_item.product.id] = db_item.product
+                db_item.product.last_price = value
+                db.add(models.PriceHistory(product_id=db_item.product.id, price=value))
+        if not item_details:
+            continue
+        changed_ids.append(db_item.id)
+        details.append(f"'{db_item.nombre}': {', '.join(item_details)}")
+        for key, value in before.items():
+            removed[key] += value
+        for key, value in _item_counters(db_item.status, db_item.cantidad, db_item.precio_confirmado, last_price).items():
+            added[key] += value
+
+    if changed_ids:
+        for product_id, product in repriced.items():
+            _reprice_product_in_lists(db, product_id, old_prices[product_id], product.last_price)
+        _apply_list_counters(db, list_id, added=added, removed=removed)
+        for db_item in db_items:
+            if db_item.id in changed_ids:
+                db_item.version = _list_version(list_id)
+
+        db.add(models.Blame(
+            user_id=user_id,
+            action="update",
+            entity_type="lista",
+            entity_id=list_id,
+            detalles=f"{len(changed_ids)} productos actualizados. " + ". ".join(details)
+        ))
+
+        access = get_list_access(db, list_id)
+        if access and access.family_id is not None:
+            user = db.query(models.User).filter(models.User.id == user_id).first()
+            list_name = db.query(models.ShoppingList.name).filter(models.ShoppingList.id == list_id).scalar()
+            message = f"{user.username} ha actualizado {len(changed_ids)} productos en la lista '{list_name}'."
+            create_notification_for_family_members(db, family_id=access.family_id, message=message, created_by_id=user_id, link=f"/shopping-list/{list_id}")
+
+        indexed = [index_entry(product) for product in repriced.values()]
+        db.commit()
+        product_index.upsert_many(indexed)
+
+    item_ids = [db_item.id for db_item in db_items]
+    loaded = {
+        db_item.id: db_item
+        for db_item in db.query(models.ListItem).options(*_list_item_load_options()).filter(models.ListItem.id.in_(item_ids)).populate_existing()
+    }
+    return [loaded[item_id] for item_id in item_ids], changed_ids
+
 def delete_item(db: Session, item_id: int, user_id: int):
     """
     Elimina un item de la lista de compras, crea notificación y registro de blame.
@@ -611,6 +1403,11 @@ def delete_item(db: Session, item_id: int, user_id: int):
     )
     db.add(blame_entry)
 
+    _apply_list_counters(db, db_item.list_id, removed=_item_counters(
+        db_item.status, db_item.cantidad, db_item.precio_confirmado, db_item.product.last_price if db_item.product else None
+    ))
+    db.add(models.ListItemTombstone(list_id=db_item.list_id, item_id=item_id, version=_list_version(db_item.list_id)))
+
     # Eliminar el item
     db.delete(db_item)
     db.commit()
@@ -687,7 +1484,7 @@ def create_notification_for_family_members(db: Session, family_id: int, message:
                 link=link
             )
             db.add(notification)
-    db.commit()
+    # El commit lo hace quien llama, junto con el resto de su escritura
 
 def get_notifications_by_user(db: Session, user_id: int, skip: int = 0, limit: int = 100):
     query = db.query(models.Notification).filter(models.Notification.user_id == user_id).order_by(models.Notification.created_at.desc())
@@ -740,6 +1537,97 @@ def get_list_filter_options(db: Session, list_id: int):
 
     return {"categories": categories, "brands": brands}
 
+def encode_item_cursor(item: models.ListItem) -> str:
+    payload = json.dumps([item.created_at.isoformat(), item.id])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_item_cursor(cursor: str):
+    """
+    Devuelve (created_at, id) o None si el cursor no es válido.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, item_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(created_at), int(item_id)
+    except (ValueError, TypeError):
+        return None
+
+def get_list_items_page(db: Session, list_id: int, size: int = 10, cursor: Optional[tuple] = None, page: Optional[int] = None,
+                        status: str = None, category: str = None, brand: str = None, search: str = None, include_total: bool = False,
+                        archived: bool = False):
+    """
+    Ítems de una lista, del más reciente al más antiguo, ordenados por (created_at, id)
+    para usar el índice ix_list_items_list_created_id.
+
+    Con `cursor` (el (created_at, id) del último ítem recibido) se pagina por keyset;
+    con `page` se mantiene la paginación por OFFSET, que siempre devuelve el total.
+    Con archived=True lee de list_items_archive.
+    """
+    _, item = _list_models(archived)
+    query = db.query(item).filter(item.list_id == list_id)
+    if status:
+        query = query.filter(item.status == status)
+
+    product_filters = []
+    if category:
+        product_filters.append(func.lower(models.Product.category).like(f"%{category.lower()}%"))
+    if brand:
+        product_filters.append(func.lower(models.Product.brand).like(f"%{brand.lower()}%"))
+    if product_filters:
+        query = query.join(models.Product, models.Product.id == item.product_id).filter(*product_filters)
+
+    if search:
+        query = query.filter(func.lower(item.nombre).like(f"%{search.lower()}%"))
+
+    total = query.order_by(None).count() if include_total or page is not None else None
+
+    if cursor is not None:
+        created_at, item_id = cursor
+        query = query.filter(or_(
+            item.created_at < created_at,
+            and_(item.created_at == created_at, item.id < item_id),
+        ))
+
+    query = query.options(*_list_item_load_options(item)).order_by(item.created_at.desc(), item.id.desc())
+    if page is not None:
+        query = query.offset((page - 1) * size)
+    # Se pide uno de más para saber si hay página siguiente sin contar
+    items = query.limit(size + 1).all()
+    has_more = len(items) > size
+    items = items[:size]
+    next_cursor = encode_item_cursor(items[-1]) if has_more else None
+    return {"items": items, "total": total, "next_cursor": next_cursor}
+
+# Campos editables de la lista (PUT /listas/{id}) que viajan en cada respuesta de cambios
+LIST_CHANGE_FIELDS = ["name", "notas", "comentarios", "status", "budget"]
+
+def get_list_changes(db: Session, list_id: int, since: int):
+    """
+    Ítems creados o modificados y tombstones de los borrados con versión > since,
+    usando los índices (list_id, version). Con since <= 0 o mayor que la versión
+    actual (copia local de otra lista/BD) se devuelve la lista completa con full=True.
+    """
+    db_list = db.query(models.ShoppingList).filter(models.ShoppingList.id == list_id).first()
+    if not db_list:
+        return None
+    # La versión se lee primero: si entra otra escritura, se reenvía en la siguiente sincronización
+    full = since <= 0 or since > db_list.version
+    items = db.query(models.ListItem).options(*_list_item_load_options()).filter(models.ListItem.list_id == list_id)
+    deleted_ids = []
+    if not full:
+        items = items.filter(models.ListItem.version > since)
+        deleted_ids = [row[0] for row in db.query(models.ListItemTombstone.item_id).filter(
+            models.ListItemTombstone.list_id == list_id, models.ListItemTombstone.version > since
+        )]
+    return {
+        "list_id": list_id,
+        "version": db_list.version,
+        "full": full,
+        "items": items.order_by(models.ListItem.id).all(),
+        "deleted_ids": deleted_ids,
+        **{column: getattr(db_list, column) for column in LIST_COUNTERS + LIST_CHANGE_FIELDS},
+    }
+
 def get_image_search_configs(db: Session, active_only: bool = False):
     query = db.query(models.ImageSearchConfig)
     if active_only:
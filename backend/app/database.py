@@ -1,15 +1,191 @@
-
+import math
 import os
-from sqlalchemy import create_engine
+import threading
+import time
+from typing import Dict
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 from .models import *
 from .shared_images import *
 
 DATABASE_URL = os.getenv("DATABASE_URL", "mysql+pymysql://user:password@db/shopping_db")
 
-engine = create_engine(DATABASE_URL)
+# Pool configuration (shared by the sync and async engines)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+# Async path: enabled when DATABASE_URL already names an async driver,
+# or explicitly with DATABASE_ASYNC=true (the async driver is derived from the sync one).
+ASYNC_DRIVERS = {
+    "mysql": "mysql+aiomysql",
+    "mysql+pymysql": "mysql+aiomysql",
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+}
+SYNC_DRIVERS = {
+    "mysql+aiomysql": "mysql+pymysql",
+    "mysql+asyncmy": "mysql+pymysql",
+    "sqlite+aiosqlite": "sqlite",
+}
+
+def _resolve_urls(url: str):
+    parsed = make_url(url)
+    if parsed.drivername in SYNC_DRIVERS:
+        return parsed.set(drivername=SYNC_DRIVERS[parsed.drivername]), parsed
+    if os.getenv("DATABASE_ASYNC", "false").lower() in ("1", "true", "yes") and parsed.drivername in ASYNC_DRIVERS:
+        return parsed, parsed.set(drivername=ASYNC_DRIVERS[parsed.drivername])
+    return parsed, None
+
+def _engine_kwargs(url) -> dict:
+    kwargs = {"pool_pre_ping": DB_POOL_PRE_PING, "pool_recycle": DB_POOL_RECYCLE}
+    # SQLite usa pools sin tamaño configurable
+    if not url.drivername.startswith("sqlite"):
+        kwargs.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW)
+    return kwargs
+
+SYNC_DATABASE_URL, ASYNC_DATABASE_URL = _resolve_urls(DATABASE_URL)
+
+engine = create_engine(SYNC_DATABASE_URL, **_engine_kwargs(SYNC_DATABASE_URL))
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Optional read replica. Without DATABASE_READ_URL reads share the primary.
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL")
+SYNC_DATABASE_READ_URL, ASYNC_DATABASE_READ_URL = _resolve_urls(DATABASE_READ_URL) if DATABASE_READ_URL else (None, None)
+
+read_engine = engine
+ReadSessionLocal = SessionLocal
+if SYNC_DATABASE_READ_URL is not None:
+    read_engine = create_engine(SYNC_DATABASE_READ_URL, **_engine_kwargs(SYNC_DATABASE_READ_URL))
+    ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+async_engine = None
+AsyncSessionLocal = None
+async_read_engine = None
+AsyncReadSessionLocal = None
+if ASYNC_DATABASE_URL is not None:
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+    async_engine = create_async_engine(ASYNC_DATABASE_URL, **_engine_kwargs(ASYNC_DATABASE_URL))
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False)
+
+    async_read_engine = async_engine
+    AsyncReadSessionLocal = AsyncSessionLocal
+    if SYNC_DATABASE_READ_URL is not None:
+        read_url = ASYNC_DATABASE_READ_URL or SYNC_DATABASE_READ_URL.set(drivername=ASYNC_DRIVERS[SYNC_DATABASE_READ_URL.drivername])
+        async_read_engine = create_async_engine(read_url, **_engine_kwargs(read_url))
+        AsyncReadSessionLocal = async_sessionmaker(async_read_engine, autoflush=False)
+
+
+# --- Read-your-writes ---
+# After a user commits, their reads go to the primary for READ_AFTER_WRITE_WINDOW
+# seconds so replication lag never hides their own changes. WriteTracker only sees
+# the writes of its own process; with several workers the window travels in the
+# READ_AFTER_WRITE_COOKIE cookie (expiry as a Unix timestamp) set on write responses.
+# API clients that drop cookies only get the per-worker guarantee.
+READ_AFTER_WRITE_WINDOW = float(os.getenv("READ_AFTER_WRITE_WINDOW", "5"))
+READ_AFTER_WRITE_COOKIE = "read_after_write"
+
+class WriteTracker:
+    def __init__(self, window: float = READ_AFTER_WRITE_WINDOW):
+        self.window = window
+        self._last_write: Dict[int, float] = {}
+        self._lock = threading.Lock()
+
+    def mark(self, user_id: int):
+        now = time.monotonic()
+        with self._lock:
+            self._last_write[user_id] = now
+            # Purga ocasional de entradas vencidas
+            if len(self._last_write) > 10000:
+                self._last_write = {k: v for k, v in self._last_write.items() if now - v < self.window}
+
+    def is_recent(self, user_id: int) -> bool:
+        last = self._last_write.get(user_id)
+        return last is not None and time.monotonic() - last < self.window
+
+write_tracker = WriteTracker()
+
+@event.listens_for(Session, "after_commit")
+def _track_commit(session):
+    # session.info["request"] lo fija la dependencia de escritura; el principal lo fija la autenticación
+    request = session.info.get("request")
+    if request is None:
+        return
+    # ReadAfterWriteMiddleware añade la cookie a la respuesta
+    request.state.read_after_write = True
+    principal = getattr(request.state, "principal", None)
+    if principal is not None:
+        write_tracker.mark(principal.id)
+
+def uses_replica() -> bool:
+    return read_engine is not engine
+
+def read_from_primary(request, user_id: int) -> bool:
+    """
+    True si las lecturas del usuario deben ir al primario: ha escrito hace menos de
+    READ_AFTER_WRITE_WINDOW en este worker o trae la cookie de otro.
+    """
+    if write_tracker.is_recent(user_id):
+        return True
+    try:
+        until = float(request.cookies.get(READ_AFTER_WRITE_COOKIE, 0))
+    except ValueError:
+        return False
+    return until > time.time()
+
+
+class ReadAfterWriteMiddleware:
+    """
+    Middleware ASGI: si la petición ha hecho commit y hay réplica, añade la cookie
+    con el fin de la ventana de lectura en el primario.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not uses_replica():
+            return await self.app(scope, receive, send)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and scope.get("state", {}).get("read_after_write"):
+                from starlette.datastructures import MutableHeaders
+                from starlette.responses import Response
+
+                cookie = Response()
+                cookie.set_cookie(
+                    READ_AFTER_WRITE_COOKIE, f"{time.time() + READ_AFTER_WRITE_WINDOW:.3f}",
+                    max_age=math.ceil(READ_AFTER_WRITE_WINDOW), httponly=True, samesite="lax",
+                )
+                MutableHeaders(scope=message).append("set-cookie", cookie.headers["set-cookie"])
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+
+class ThreadpoolSession:
+    """
+    Fallback con la misma interfaz run_sync que AsyncSession cuando no hay motor async:
+    ejecuta el trabajo sobre una Session síncrona en el threadpool.
+    """
+
+    def __init__(self, session_factory=None):
+        self._session = (session_factory or SessionLocal)()
+
+    @property
+    def info(self):
+        return self._session.info
+
+    async def run_sync(self, fn, *args, **kwargs):
+        from starlette.concurrency import run_in_threadpool
+        return await run_in_threadpool(fn, self._session, *args, **kwargs)
+
+    async def close(self):
+        self._session.close()
+
 Base = declarative_base()
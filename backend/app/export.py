@@ -0,0 +1,125 @@
+import csv
+import io
+import json
+from datetime import date, datetime
+from typing import Iterator, List, Optional, Tuple
+
+from sqlalchemy import select, union_all
+from sqlalchemy.orm import Session
+
+from . import models
+
+# Filas por lote: cada lote es un fetch del cursor de servidor y un trozo de la respuesta
+BATCH_SIZE = 1000
+
+
+def _sections(family_id: int):
+    """
+    Secciones del export en orden. Cada una es (tipo, partes) con partes una lista de
+    (columna id, consulta de columnas): listas e ítems suman las tablas de archivo, que
+    conservan los ids. Siempre se ordena por id para poder reanudar con "tipo:último_id".
+    """
+    product = models.Product
+    price = models.PriceHistory
+    calendar = models.Calendar
+    lists = models.ShoppingList.__table__
+    lists_archive = models.ShoppingListArchive.__table__
+    sections = [
+        ("product", [(product.id, select(
+            product.id, product.name, product.category, product.brand, product.description, product.last_price, product.created_at,
+        ).where(product.family_id == family_id))]),
+        ("price", [(price.id, select(
+            price.id, price.product_id, price.price, price.created_at,
+        ).join(product, product.id == price.product_id).where(product.family_id == family_id))]),
+    ]
+    list_parts, item_parts = [], []
+    for lista, item in ((lists, models.ListItem.__table__), (lists_archive, models.list_items_archive)):
+        family_lists = select(lista.c.id).join(calendar, calendar.id == lista.c.calendar_id).where(calendar.family_id == family_id)
+        list_parts.append((lista.c.id, select(
+            lista.c.id, lista.c.calendar_id, lista.c.name, lista.c.status, lista.c.budget, lista.c.list_for_date,
+            lista.c.notas, lista.c.comentarios, lista.c.created_at,
+        ).where(lista.c.id.in_(family_lists))))
+        item_parts.append((item.c.id, select(
+            item.c.id, item.c.list_id, item.c.product_id, item.c.nombre, item.c.cantidad, item.c.unit, item.c.status,
+            item.c.precio_estimado, item.c.precio_confirmado, item.c.comentario, item.c.created_at,
+        ).where(item.c.list_id.in_(family_lists))))
+    sections.append(("list", list_parts))
+    sections.append(("item", item_parts))
+    return sections
+
+SECTION_TYPES = ["product", "price", "list", "item"]
+
+# Cabecera del CSV: unión de las columnas de todas las secciones, precedida por el tipo
+CSV_COLUMNS = [
+    "type", "id", "list_id", "product_id", "calendar_id", "name", "nombre", "category", "brand", "description",
+    "status", "cantidad", "unit", "price", "last_price", "budget", "precio_estimado", "precio_confirmado",
+    "list_for_date", "notas", "comentarios", "comentario", "created_at",
+]
+
+
+def parse_cursor(cursor: Optional[str]) -> Optional[Tuple[str, int]]:
+    """
+    "item:1234" -> ("item", 1234). Devuelve None si el cursor no es válido.
+    """
+    try:
+        section, last_id = cursor.split(":", 1)
+        last_id = int(last_id)
+    except (AttributeError, ValueError):
+        return None
+    if section not in SECTION_TYPES:
+        return None
+    return section, last_id
+
+
+def iter_batches(db: Session, family_id: int, cursor: Optional[Tuple[str, int]] = None) -> Iterator[List[dict]]:
+    """
+    Recorre las secciones con yield_per (cursor de servidor), de modo que la memoria
+    no depende del tamaño del historial. Cada registro lleva "type" e "id": el último
+    recibido es el cursor de reanudación.
+    """
+    start = SECTION_TYPES.index(cursor[0]) if cursor else 0
+    for position, (record_type, parts) in enumerate(_sections(family_id)):
+        if position < start:
+            continue
+        if cursor and position == start:
+            parts = [(id_column, query.where(id_column > cursor[1])) for id_column, query in parts]
+        if len(parts) == 1:
+            id_column, query = parts[0]
+            query = query.order_by(id_column)
+        else:
+            query = union_all(*[query for _, query in parts])
+            query = query.order_by(query.selected_columns.id)
+        result = db.execute(query.execution_options(yield_per=BATCH_SIZE))
+        for partition in result.mappings().partitions():
+            yield [{"type": record_type, **row} for row in partition]
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+# Un único encoder: json.dumps con argumentos crea uno nuevo por registro
+_encoder = json.JSONEncoder(default=_json_default, ensure_ascii=False)
+
+
+def ndjson_chunks(batches: Iterator[List[dict]]) -> Iterator[str]:
+    encode = _encoder.encode
+    for batch in batches:
+        yield "".join(encode(record) + "\n" for record in batch)
+
+
+def csv_chunks(batches: Iterator[List[dict]], header: bool = True) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=CSV_COLUMNS, extrasaction="ignore")
+    if header:
+        writer.writeheader()
+    for batch in batches:
+        for record in batch:
+            writer.writerow({key: value.isoformat() if isinstance(value, (datetime, date)) else value for key, value in record.items()})
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
@@ -1,30 +1,39 @@
+import time
+_IMPORT_STARTED = time.perf_counter()
+
 from datetime import date, timedelta, datetime
 from typing import List, Optional
-import time
+import asyncio
 import os
 import random
 import string
 
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func
-from sqlalchemy.exc import OperationalError
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from .schemas import ListItem as ListItemSchema
 
-from fastapi import Depends, FastAPI, HTTPException, status, Body, UploadFile, File, BackgroundTasks, WebSocket, WebSocketDisconnect, Response, Request
+from fastapi import Depends, FastAPI, HTTPException, status, Body, UploadFile, File, BackgroundTasks, WebSocket, WebSocketDisconnect, Response, Request, Query
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import StreamingResponse
 
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordRequestForm
 from jose import JWTError, jwt
 
 from . import crud, models, schemas, security, tz_util, shared_images
-from .database import SessionLocal, engine
+from .database import SessionLocal, ReadSessionLocal, AsyncSessionLocal, AsyncReadSessionLocal, ThreadpoolSession, engine, read_engine, async_engine, async_read_engine, read_from_primary, ReadAfterWriteMiddleware
 from .websockets import manager
-import httpx
+from .auth_cache import Principal, principal_cache
+from .product_index import product_index
+from .startup import StartupTimer, run_startup
+from . import query_stats, metrics, export
 
 app = FastAPI()
 
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# El directorio se crea en el arranque (shared_images.ensure_images_dir)
+app.mount("/static", StaticFiles(directory="static", check_dir=False), name="static")
 
 # CORS Middleware
 frontend_url = os.getenv("FRONTEND_URL", "*")
@@ -36,36 +45,89 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
+# SQL statement counting / N+1 detection (SQL_DEBUG=true, or per request with X-Count-Queries when QUERY_STATS_OPT_IN=true)
+for _engine in {engine, read_engine}:
+    query_stats.install(_engine)
+for _engine in {async_engine, async_read_engine} - {None}:
+    query_stats.install(_engine.sync_engine)
+
+@app.middleware("http")
+async def sql_stats_middleware(request: Request, call_next):
+    if not query_stats.wanted(request.headers):
+        return await call_next(request)
+    stats, token = query_stats.start()
+    try:
+        response = await call_next(request)
+    finally:
+        query_stats.stop(token)
+    query_stats.apply_headers(response, stats, request.url.path)
+    return response
+
+# Read-your-writes entre workers: cookie con el fin de la ventana tras cada commit
+app.add_middleware(ReadAfterWriteMiddleware)
+
+# Prometheus metrics (/metrics)
+app.add_middleware(metrics.MetricsMiddleware)
+_metric_engines = {"primary": engine}
+if read_engine is not engine:
+    _metric_engines["replica"] = read_engine
+if async_engine is not None:
+    _metric_engines["primary_async"] = async_engine.sync_engine
+if async_read_engine is not None and async_read_engine is not async_engine:
+    _metric_engines["replica_async"] = async_read_engine.sync_engine
+metrics.register_runtime_collector(_metric_engines, manager)
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    content, content_type = metrics.render()
+    return Response(content=content, media_type=content_type)
+
+startup_timer = StartupTimer(_IMPORT_STARTED)
+startup_timer.mark("imports")
+
 @app.on_event("startup")
-def on_startup():
-    max_retries = 10
-    retries = 0
-    while retries < max_retries:
-        try:
-            models.Base.metadata.create_all(bind=engine)
-            print("Database tables created.")
-            break
-        except OperationalError as e:
-            print(f"Database connection failed: {e}")
-            retries += 1
-            print(f"Retrying connection ({retries}/{max_retries})...")
-            time.sleep(5)
-    if retries == max_retries:
-        print("Could not connect to the database. Exiting.")
-        exit(1)
-
-def get_db():
+async def on_startup():
+    # run_startup registra los tiempos con logger.info (logger app.startup)
+    app.state.startup_report = await run_startup(engine, startup_timer, prepare=shared_images.ensure_images_dir)
+    # Revocaciones de la cache de principals publicadas por otros workers
+    await run_in_threadpool(principal_cache.sync)
+    app.state.principal_cache_sync = asyncio.create_task(principal_cache.sync_forever())
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    app.state.principal_cache_sync.cancel()
+    # Sin réplica async_read_engine es el mismo motor: cada pool se cierra una vez
+    for _engine in {async_engine, async_read_engine} - {None}:
+        await _engine.dispose()
+    security.password_hasher.shutdown()
+    metrics.mark_process_dead()
+
+def get_db(request: Request):
     db = SessionLocal()
+    db.info["request"] = request
     try:
         yield db
     finally:
         db.close()
 
+async def get_async_db(request: Request):
+    if AsyncSessionLocal is None:
+        db = ThreadpoolSession()
+        db.info["request"] = request
+        try:
+            yield db
+        finally:
+            await db.close()
+        return
+    async with AsyncSessionLocal() as db:
+        db.info["request"] = request
+        yield db
+
 @app.get("/status")
 def get_status(db: Session = Depends(get_db)):
     return {"needs_setup": db.query(models.User).count() == 0}
 
-def get_current_user(db: Session = Depends(get_db), request: Request = None):
+async def get_current_principal(db: AsyncSession = Depends(get_async_db), request: Request = None) -> Principal:
     token = None
     
     # Check Authorization header first (legacy/API support)
@@ -94,25 +156,129 @@ def get_current_user(db: Session = Depends(get_db), request: Request = None):
         token_data = schemas.TokenData(username=username)
     except JWTError:
         raise credentials_exception
-        
-    user = crud.get_user_by_username(db, username=token_data.username)
-    if user is None:
+
+    # La sesión no abre conexión hasta la primera consulta: un hit no toca la base de datos
+    principal = principal_cache.get(token_data.username)
+    if principal is not None:
+        request.state.principal = principal
+        return principal
+
+    def load(session: Session):
+        user = crud.get_user_by_username(session, username=token_data.username)
+        if user is None:
+            return None
+        return principal_cache.put(token_data.username, user)
+
+    principal = await db.run_sync(load)
+    if principal is None:
         raise credentials_exception
+    request.state.principal = principal
+    return principal
+
+# --- Read sessions (replica, with read-your-writes stickiness) ---
+def get_read_db(request: Request, current_user: Principal = Depends(get_current_principal)):
+    session_factory = SessionLocal if read_from_primary(request, current_user.id) else ReadSessionLocal
+    db = session_factory()
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_async_read_db(request: Request, current_user: Principal = Depends(get_current_principal)):
+    sticky = read_from_primary(request, current_user.id)
+    if AsyncSessionLocal is None:
+        db = ThreadpoolSession(SessionLocal if sticky else ReadSessionLocal)
+        try:
+            yield db
+        finally:
+            await db.close()
+        return
+    async with (AsyncSessionLocal if sticky else AsyncReadSessionLocal)() as db:
+        yield db
+
+def get_current_user(db: Session = Depends(get_db), principal: Principal = Depends(get_current_principal)):
+    user = db.get(models.User, principal.id)
+    if user is None:
+        principal_cache.invalidate_user(principal.id)
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     return user
 
-def get_current_admin_user(current_user: models.User = Depends(get_current_user)):
+def get_current_admin_user(current_user: Principal = Depends(get_current_principal)):
     if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="The user doesn't have enough privileges")
     return current_user
 
 # --- Helper for family authorization ---
-def get_family_for_user(family_id: int, user: models.User):
-    for family in user.families:
-        if family.id == family_id:
-            return family
-    raise HTTPException(status_code=403, detail="User does not belong to this family")
-
-def get_family_owner(family_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def get_family_for_user(family_id: int, user: Principal):
+    if family_id not in user.family_ids:
+        raise HTTPException(status_code=403, detail="User does not belong to this family")
+    return family_id
+
+# --- Helpers for list authorization ---
+def authorize_list_access(access, current_user: Principal, forbidden_detail: str = "No tienes permisos para ver esta lista"):
+    if access.calendar_id is not None:
+        get_family_for_user(access.family_id, current_user)
+    elif access.owner_id != current_user.id:
+        raise HTTPException(status_code=403, detail=forbidden_detail)
+    return access
+
+def check_list_access(db: Session, list_id: int, current_user: Principal, forbidden_detail: str = "No tienes permisos para ver esta lista", not_found_detail: str = "Lista no encontrada"):
+    access = crud.get_list_access(db, list_id=list_id)
+    if not access:
+        raise HTTPException(status_code=404, detail=not_found_detail)
+    return authorize_list_access(access, current_user, forbidden_detail)
+
+def check_list_read_access(db: Session, list_id: int, current_user: Principal, forbidden_detail: str = "No tienes permisos para ver esta lista"):
+    """
+    Como check_list_access, pero si la lista no está en shopping_lists se busca en el
+    archivo (solo lectura). Devuelve (access, archived).
+    """
+    access = crud.get_list_access(db, list_id=list_id)
+    archived = access is None
+    if archived:
+        access = crud.get_list_access(db, list_id=list_id, archived=True)
+    if not access:
+        raise HTTPException(status_code=404, detail="Lista no encontrada")
+    return authorize_list_access(access, current_user, forbidden_detail), archived
+
+def check_item_access(db: Session, item_id: int, current_user: Principal, forbidden_detail: str = "Not enough permissions", not_found_detail: str = "Item not found", list_not_found_detail: str = "Shopping list not found for this item"):
+    access = crud.get_item_access(db, item_id=item_id)
+    if not access:
+        raise HTTPException(status_code=404, detail=not_found_detail)
+    if access.list_id is None:
+        raise HTTPException(status_code=404, detail=list_not_found_detail)
+    return authorize_list_access(access, current_user, forbidden_detail)
+
+# --- ETag de las lecturas de una lista ---
+# private + no-cache: el navegador guarda la respuesta pero revalida siempre con If-None-Match
+LIST_CACHE_CONTROL = "private, no-cache"
+
+def list_etag(access) -> str:
+    # access sale de crud.get_list_access: la versión se lee con la comprobación de permisos
+    return f'"lista-{access.list_id}-v{access.version}"'
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or etag in [tag[2:] if tag.startswith("W/") else tag for tag in tags]
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag, "Cache-Control": LIST_CACHE_CONTROL})
+
+def set_etag(response: Response, etag: str):
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = LIST_CACHE_CONTROL
+
+def get_list_access(lista_id: int, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_principal)):
+    return check_list_access(db, lista_id, current_user)
+
+def get_family_owner(family_id: int, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_principal)):
     family = db.query(models.Family).filter(models.Family.id == family_id).first()
     if not family:
         raise HTTPException(status_code=404, detail="Family not found")
@@ -136,6 +302,7 @@ async def remove_family_member(
 
     family.users.remove(user_to_remove)
     db.commit()
+    principal_cache.invalidate_user(user_id)
     db.refresh(family)
     return family
 
@@ -153,16 +320,35 @@ async def transfer_family_ownership(
     updated_family = crud.transfer_ownership(db, family, request.new_owner_id)
     return updated_family
 
+DUPLICATE_PRODUCT_DETAIL = "A product with this name already exists in this family"
+
+def _save_product(db: Session, save):
+    """
+    La comprobación previa con find_product_by_name no cubre una inserción concurrente
+    del mismo nombre: el índice único la rechaza y se responde el mismo 409.
+    """
+    try:
+        return save()
+    except IntegrityError as e:
+        db.rollback()
+        if "normalized_name" not in str(e.orig):
+            raise
+        raise HTTPException(status_code=409, detail=DUPLICATE_PRODUCT_DETAIL)
+
 @app.post("/families/{family_id}/products", response_model=schemas.Product, dependencies=[Depends(get_family_owner)])
 def create_product_for_family(family_id: int, product: schemas.ProductCreate, db: Session = Depends(get_db)):
-    return crud.create_family_product(db=db, product=product, family_id=family_id)
+    if crud.find_product_by_name(db, family_id, product.name):
+        raise HTTPException(status_code=409, detail=DUPLICATE_PRODUCT_DETAIL)
+    return _save_product(db, lambda: crud.create_family_product(db=db, product=product, family_id=family_id))
 
 @app.put("/families/{family_id}/products/{product_id}", response_model=schemas.Product, dependencies=[Depends(get_family_owner)])
 def update_product_for_family(family_id: int, product_id: int, product: schemas.ProductCreate, db: Session = Depends(get_db)):
     db_product = crud.get_product(db, product_id)
     if not db_product or db_product.family_id != family_id:
         raise HTTPException(status_code=404, detail="Product not found in this family")
-    return crud.update_family_product(db=db, product_id=product_id, product_update=product)
+    if crud.find_product_by_name(db, family_id, product.name, exclude_id=product_id):
+        raise HTTPException(status_code=409, detail=DUPLICATE_PRODUCT_DETAIL)
+    return _save_product(db, lambda: crud.update_family_product(db=db, product_id=product_id, product_update=product))
 
 @app.delete("/families/{family_id}/products/{product_id}", response_model=schemas.Product, dependencies=[Depends(get_family_owner)])
 def delete_product_for_family(family_id: int, product_id: int, db: Session = Depends(get_db)):
@@ -176,30 +362,30 @@ def update_product(
     product_id: int, 
     product: schemas.ProductCreate, 
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     db_product = crud.get_product(db, product_id)
     if not db_product:
         raise HTTPException(status_code=404, detail="Product not found")
     
-    family = crud.get_family(db, db_product.family_id)
-    if not family or current_user not in family.users:
+    if db_product.family_id not in current_user.family_ids:
         raise HTTPException(status_code=403, detail="Not enough permissions")
+    if crud.find_product_by_name(db, db_product.family_id, product.name, exclude_id=product_id):
+        raise HTTPException(status_code=409, detail=DUPLICATE_PRODUCT_DETAIL)
         
-    return crud.update_family_product(db=db, product_id=product_id, product_update=product)
+    return _save_product(db, lambda: crud.update_family_product(db=db, product_id=product_id, product_update=product))
 
 @app.delete("/products/{product_id}")
 def delete_product(
     product_id: int,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     db_product = crud.get_product(db, product_id)
     if not db_product:
         raise HTTPException(status_code=404, detail="Product not found")
         
-    family = crud.get_family(db, db_product.family_id)
-    if not family or current_user not in family.users:
+    if db_product.family_id not in current_user.family_ids:
         raise HTTPException(status_code=403, detail="Not enough permissions")
         
     crud.safe_delete_product(db, product_id)
@@ -209,7 +395,7 @@ def delete_product(
 def get_product_price_history(
     product_id: int,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     db_product = crud.get_product(db, product_id=product_id)
     if not db_product:
@@ -255,9 +441,18 @@ def setup_inicial(payload: schemas.SetupRequest, db: Session = Depends(get_db)):
     return {"family": fam, "admin": admin}
 
 @app.post("/token", response_model=schemas.Token)
-def login_for_access_token(response: Response, form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = crud.authenticate_user(db, username=form_data.username, password=form_data.password)
-    if not user:
+async def login_for_access_token(response: Response, form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
+    started = time.perf_counter()
+    user = await db.run_sync(crud.get_user_by_username, username=form_data.username)
+    valid = False
+    if user:
+        # bcrypt corre en el executor dedicado; un cambio de coste regenera el hash
+        valid, new_hash = await security.verify_password_async(form_data.password, user.hashed_password)
+        if valid and new_hash:
+            await db.run_sync(crud.set_password_hash, user, new_hash)
+            security.password_hasher.record_rehash()
+    security.password_hasher.record_login(time.perf_counter() - started, valid)
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -287,23 +482,28 @@ def logout(response: Response):
     return {"message": "Logged out"}
 
 @app.post("/users/register", response_model=schemas.User)
-def register_user(payload: schemas.UserRegister, db: Session = Depends(get_db)):
-    db_user = crud.get_user_by_email(db, email=payload.user.email)
+async def register_user(payload: schemas.UserRegister, db: AsyncSession = Depends(get_async_db)):
+    db_user = await db.run_sync(crud.get_user_by_email, email=payload.user.email)
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
-    
-    new_user = crud.create_user(db=db, user=payload.user)
-
-    if payload.family_code:
-        family = db.query(models.Family).filter(models.Family.code == payload.family_code).first()
-        if family:
-            if new_user not in family.users:
-                family.users.append(new_user)
-                db.commit()
-        else:
-            pass
-            
-    return new_user
+
+    hashed_password = await security.get_password_hash_async(payload.user.password)
+
+    def create(session: Session):
+        new_user = crud.create_user(db=session, user=payload.user, hashed_password=hashed_password)
+
+        if payload.family_code:
+            family = session.query(models.Family).filter(models.Family.code == payload.family_code).first()
+            if family:
+                if new_user not in family.users:
+                    family.users.append(new_user)
+                    session.commit()
+            else:
+                pass
+
+        return schemas.User.model_validate(new_user)
+
+    return await db.run_sync(create)
 
 
 @app.get("/users/me", response_model=schemas.User)
@@ -317,26 +517,40 @@ def update_current_user(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
-    return crud.update_me(db=db, user=current_user, user_update=user_update)
+    updated_user = crud.update_me(db=db, user=current_user, user_update=user_update)
+    principal_cache.invalidate_user(updated_user.id)
+    return updated_user
 
 @app.post("/users/me/change-password", response_model=schemas.User)
-def change_current_user_password(
+async def change_current_user_password(
     password_change: schemas.PasswordChange,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
-    if not security.verify_password(password_change.current_password, current_user.hashed_password):
+    user = await db.run_sync(crud.get_user, user_id=current_user.id)
+    valid, _ = await security.verify_password_async(password_change.current_password, user.hashed_password)
+    if not valid:
         raise HTTPException(status_code=400, detail="Incorrect current password")
-    return crud.change_password(db=db, user=current_user, new_password=password_change.new_password)
+    hashed_password = await security.get_password_hash_async(password_change.new_password)
+
+    def save(session: Session):
+        return schemas.User.model_validate(crud.set_password_hash(session, user, hashed_password))
+
+    return await db.run_sync(save)
 
 
 # --- ADMIN: USER MANAGEMENT ---
 @app.post("/admin/users", response_model=schemas.User, dependencies=[Depends(get_current_admin_user)])
-def admin_create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    db_user = crud.get_user_by_email(db, email=user.email)
+async def admin_create_user(user: schemas.UserCreate, db: AsyncSession = Depends(get_async_db)):
+    db_user = await db.run_sync(crud.get_user_by_email, email=user.email)
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
-    return crud.create_user(db=db, user=user)
+    hashed_password = await security.get_password_hash_async(user.password)
+
+    def create(session: Session):
+        return schemas.User.model_validate(crud.create_user(db=session, user=user, hashed_password=hashed_password))
+
+    return await db.run_sync(create)
 
 @app.get("/admin/users", response_model=List[schemas.User], dependencies=[Depends(get_current_admin_user)])
 def admin_get_all_users(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
@@ -354,6 +568,7 @@ def admin_update_user(user_id: int, user: schemas.UserUpdateByAdmin, db: Session
     db_user = crud.update_user(db, user_id=user_id, user_update=user)
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
+    principal_cache.invalidate_user(user_id)
     return db_user
 
 @app.delete("/admin/users/{user_id}", response_model=schemas.User, dependencies=[Depends(get_current_admin_user)])
@@ -361,6 +576,7 @@ def admin_delete_user(user_id: int, db: Session = Depends(get_db)):
     db_user = crud.delete_user(db, user_id=user_id)
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
+    principal_cache.invalidate_user(user_id)
     return db_user
 
 
@@ -379,6 +595,7 @@ def admin_add_family_member(family_id: int, user_id: int, db: Session = Depends(
 
     family.users.append(user)
     db.commit()
+    principal_cache.invalidate_user(user_id)
     db.refresh(family)
     return family
 
@@ -399,8 +616,26 @@ def admin_remove_family_member(family_id: int, user_id: int, db: Session = Depen
 
     family.users.remove(user)
     db.commit()
+    principal_cache.invalidate_user(user_id)
     db.refresh(family)
     return family
+
+@app.get("/admin/cache/principals", dependencies=[Depends(get_current_admin_user)])
+def admin_get_principal_cache_stats():
+    return principal_cache.stats()
+
+@app.get("/admin/cache/products", dependencies=[Depends(get_current_admin_user)])
+def admin_get_product_index_stats():
+    return product_index.stats()
+
+@app.get("/admin/auth-stats", dependencies=[Depends(get_current_admin_user)])
+def admin_get_auth_stats():
+    return security.password_hasher.stats()
+
+@app.get("/admin/startup", dependencies=[Depends(get_current_admin_user)])
+def admin_get_startup_report():
+    return getattr(app.state, "startup_report", None)
+
 @app.get("/admin/families", response_model=List[schemas.FamilyWithDetails], dependencies=[Depends(get_current_admin_user)])
 def admin_get_all_families(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
     return crud.get_families(db, skip=skip, limit=limit)
@@ -444,6 +679,8 @@ def admin_delete_family(family_id: int, db: Session = Depends(get_db)):
     db_family = crud.delete_family(db, family_id=family_id)
     if db_family is None:
         raise HTTPException(status_code=404, detail="Family not found")
+    # Borrado poco frecuente: más simple vaciar la cache que localizar a cada miembro
+    principal_cache.clear()
     return db_family
 @app.get("/families/{family_id}/products", response_model=schemas.Page[schemas.Product])
 def get_products_for_family(
@@ -452,43 +689,71 @@ def get_products_for_family(
     size: int = 10,
     category: str = None,
     brand: str = None,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    db: Session = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
     get_family_for_user(family_id, current_user)
     result = crud.get_products_by_family(db=db, family_id=family_id, skip=(page - 1) * size, limit=size, category=category, brand=brand)
     return schemas.Page(items=result["items"], total=result["total"], page=page, size=size)
 
+@app.get("/families/{family_id}/products/suggest", response_model=List[schemas.ProductSuggestion])
+def suggest_products_for_family(
+    family_id: int,
+    prefix: str,
+    limit: int = Query(10, ge=1, le=50),
+    db: Session = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_principal)
+):
+    # Se llama en cada pulsación: sale del índice en memoria, sin consultas si está al día
+    get_family_for_user(family_id, current_user)
+    return product_index.suggest(db, family_id, prefix, limit)
+
+def _facet_family_id(family_id: str, current_user: Principal):
+    # "all" solo para administradores: None agrega las facetas de todas las familias
+    if family_id == 'all':
+        if not current_user.is_admin:
+            raise HTTPException(status_code=403, detail="Not enough permissions")
+        return None
+    try:
+        fam_id_int = int(family_id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Family not found")
+    get_family_for_user(fam_id_int, current_user)
+    return fam_id_int
+
+@app.get("/families/{family_id}/facets", response_model=schemas.ProductFacets)
+def get_facets_for_family(
+    family_id: str,
+    prefix: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    db: Session = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_principal)
+):
+    fam_id = _facet_family_id(family_id, current_user)
+    return crud.get_product_facets(db, fam_id, prefix=prefix, limit=limit)
+
 @app.get("/families/{family_id}/filters")
 def get_filters_for_family(
     family_id: str,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    db: Session = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
     # This endpoint is accessed by both regular users and admins
     # If family_id is "all", we only proceed if user is admin
-    if family_id == 'all':
-        if not current_user.is_admin:
-            raise HTTPException(status_code=403, detail="Not enough permissions")
-        products = db.query(models.Product).all()
-    else:
-        fam_id_int = int(family_id)
-        get_family_for_user(fam_id_int, current_user)
-        products = db.query(models.Product).filter(models.Product.family_id == fam_id_int).all()
-        
-    categories = list(set([p.category for p in products if p.category]))
-    brands = list(set([p.brand for p in products if p.brand]))
-    
-    return {"categories": categories, "brands": brands}
+    facets = crud.get_product_facets(db, _facet_family_id(family_id, current_user))
+    return {
+        "categories": [facet["value"] for facet in facets["categories"]],
+        "brands": [facet["value"] for facet in facets["brands"]],
+    }
 
 @app.get("/products/search", response_model=schemas.Page[schemas.Product])
-def search_products_endpoint(q: str, family_id: int, page: int = 1, size: int = 10, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def search_products_endpoint(q: str, family_id: int, page: int = 1, size: int = 10, db: Session = Depends(get_read_db), current_user: Principal = Depends(get_current_principal)):
     get_family_for_user(family_id, current_user)
     result = crud.search_products(db=db, name=q, family_id=family_id, skip=(page - 1) * size, limit=size)
     return schemas.Page(items=result["items"], total=result["total"], page=page, size=size)
 
 @app.get("/images/gallery", response_model=List[schemas.SharedImage])
-def get_image_gallery(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def get_image_gallery(db: Session = Depends(get_db), current_user: Principal = Depends(get_current_principal)):
     return shared_images.get_shared_images(db=db)
 
 
@@ -497,7 +762,7 @@ async def upload_product_image(
     product_id: int,
     file: UploadFile = File(...),
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     db_product = db.query(models.Product).filter(models.Product.id == product_id).first()
     if not db_product:
@@ -514,6 +779,7 @@ async def upload_product_image(
 
         # Update product shared_image_id
         db_product.shared_image_id = shared_image.id
+        crud.touch_product_lists(db, db_product.id)
         db.commit()
         db.refresh(db_product)
         return db_product
@@ -537,6 +803,7 @@ def create_family(family_data: schemas.FamilyCreate, db: Session = Depends(get_d
     new_family.users.append(current_user)
     db.add(new_family)
     db.commit()
+    principal_cache.invalidate_user(current_user.id)
     db.refresh(new_family)
     return new_family
 
@@ -551,6 +818,7 @@ def join_family(join_data: schemas.FamilyJoin, db: Session = Depends(get_db), cu
 
     family.users.append(current_user)
     db.commit()
+    principal_cache.invalidate_user(current_user.id)
     db.refresh(family)
     return family
 
@@ -561,7 +829,7 @@ def get_my_families(db: Session = Depends(get_db), current_user: models.User = D
     return current_user.families
 
 @app.get("/families/{family_id}", response_model=schemas.FamilyWithDetails)
-def get_family_details(family_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def get_family_details(family_id: int, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_principal)):
     family = db.query(models.Family).options(joinedload(models.Family.users), joinedload(models.Family.owner)).filter(models.Family.id == family_id).first()
     if not family:
         raise HTTPException(status_code=404, detail="Family not found")
@@ -574,7 +842,7 @@ def get_family_details(family_id: int, db: Session = Depends(get_db), current_us
 
 # --- CALENDAR ENDPOINTS ---
 @app.post("/families/{family_id}/calendars", response_model=schemas.Calendar)
-def create_calendar_for_family(family_id: int, calendar_data: schemas.CalendarCreate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def create_calendar_for_family(family_id: int, calendar_data: schemas.CalendarCreate, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_principal)):
     get_family_for_user(family_id, current_user)
     
     new_calendar = models.Calendar(
@@ -588,7 +856,7 @@ def create_calendar_for_family(family_id: int, calendar_data: schemas.CalendarCr
     return new_calendar
 
 @app.get("/families/{family_id}/calendars", response_model=List[schemas.Calendar])
-def get_calendars_for_family(family_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def get_calendars_for_family(family_id: int, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_principal)):
     get_family_for_user(family_id, current_user)
     return db.query(models.Calendar).filter(models.Calendar.family_id == family_id).all()
 
@@ -600,37 +868,76 @@ def get_previous_lists_for_family(
     start_date: date = None,
     end_date: date = None,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     get_family_for_user(family_id, current_user)
     result = crud.get_lists_by_family(db=db, family_id=family_id, skip=(page - 1) * size, limit=size, start_date=start_date, end_date=end_date)
     return schemas.Page(items=result["items"], total=result["total"], page=page, size=size)
 
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+@app.get("/families/{family_id}/export")
+def export_family_history(
+    family_id: int,
+    request: Request,
+    export_format: str = Query("ndjson", alias="format"),
+    cursor: Optional[str] = None,
+    current_user: Principal = Depends(get_current_principal)
+):
+    """
+    Historial completo de la familia (productos, precios, listas e ítems) en streaming.
+    Cada registro lleva "type" e "id"; si la descarga se corta se reanuda con
+    cursor=<type>:<id> del último registro recibido (en CSV, sin repetir la cabecera).
+    """
+    get_family_for_user(family_id, current_user)
+    if export_format not in EXPORT_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="Formato no soportado: usa ndjson o csv")
+    resume = None
+    if cursor:
+        resume = export.parse_cursor(cursor)
+        if resume is None:
+            raise HTTPException(status_code=400, detail="Cursor inválido")
+    session_factory = SessionLocal if read_from_primary(request, current_user.id) else ReadSessionLocal
+
+    def stream():
+        # Sesión propia: la respuesta se genera después de cerrar las dependencias
+        db = session_factory()
+        try:
+            batches = export.iter_batches(db, family_id, resume)
+            if export_format == "csv":
+                yield from export.csv_chunks(batches, header=resume is None)
+            else:
+                yield from export.ndjson_chunks(batches)
+        finally:
+            db.close()
+
+    return StreamingResponse(
+        stream(),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="familia-{family_id}.{export_format}"'},
+    )
+
 # --- SHOPPING LIST & ITEMS ---
 @app.post("/items/", response_model=schemas.ListItem)
-def create_item_for_list(
+async def create_item_for_list(
     item: schemas.ListItemCreate,
     background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
-    shopping_list = crud.get_list(db, list_id=item.list_id)
-    if not shopping_list:
-        raise HTTPException(status_code=404, detail="Shopping list not found")
-
-    family_id = None
-    if shopping_list.calendar:
-        get_family_for_user(shopping_list.calendar.family_id, current_user)
-        family_id = shopping_list.calendar.family_id
-    elif shopping_list.owner_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not enough permissions")
-    
-    if not family_id:
-        if not current_user.families:
-            raise HTTPException(status_code=400, detail="User does not belong to any family.")
-        family_id = current_user.families[0].id
+    def create(session: Session):
+        access = check_list_access(session, item.list_id, current_user, forbidden_detail="Not enough permissions", not_found_detail="Shopping list not found")
+
+        family_id = access.family_id if access.calendar_id is not None else None
+        if not family_id:
+            if current_user.default_family_id is None:
+                raise HTTPException(status_code=400, detail="User does not belong to any family.")
+            family_id = current_user.default_family_id
+
+        new_item = crud.create_list_item(db=session, item=item, user_id=current_user.id, family_id=family_id)
+        return family_id, schemas.ListItem.model_validate(new_item)
 
-    new_item = crud.create_list_item(db=db, item=item, user_id=current_user.id, family_id=family_id)
+    family_id, new_item = await db.run_sync(create)
     background_tasks.add_task(
         manager.broadcast_to_family, 
         family_id, 
@@ -639,57 +946,86 @@ def create_item_for_list(
     return new_item
 
 @app.post("/listas/{list_id}/items/bulk", response_model=List[schemas.ListItem])
-def create_bulk_items_for_list(
+async def create_bulk_items_for_list(
     list_id: int,
     items: schemas.ListItemsBulkCreate,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
-    shopping_list = crud.get_list(db, list_id=list_id)
-    if not shopping_list:
-        raise HTTPException(status_code=404, detail="Shopping list not found")
-
-    family_id = None
-    if shopping_list.calendar:
-        get_family_for_user(shopping_list.calendar.family_id, current_user)
-        family_id = shopping_list.calendar.family_id
-    elif shopping_list.owner_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not enough permissions")
-    
-    if not family_id:
-        if not current_user.families:
-            raise HTTPException(status_code=400, detail="User does not belong to any family.")
-        family_id = current_user.families[0].id
+    def create(session: Session):
+        access = check_list_access(session, list_id, current_user, forbidden_detail="Not enough permissions", not_found_detail="Shopping list not found")
 
-    return crud.create_list_items_bulk(db=db, items=items.items, list_id=list_id, user_id=current_user.id, family_id=family_id)
+        family_id = access.family_id if access.calendar_id is not None else None
+        if not family_id:
+            if current_user.default_family_id is None:
+                raise HTTPException(status_code=400, detail="User does not belong to any family.")
+            family_id = current_user.default_family_id
+
+        new_items = crud.create_list_items_bulk(db=session, items=items.items, list_id=list_id, user_id=current_user.id, family_id=family_id)
+        return [schemas.ListItem.model_validate(i) for i in new_items]
+
+    return await db.run_sync(create)
+
+@app.post("/listas/{list_id}/clone-from/{source_id}", response_model=schemas.ListCloneResult)
+async def clone_items_from_list(
+    list_id: int,
+    source_id: int,
+    background_tasks: BackgroundTasks,
+    status: Optional[str] = None,
+    category: Optional[str] = None,
+    item_ids: Optional[List[int]] = Query(None),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
+):
+    """
+    "Repetir la lista anterior": copia en el servidor los ítems de source_id
+    (opcionalmente filtrados por estado, categoría o ids) sin reenviar el payload.
+    """
+    if list_id == source_id:
+        raise HTTPException(status_code=400, detail="La lista de origen y destino no pueden ser la misma")
+
+    def clone(session: Session):
+        access = check_list_access(session, list_id, current_user, forbidden_detail="Not enough permissions")
+        source_access = check_list_access(session, source_id, current_user)
+        # Los ítems copiados conservan product_id: deben quedar en el catálogo de la misma familia
+        if source_access.family_id != access.family_id:
+            raise HTTPException(status_code=400, detail="La lista de origen pertenece a otra familia")
+        result = crud.clone_list_items(
+            db=session, list_id=list_id, source_list_id=source_id, user_id=current_user.id,
+            status=status, category=category, item_ids=item_ids,
+        )
+        family_id = access.family_id if access.calendar_id is not None else current_user.default_family_id
+        return family_id, result
+
+    family_id, result = await db.run_sync(clone)
+    if family_id and result["count"]:
+        background_tasks.add_task(
+            manager.broadcast_to_family,
+            family_id,
+            {"action": "ITEMS_CREATED", "list_id": list_id, "item_ids": result["item_ids"]}
+        )
+    return result
 
 
 @app.put("/items/{item_id}", response_model=schemas.ListItem)
-def update_item_endpoint(
+async def update_item_endpoint(
     item_id: int,
     item_update: schemas.ListItemUpdate,
     background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
-    db_item = crud.get_item(db, item_id=item_id)
-    if not db_item:
-        raise HTTPException(status_code=404, detail="Item not found")
+    def update(session: Session):
+        access = check_item_access(session, item_id, current_user)
 
-    shopping_list = db_item.list
-    if not shopping_list:
-        raise HTTPException(status_code=404, detail="Shopping list not found for this item")
+        family_id = access.family_id if access.calendar_id is not None else None
+        if not family_id and current_user.default_family_id:
+            family_id = current_user.default_family_id
 
-    if shopping_list.calendar:
-        get_family_for_user(shopping_list.calendar.family_id, current_user)
-    elif shopping_list.owner_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not enough permissions")
-
-    family_id = shopping_list.calendar.family_id if shopping_list.calendar else None
-    if not family_id and current_user.families:
-        family_id = current_user.families[0].id
+        updated_item = crud.update_item(db=session, item_id=item_id, item_update=item_update, user_id=current_user.id)
+        return family_id, schemas.ListItem.model_validate(updated_item)
 
-    updated_item = crud.update_item(db=db, item_id=item_id, item_update=item_update, user_id=current_user.id)
+    family_id, updated_item = await db.run_sync(update)
     if family_id:
         background_tasks.add_task(
             manager.broadcast_to_family,
@@ -699,35 +1035,61 @@ def update_item_endpoint(
     return updated_item
 
 
-@app.delete("/items/{item_id}", response_model=schemas.ListItem)
-def delete_item_endpoint(
-    item_id: int,
+@app.patch("/listas/{list_id}/items", response_model=List[schemas.ListItem])
+async def update_items_batch_endpoint(
+    list_id: int,
+    batch: schemas.ListItemsBatchUpdate,
     background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
-    db_item = crud.get_item(db, item_id=item_id)
-    if not db_item:
-        raise HTTPException(status_code=404, detail="Item not found")
+    """
+    Modo compra: aplica una cola de cambios (estado, cantidad, precio) en una sola
+    transacción y emite un único evento con todos los ids modificados.
+    """
+    def update(session: Session):
+        access = check_list_access(session, list_id, current_user, forbidden_detail="Not enough permissions")
 
-    shopping_list = db_item.list
-    if not shopping_list:
-        raise HTTPException(status_code=404, detail="Shopping list not found for this item")
+        family_id = access.family_id if access.calendar_id is not None else None
+        if not family_id and current_user.default_family_id:
+            family_id = current_user.default_family_id
 
-    if shopping_list.calendar:
-        get_family_for_user(shopping_list.calendar.family_id, current_user)
-    elif shopping_list.owner_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not enough permissions")
+        result = crud.update_list_items_batch(db=session, list_id=list_id, changes=batch.items, user_id=current_user.id)
+        if result is None:
+            raise HTTPException(status_code=404, detail="Item not found")
+        updated_items, changed_ids = result
+        return family_id, changed_ids, [schemas.ListItem.model_validate(i) for i in updated_items]
 
-    family_id = shopping_list.calendar.family_id if shopping_list.calendar else None
-    if not family_id and current_user.families:
-        family_id = current_user.families[0].id
-    list_id = db_item.list_id
+    family_id, changed_ids, updated_items = await db.run_sync(update)
+    if family_id and changed_ids:
+        background_tasks.add_task(
+            manager.broadcast_to_family,
+            family_id,
+            {"action": "ITEMS_UPDATED", "list_id": list_id, "item_ids": changed_ids}
+        )
+    return updated_items
 
-    # Evitar DetachedInstanceError: acceder a relaciones antes de eliminar
-    _ = db_item.creado_por  # forzar carga si es necesario
 
-    crud.delete_item(db=db, item_id=item_id, user_id=current_user.id)
+@app.delete("/items/{item_id}", response_model=schemas.ListItem)
+async def delete_item_endpoint(
+    item_id: int,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
+):
+    def delete(session: Session):
+        access = check_item_access(session, item_id, current_user)
+
+        family_id = access.family_id if access.calendar_id is not None else None
+        if not family_id and current_user.default_family_id:
+            family_id = current_user.default_family_id
+
+        # Serializar antes de eliminar para no tocar relaciones de un objeto borrado
+        deleted_item = schemas.ListItem.model_validate(crud.get_item(session, item_id=item_id))
+        crud.delete_item(db=session, item_id=item_id, user_id=current_user.id)
+        return family_id, access.list_id, deleted_item
+
+    family_id, list_id, deleted_item = await db.run_sync(delete)
     
     if family_id:
         background_tasks.add_task(
@@ -735,7 +1097,7 @@ def delete_item_endpoint(
             family_id,
             {"action": "ITEM_DELETED", "list_id": list_id, "item_id": item_id}
         )
-    return db_item
+    return deleted_item
 
 
 
@@ -743,7 +1105,7 @@ def delete_item_endpoint(
 def create_shopping_list_endpoint(
     list_data: schemas.ShoppingListCreate,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     if list_data.calendar_id:
         calendar = db.query(models.Calendar).filter(models.Calendar.id == list_data.calendar_id).first()
@@ -754,52 +1116,55 @@ def create_shopping_list_endpoint(
     return crud.create_shopping_list(db=db, list_data=list_data, owner_id=current_user.id)
 
 @app.get("/listas/", response_model=schemas.Page[schemas.ShoppingListResponse])
-def get_shopping_lists(
+async def get_shopping_lists(
     calendar_id: int,
     page: int = 1,
     size: int = 10,
     start_date: date = None,
     end_date: date = None,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
-    calendar = db.query(models.Calendar).filter(models.Calendar.id == calendar_id).first()
-    if not calendar:
-        raise HTTPException(status_code=404, detail="Calendar not found")
-    get_family_for_user(calendar.family_id, current_user)
-    
-    no_pagination = start_date is not None and end_date is not None
-    limit = None if no_pagination else size
-    skip = 0 if no_pagination else (page - 1) * size
+    def load(session: Session):
+        calendar = session.query(models.Calendar).filter(models.Calendar.id == calendar_id).first()
+        if not calendar:
+            raise HTTPException(status_code=404, detail="Calendar not found")
+        get_family_for_user(calendar.family_id, current_user)
+        
+        no_pagination = start_date is not None and end_date is not None
+        limit = None if no_pagination else size
+        skip = 0 if no_pagination else (page - 1) * size
+
+        result = crud.get_lists_by_calendar(
+            db=session,
+            calendar_id=calendar_id,
+            skip=skip,
+            limit=limit,
+            start_date=start_date,
+            end_date=end_date,
+        )
 
-    result = crud.get_lists_by_calendar(
-        db=db,
-        calendar_id=calendar_id,
-        skip=skip,
-        limit=limit,
-        start_date=start_date,
-        end_date=end_date,
-    )
+        return schemas.Page[schemas.ShoppingListResponse](
+            items=result["items"],
+            total=result["total"],
+            page=1 if no_pagination else page,
+            size=result["total"] if no_pagination else size,
+        )
 
-    return schemas.Page(
-        items=result["items"],
-        total=result["total"],
-        page=1 if no_pagination else page,
-        size=result["total"] if no_pagination else size,
-    )
+    return await db.run_sync(load)
 
 @app.delete("/listas/{lista_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_shopping_list_endpoint(
     lista_id: int,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
-    lista = crud.get_list(db, list_id=lista_id)
-    if not lista:
+    access = crud.get_list_access(db, list_id=lista_id)
+    if not access:
         raise HTTPException(status_code=404, detail="Lista no encontrada")
 
-    if lista.calendar:
-        get_family_for_user(lista.calendar.family_id, current_user)
+    if access.calendar_id is not None:
+        get_family_for_user(access.family_id, current_user)
     
     crud.delete_shopping_list(db=db, list_id=lista_id, user_id=current_user.id)
     return
@@ -809,76 +1174,132 @@ def update_shopping_list(
     lista_id: int,
     list_update: schemas.ShoppingListUpdate,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
-    lista = crud.get_list(db, list_id=lista_id)
-    if not lista:
-        raise HTTPException(status_code=404, detail="Lista no encontrada")
-
-    if lista.calendar:
-        get_family_for_user(lista.calendar.family_id, current_user)
-    elif lista.owner_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not enough permissions")
+    check_list_access(db, lista_id, current_user, forbidden_detail="Not enough permissions")
 
     updated_list = crud.update_shopping_list(db=db, list_id=lista_id, list_update=list_update, user_id=current_user.id)
     return updated_list
 
 @app.get("/listas/{lista_id}", response_model=schemas.ShoppingList)
-def obtener_lista(
+async def obtener_lista(
     lista_id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
-    lista = crud.get_list(db, list_id=lista_id)
-    if not lista:
-        raise HTTPException(status_code=404, detail="Lista no encontrada")
-
-    if lista.calendar:
-        get_family_for_user(lista.calendar.family_id, current_user)
-
+    def load(session: Session):
+        access = crud.get_list_access(session, list_id=lista_id)
+        # Las listas archivadas se siguen pudiendo consultar
+        archived = access is None
+        if archived:
+            access = crud.get_list_access(session, list_id=lista_id, archived=True)
+        if not access:
+            raise HTTPException(status_code=404, detail="Lista no encontrada")
+
+        if access.calendar_id is not None:
+            get_family_for_user(access.family_id, current_user)
+
+        # La versión se lee antes que los datos: como mucho se sirve algo más nuevo que el ETag
+        etag = list_etag(access)
+        if etag_matches(request, etag):
+            return etag, None
+        lista = crud.get_list(session, list_id=lista_id, archived=archived)
+        if not lista:
+            raise HTTPException(status_code=404, detail="Lista no encontrada")
+        return etag, schemas.ShoppingList.model_validate(lista)
+
+    etag, lista = await db.run_sync(load)
+    if lista is None:
+        return not_modified(etag)
+    set_etag(response, etag)
     return lista
 
 @app.get("/listas/{lista_id}/budget-details", response_model=schemas.BudgetDetails)
-def get_budget_details(
+async def get_budget_details(
     lista_id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
-    lista = crud.get_list(db, list_id=lista_id)
-    if not lista:
-        raise HTTPException(status_code=404, detail="Lista no encontrada")
+    def load(session: Session):
+        etag = list_etag(check_list_access(session, lista_id, current_user))
+        if etag_matches(request, etag):
+            return etag, None
+        return etag, crud.get_budget_details_for_list(db=session, list_id=lista_id)
+
+    etag, details = await db.run_sync(load)
+    if details is None:
+        return not_modified(etag)
+    set_etag(response, etag)
+    return details
+
+@app.get("/calendars/{calendar_id}/summary", response_model=List[schemas.CalendarDaySummary])
+async def get_calendar_summary(
+    calendar_id: int,
+    from_date: date = Query(..., alias="from"),
+    to_date: date = Query(..., alias="to"),
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: Principal = Depends(get_current_principal)
+):
+    """
+    Una fila por día con listas en [from, to]: número de listas, ítems, comprados,
+    gasto estimado y listas que superan su presupuesto. No carga ninguna lista.
+    """
+    if to_date < from_date:
+        raise HTTPException(status_code=400, detail="'to' debe ser posterior a 'from'")
+    if (to_date - from_date).days > 366:
+        raise HTTPException(status_code=400, detail="El rango máximo es de un año")
 
-    if lista.calendar:
-        get_family_for_user(lista.calendar.family_id, current_user)
-    elif lista.owner_id != current_user.id:
-        raise HTTPException(status_code=403, detail="No tienes permisos para ver esta lista")
+    def load(session: Session):
+        calendar = session.query(models.Calendar).filter(models.Calendar.id == calendar_id).first()
+        if not calendar:
+            raise HTTPException(status_code=404, detail="Calendar not found")
+        get_family_for_user(calendar.family_id, current_user)
+        return crud.get_calendar_summary(session, calendar_id, from_date, to_date)
 
-    return crud.get_budget_details_for_list(db=db, list_id=lista_id)
+    return await db.run_sync(load)
+
+@app.get("/calendars/{calendar_id}/budget-details", response_model=List[schemas.ListBudgetDetails])
+async def get_calendar_budget_details(
+    calendar_id: int,
+    start_date: date = None,
+    end_date: date = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
+):
+    """
+    Presupuesto de todas las listas del calendario en el rango (p. ej. un mes),
+    para marcar las que se pasan sin pedir el detalle de cada una.
+    """
+    def load(session: Session):
+        calendar = session.query(models.Calendar).filter(models.Calendar.id == calendar_id).first()
+        if not calendar:
+            raise HTTPException(status_code=404, detail="Calendar not found")
+        get_family_for_user(calendar.family_id, current_user)
+        return crud.get_budget_details_for_calendar(session, calendar_id, start_date=start_date, end_date=end_date)
+
+    return await db.run_sync(load)
 
 
 @app.get("/blame/lista/{list_id}", response_model=List[schemas.Blame])
 def get_blame_for_list(
     list_id: int,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
-    lista = crud.get_list(db, list_id=list_id)
-    if not lista:
-        raise HTTPException(status_code=404, detail="Lista no encontrada")
-
     # Verificación de permisos
-    if lista.calendar:
-        get_family_for_user(lista.calendar.family_id, current_user)
-    elif lista.owner_id != current_user.id:
-        raise HTTPException(status_code=403, detail="No tienes permisos para ver esta lista")
+    check_list_access(db, list_id, current_user)
 
     return crud.get_blame_for_list(db=db, list_id=list_id)
 
 @app.get("/families/{id_familia}/products", response_model=List[schemas.Product])
 def get_products_for_family_alias(
     id_familia: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    db: Session = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
     get_family_for_user(id_familia, current_user)
     return crud.get_products_by_family(db=db, family_id=id_familia)
@@ -887,22 +1308,10 @@ def get_products_for_family_alias(
 def get_blame_for_item(
     item_id: int,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
-    # Verificar que el ítem exista
-    item = crud.get_item(db, item_id=item_id)
-    if not item:
-        raise HTTPException(status_code=404, detail="Ítem no encontrado")
-
-    # Verificar permisos (según el dueño o la familia del calendario)
-    lista = crud.get_list(db, list_id=item.list_id)
-    if not lista:
-        raise HTTPException(status_code=404, detail="Lista no encontrada")
-
-    if lista.calendar:
-        get_family_for_user(lista.calendar.family_id, current_user)
-    elif lista.owner_id != current_user.id:
-        raise HTTPException(status_code=403, detail="No tienes permisos para ver este ítem")
+    # Verificar que el ítem exista y los permisos (según el dueño o la familia del calendario)
+    check_item_access(db, item_id, current_user, forbidden_detail="No tienes permisos para ver este ítem", not_found_detail="Ítem no encontrado", list_not_found_detail="Lista no encontrada")
 
     return crud.get_blame_for_item(db=db, item_id=item_id)
 
@@ -911,17 +1320,10 @@ def create_blame_for_list(
     list_id: int,
     blame_data: schemas.BlameCreate,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
-    lista = crud.get_list(db, list_id=list_id)
-    if not lista:
-        raise HTTPException(status_code=404, detail="Lista no encontrada")
-
     # Verificar permisos
-    if lista.calendar:
-        get_family_for_user(lista.calendar.family_id, current_user)
-    elif lista.owner_id != current_user.id:
-        raise HTTPException(status_code=403, detail="No tienes permisos para modificar esta lista")
+    check_list_access(db, list_id, current_user, forbidden_detail="No tienes permisos para modificar esta lista")
 
     return crud.create_blame(
         db=db,
@@ -937,20 +1339,9 @@ def create_blame_for_item(
     item_id: int,
     blame_data: schemas.BlameCreate,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
-    item = crud.get_item(db, item_id=item_id)
-    if not item:
-        raise HTTPException(status_code=404, detail="Ítem no encontrado")
-
-    lista = crud.get_list(db, list_id=item.list_id)
-    if not lista:
-        raise HTTPException(status_code=404, detail="Lista no encontrada")
-
-    if lista.calendar:
-        get_family_for_user(lista.calendar.family_id, current_user)
-    elif lista.owner_id != current_user.id:
-        raise HTTPException(status_code=403, detail="No tienes permisos para modificar este ítem")
+    check_item_access(db, item_id, current_user, forbidden_detail="No tienes permisos para modificar este ítem", not_found_detail="Ítem no encontrado", list_not_found_detail="Lista no encontrada")
 
     return crud.create_blame(
         db=db,
@@ -966,20 +1357,10 @@ async def upload_image_for_item(
     item_id: int,
     file: UploadFile = File(...),
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
+    check_item_access(db, item_id, current_user, forbidden_detail="Not enough permissions to update this item")
     item = crud.get_item(db, item_id=item_id)
-    if not item:
-        raise HTTPException(status_code=404, detail="Item not found")
-
-    shopping_list = item.list
-    if not shopping_list:
-        raise HTTPException(status_code=404, detail="Shopping list not found for this item")
-
-    if shopping_list.calendar:
-        get_family_for_user(shopping_list.calendar.family_id, current_user)
-    elif shopping_list.owner_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not enough permissions to update this item")
 
     try:
         shared_image = await shared_images.save_image(db, file, current_user.id)
@@ -987,7 +1368,8 @@ async def upload_image_for_item(
         # Update associated product shared_image_id (images are strictly global)
         if item.product:
             item.product.shared_image_id = shared_image.id
-            
+            crud.touch_product_lists(db, item.product.id)
+
         db.commit()
         db.refresh(item)
         return item
@@ -996,120 +1378,141 @@ async def upload_image_for_item(
         raise HTTPException(status_code=500, detail=f"Error processing image: {str(e)}")
 
 @app.get("/home/last-lists", response_model=List[schemas.ShoppingListResponse])
-def get_last_lists(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def get_last_lists(db: Session = Depends(get_read_db), current_user: models.User = Depends(get_current_user)):
     return crud.get_last_lists_for_user_families(db=db, user=current_user)
 
 @app.get("/home/last-products", response_model=List[schemas.Product])
-def get_last_products(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def get_last_products(db: Session = Depends(get_read_db), current_user: models.User = Depends(get_current_user)):
     return crud.get_last_products_for_user_families(db=db, user=current_user)
 
 # --- NOTIFICATION ENDPOINTS ---
 @app.get("/notifications", response_model=schemas.Page[schemas.Notification])
-def get_notifications(
+async def get_notifications(
     page: int = 1,
     size: int = 20,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
-    result = crud.get_notifications_by_user(db, user_id=current_user.id, skip=(page - 1) * size, limit=size)
-    return schemas.Page(items=result["items"], total=result["total"], page=page, size=size)
+    def load(session: Session):
+        result = crud.get_notifications_by_user(session, user_id=current_user.id, skip=(page - 1) * size, limit=size)
+        return schemas.Page[schemas.Notification](items=result["items"], total=result["total"], page=page, size=size)
+
+    return await db.run_sync(load)
 
 @app.post("/notifications/{notification_id}/mark-as-read", response_model=schemas.Notification)
-def mark_as_read(
+async def mark_as_read(
     notification_id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
-    notification = crud.mark_notification_as_read(db, notification_id=notification_id, user_id=current_user.id)
-    if not notification:
-        raise HTTPException(status_code=404, detail="Notification not found")
-    return notification
+    def mark(session: Session):
+        notification = crud.mark_notification_as_read(session, notification_id=notification_id, user_id=current_user.id)
+        if not notification:
+            raise HTTPException(status_code=404, detail="Notification not found")
+        return schemas.Notification.model_validate(notification)
+
+    return await db.run_sync(mark)
 
 @app.post("/notifications/mark-all-as-read", response_model=List[schemas.Notification])
-def mark_all_as_read(
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+async def mark_all_as_read(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
-    return crud.mark_all_notifications_as_read(db, user_id=current_user.id)
+    def mark(session: Session):
+        notifications = crud.mark_all_notifications_as_read(session, user_id=current_user.id)
+        return [schemas.Notification.model_validate(n) for n in notifications]
+
+    return await db.run_sync(mark)
 
 @app.delete("/notifications/{notification_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_notification(
+async def delete_notification(
     notification_id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
-    notification = crud.delete_notification(db, notification_id=notification_id, user_id=current_user.id)
+    notification = await db.run_sync(crud.delete_notification, notification_id=notification_id, user_id=current_user.id)
     if not notification:
         raise HTTPException(status_code=404, detail="Notification not found")
     return
 
-@app.get("/listas/{lista_id}/items", response_model=schemas.Page[schemas.ListItem])
-def get_items_for_list(
+@app.get("/listas/{lista_id}/items", response_model=schemas.CursorPage[schemas.ListItem])
+async def get_items_for_list(
     lista_id: int,
-    page: int = 1,
+    request: Request,
+    response: Response,
+    page: Optional[int] = None,
     size: int = 10,
+    cursor: Optional[str] = None,
+    include_total: bool = False,
     status: str = None,
     category: str = None,
     brand: str = None,
     search: str = None,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
-    lista = crud.get_list(db, list_id=lista_id)
-    if not lista:
-        raise HTTPException(status_code=404, detail="Lista no encontrada")
+    """
+    Sin `page` pagina por cursor: se pasa el `next_cursor` de la respuesta anterior
+    y el total solo se calcula con include_total=true. Con `page` se usa OFFSET y
+    siempre se devuelve el total (compatibilidad con el frontend actual).
+    """
+    decoded_cursor = None
+    if cursor:
+        decoded_cursor = crud.decode_item_cursor(cursor)
+        if decoded_cursor is None:
+            raise HTTPException(status_code=400, detail="Cursor inválido")
+    if page is not None and page < 1:
+        raise HTTPException(status_code=400, detail="page debe ser >= 1")
+
+    def load(session: Session):
+        # 🔐 Verificar permisos
+        access, archived = check_list_read_access(session, lista_id, current_user)
+        etag = list_etag(access)
+        if etag_matches(request, etag):
+            return etag, None
+
+        result = crud.get_list_items_page(
+            session, lista_id, size=size, cursor=decoded_cursor, page=None if decoded_cursor else page,
+            status=status, category=category, brand=brand, search=search, include_total=include_total,
+            archived=archived,
+        )
+        return etag, schemas.CursorPage[schemas.ListItem](
+            items=result["items"], total=result["total"], next_cursor=result["next_cursor"],
+            page=None if decoded_cursor else page, size=size,
+        )
 
-    # 🔐 Verificar permisos
-    if lista.calendar:
-        get_family_for_user(lista.calendar.family_id, current_user)
-    elif lista.owner_id != current_user.id:
-        raise HTTPException(status_code=403, detail="No tienes permisos para ver esta lista")
-
-    # 🔹 Obtener ítems con paginación
-    query = db.query(models.ListItem).filter(models.ListItem.list_id == lista_id)
-    if status:
-        query = query.filter(models.ListItem.status == status)
-
-    product_filters = []
-    if category:
-        product_filters.append(func.lower(models.Product.category).like(f"%{category.lower()}%"))
-    if brand:
-        product_filters.append(func.lower(models.Product.brand).like(f"%{brand.lower()}%"))
-
-    if product_filters:
-        query = query.join(models.Product)
-        for f in product_filters:
-            query = query.filter(f)
-
-    if search:
-        query = query.filter(func.lower(models.ListItem.nombre).like(f"%{search.lower()}%"))
-        
-    total = query.count()
-    items = (
-        query.options(joinedload(models.ListItem.product))
-        .order_by(models.ListItem.created_at.desc())
-        .offset((page - 1) * size)
-        .limit(size)
-        .all()
-    )
+    etag, items_page = await db.run_sync(load)
+    if items_page is None:
+        return not_modified(etag)
+    set_etag(response, etag)
+    return items_page
 
-    return schemas.Page(items=items, total=total, page=page, size=size)
+@app.get("/listas/{lista_id}/changes", response_model=schemas.ListChanges)
+async def get_list_changes(
+    lista_id: int,
+    since: int = 0,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
+):
+    """
+    Sincronización incremental: se pasa la `version` de la última respuesta y se reciben
+    solo los ítems cambiados y los ids borrados desde entonces.
+    """
+    def load(session: Session):
+        check_list_access(session, lista_id, current_user)
+        changes = crud.get_list_changes(session, list_id=lista_id, since=since)
+        if changes is None:
+            raise HTTPException(status_code=404, detail="Lista no encontrada")
+        return schemas.ListChanges.model_validate(changes)
+
+    return await db.run_sync(load)
 
 @app.get("/listas/{lista_id}/filter-options")
 def get_list_filter_options_endpoint(
     lista_id: int,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    access = Depends(get_list_access)
 ):
-    lista = crud.get_list(db, list_id=lista_id)
-    if not lista:
-        raise HTTPException(status_code=404, detail="Lista no encontrada")
-
-    if lista.calendar:
-        get_family_for_user(lista.calendar.family_id, current_user)
-    elif lista.owner_id != current_user.id:
-        raise HTTPException(status_code=403, detail="No tienes permisos para ver esta lista")
-
     return crud.get_list_filter_options(db=db, list_id=lista_id)
 
 # --- IMAGE SEARCH ENDPOINTS ---
@@ -1210,7 +1613,7 @@ async def search_images(
     engine_id: Optional[int] = None,
     page: int = 1,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """
     Proxies image search requests using configurable engines.
@@ -1286,9 +1689,11 @@ async def search_images(
         # Default behavior if no config
         params = {"q": q}
 
+    import httpx
     try:
         async with httpx.AsyncClient(follow_redirects=True) as client:
-            response = await client.get(parsed_base_url, params=params, timeout=15.0)
+            with metrics.observe_outbound("images_search"):
+                response = await client.get(parsed_base_url, params=params, timeout=15.0)
             response.raise_for_status()
             
             extraction_config = {
@@ -1368,6 +1773,7 @@ async def admin_test_image_search_config(
     else:
         params = {"q": q}
 
+    import httpx
     try:
         async with httpx.AsyncClient(follow_redirects=True) as client:
             response = await client.get(parsed_base_url, params=params, timeout=10.0)
@@ -1435,41 +1841,14 @@ def admin_delete_image_search_config(config_id: int, db: Session = Depends(get_d
     return db_config
 
 @app.get("/images/engines", response_model=List[schemas.ImageSearchConfig])
-def get_available_engines(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def get_available_engines(db: Session = Depends(get_db), current_user: Principal = Depends(get_current_principal)):
     return crud.get_image_search_configs(db, active_only=True)
 
-@app.get("/products/search", response_model=schemas.Page[schemas.Product])
-def search_products_endpoint(
-    family_id: int,
-    q: str,
-    page: int = 1,
-    size: int = 10,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
-):
-    # Authorization check
-    get_family_for_user(family_id, current_user)
-    
-    products_list = crud.search_products(db, name=q, family_id=family_id, skip=(page-1)*size, limit=size)
-    # We need total count for pagination
-    # For now, let's just use a simple query
-    total = db.query(models.Product).filter(
-        models.Product.family_id == family_id,
-        models.Product.name.ilike(f"%{q}%")
-    ).count()
-    
-    return {
-        "items": products_list,
-        "total": total,
-        "page": page,
-        "size": size
-    }
-
 @app.post("/images/upload", response_model=schemas.SharedImage)
 async def upload_generic_image(
     file: UploadFile = File(...),
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """
     Generic image upload endpoint for new products or miscellaneous items.
@@ -1484,7 +1863,7 @@ async def upload_generic_image(
 async def upload_image_from_url(
     image_data: dict, # {"image_url": "..."}
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     url = image_data.get("image_url")
     if not url:
@@ -1496,7 +1875,7 @@ async def update_product_image_from_url(
     product_id: int,
     image_data: dict, # {"image_url": "..."}
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     product = db.query(models.Product).filter(models.Product.id == product_id).first()
     if not product:
@@ -1512,6 +1891,7 @@ async def update_product_image_from_url(
 
     shared_image = await shared_images.save_image_from_url(db, url, current_user.id)
     product.shared_image_id = shared_image.id
+    crud.touch_product_lists(db, product.id)
     db.commit()
     db.refresh(product)
     
@@ -0,0 +1,89 @@
+"""
+Tareas de mantenimiento sobre la base de datos configurada en DATABASE_URL:
+
+    python -m app.maintenance repair-counters [--list-id 1 --list-id 2]
+    python -m app.maintenance archive-lists [--older-than-days 365] [--dry-run]
+    python -m app.maintenance merge-products [--dry-run]
+    python -m app.maintenance repair-facets [--family-id 1 --family-id 2]
+"""
+import argparse
+import json
+import time
+
+from .database import SessionLocal
+from . import archive, crud
+
+
+def repair_counters(args):
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        processed = crud.recompute_list_counters(db, list_ids=args.list_id or None, batch_size=args.batch_size)
+        print(f"Recomputed counters for {processed} lists in {time.perf_counter() - started:.1f}s")
+    finally:
+        db.close()
+
+
+def archive_lists(args):
+    db = SessionLocal()
+    try:
+        cutoff = archive.cutoff_for(args.older_than_days)
+        if args.dry_run:
+            print(json.dumps(archive.archive_report(db, cutoff), indent=2))
+            return
+        started = time.perf_counter()
+        moved = archive.archive_lists(db, cutoff, batch_size=args.batch_size)
+        print(f"Archived lists before {cutoff.isoformat()} in {time.perf_counter() - started:.1f}s: {json.dumps(moved)}")
+    finally:
+        db.close()
+
+
+def merge_products(args):
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        report = crud.merge_duplicate_products(db, dry_run=args.dry_run)
+        print(f"Merged duplicate products in {time.perf_counter() - started:.1f}s: {json.dumps(report)}")
+    finally:
+        db.close()
+
+
+def repair_facets(args):
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        rows = crud.recompute_product_facets(db, family_ids=args.family_id or None)
+        print(f"Recomputed {rows} product facets in {time.perf_counter() - started:.1f}s")
+    finally:
+        db.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.maintenance")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    repair = subparsers.add_parser("repair-counters", help="recalcula los contadores desnormalizados de shopping_lists")
+    repair.add_argument("--list-id", type=int, action="append", help="solo estas listas (se puede repetir)")
+    repair.add_argument("--batch-size", type=int, default=5000)
+    repair.set_defaults(func=repair_counters)
+
+    archiver = subparsers.add_parser("archive-lists", help="mueve las listas antiguas, sus ítems y blames a las tablas *_archive")
+    archiver.add_argument("--older-than-days", type=int, default=archive.ARCHIVE_AFTER_DAYS, help="por defecto $ARCHIVE_AFTER_DAYS o 365")
+    archiver.add_argument("--batch-size", type=int, default=500, help="listas por transacción")
+    archiver.add_argument("--dry-run", action="store_true", help="solo informa de las filas y bytes que se moverían")
+    archiver.set_defaults(func=archive_lists)
+
+    merger = subparsers.add_parser("merge-products", help="fusiona los productos con el mismo nombre normalizado y rellena normalized_name")
+    merger.add_argument("--dry-run", action="store_true", help="solo cuenta los grupos y productos que se fusionarían")
+    merger.set_defaults(func=merge_products)
+
+    facets = subparsers.add_parser("repair-facets", help="recalcula los contadores de categorías y marcas de product_facets")
+    facets.add_argument("--family-id", type=int, action="append", help="solo estas familias (se puede repetir)")
+    facets.set_defaults(func=repair_facets)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""
+Métricas Prometheus de /metrics.
+
+Cada worker de uvicorn tiene sus propios contadores: con --workers > 1 hay que fijar
+PROMETHEUS_MULTIPROC_DIR a un directorio vacío (se limpia antes de arrancar) para que
+el scrape agregue los ficheros de todos los workers. Los gauges del pool y de websockets
+se leen en el momento y son siempre los del worker que atiende el scrape.
+"""
+import os
+import time
+from collections import OrderedDict
+from typing import Dict
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+from prometheus_client.core import GaugeMetricFamily
+from starlette.routing import Match
+
+MULTIPROCESS = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+# Rutas resueltas que se recuerdan (LRU por método y path): con ids en la URL hay una por recurso
+METRICS_ROUTE_CACHE_SIZE = int(os.getenv("METRICS_ROUTE_CACHE_SIZE", "4096"))
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "HTTP requests by route template, method and status",
+    ["method", "route", "status"],
+)
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template",
+    ["method", "route"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+HTTP_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "HTTP requests currently being served by route template",
+    ["method", "route"], multiprocess_mode="livesum",
+)
+OUTBOUND_LATENCY = Histogram(
+    "http_client_request_duration_seconds", "Outbound HTTP (httpx) latency by target",
+    ["target", "outcome"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
+
+
+def resolve_route(scope) -> str:
+    """
+    Plantilla de la ruta (/listas/{lista_id}) antes de llamar a la app, para etiquetar
+    el gauge de peticiones en curso; es el mismo recorrido que hará el router.
+    """
+    app = scope.get("app")
+    partial = None
+    for route in getattr(getattr(app, "router", None), "routes", ()):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+        if match == Match.PARTIAL and partial is None:
+            # Ruta existente con otro método: el router responderá 405 con ella
+            partial = route.path
+    return partial or "unmatched"
+
+
+# (método, path) -> (plantilla, gauge en curso, histograma de latencia) ya etiquetados.
+# Solo se usa desde el event loop: no necesita cerrojo
+_route_labels: "OrderedDict[tuple, tuple]" = OrderedDict()
+
+
+def route_labels(scope) -> tuple:
+    """
+    resolve_route recorre todas las rutas: se hace una vez por método y path y se
+    guardan también las métricas etiquetadas, que no dependen del status.
+    """
+    key = (scope["method"], scope["path"])
+    labels = _route_labels.get(key)
+    if labels is not None:
+        _route_labels.move_to_end(key)
+        return labels
+    route_path = resolve_route(scope)
+    labels = (route_path, HTTP_IN_FLIGHT.labels(key[0], route_path), HTTP_LATENCY.labels(key[0], route_path))
+    _route_labels[key] = labels
+    while len(_route_labels) > METRICS_ROUTE_CACHE_SIZE:
+        _route_labels.popitem(last=False)
+    return labels
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI puro (sin BaseHTTPMiddleware) para que el coste por petición
+    sea solo un par de llamadas a time.perf_counter y la actualización de métricas.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        method = scope["method"]
+        status_code = 500
+        # Plantilla de la ruta y no la URL: evita cardinalidad por id
+        route_path, in_flight, latency = route_labels(scope)
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - started
+            in_flight.dec()
+            HTTP_REQUESTS.labels(method, route_path, str(status_code)).inc()
+            latency.observe(duration)
+
+
+class observe_outbound:
+    """
+    Context manager para medir llamadas salientes con httpx:
+
+        with metrics.observe_outbound("images_search"):
+            response = await client.get(...)
+    """
+
+    def __init__(self, target: str):
+        self.target = target
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        outcome = "error" if exc_type is not None else "ok"
+        OUTBOUND_LATENCY.labels(self.target, outcome).observe(time.perf_counter() - self.started)
+        return False
+
+
+class RuntimeCollector:
+    """
+    Gauges que se leen en el momento del scrape: estado de los pools de conexiones
+    y websockets abiertos por familia.
+    """
+
+    def __init__(self, engines: Dict[str, object], connection_manager):
+        self.engines = engines
+        self.connection_manager = connection_manager
+
+    def collect(self):
+        checked_out = GaugeMetricFamily("db_pool_checked_out", "Connections checked out of the pool", labels=["engine"])
+        overflow = GaugeMetricFamily("db_pool_overflow", "Connections above pool_size", labels=["engine"])
+        size = GaugeMetricFamily("db_pool_size", "Configured pool size", labels=["engine"])
+        for name, engine in self.engines.items():
+            pool = engine.pool
+            # Los pools de SQLite (NullPool, SingletonThreadPool...) no exponen todos los contadores
+            if hasattr(pool, "checkedout"):
+                checked_out.add_metric([name], pool.checkedout())
+            if hasattr(pool, "overflow"):
+                # QueuePool arranca en -pool_size hasta llenar el pool
+                overflow.add_metric([name], max(0, pool.overflow()))
+            if hasattr(pool, "size"):
+                size.add_metric([name], pool.size())
+        yield checked_out
+        yield overflow
+        yield size
+
+        websockets = GaugeMetricFamily("websocket_connections", "Open websocket connections per family", labels=["family_id"])
+        for family_id, connections in list(self.connection_manager.active_connections.items()):
+            websockets.add_metric([str(family_id)], len(connections))
+        yield websockets
+
+
+_runtime_collector = None
+
+
+def register_runtime_collector(engines: Dict[str, object], connection_manager):
+    global _runtime_collector
+    _runtime_collector = RuntimeCollector(engines, connection_manager)
+    REGISTRY.register(_runtime_collector)
+
+
+def render():
+    if not MULTIPROCESS:
+        return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+    # Se agregan los ficheros de todos los workers; el collector de runtime es el de este proceso
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    if _runtime_collector is not None:
+        registry.register(_runtime_collector)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead():
+    # Descarta los gauges "live" de este worker al pararlo
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(os.getpid())
@@ -1,5 +1,7 @@
-from sqlalchemy import Column, Integer, String, TIMESTAMP, ForeignKey, Enum, Boolean, Float, Text, DateTime, Table, and_
-from sqlalchemy.orm import relationship, foreign
+import unicodedata
+
+from sqlalchemy import Column, Integer, String, TIMESTAMP, ForeignKey, Enum, Boolean, Float, Text, Date, DateTime, Table, Index, and_
+from sqlalchemy.orm import relationship, foreign, validates
 
 from sqlalchemy.ext.declarative import declarative_base
 from . import tz_util
@@ -60,6 +62,10 @@ class Calendar(Base):
 
 class ShoppingList(Base):
     __tablename__ = 'shopping_lists'
+    # Vista de calendario: rango de fechas dentro de un calendario
+    __table_args__ = (
+        Index('ix_shopping_lists_calendar_date', 'calendar_id', 'list_for_date'),
+    )
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(255), nullable=False)
     notas = Column(Text)
@@ -68,9 +74,21 @@ class ShoppingList(Base):
     budget = Column(Float, nullable=True)
     calendar_id = Column(Integer, ForeignKey('calendars.id'))
     owner_id = Column(Integer, ForeignKey('users.id'))
-    list_for_date = Column(DateTime, default=tz_util.now)
+    # DATE, como en init.sql: los filtros por rango comparan días sin conversiones
+    list_for_date = Column(Date, default=tz_util.today)
     created_at = Column(DateTime, default=tz_util.now)
 
+    # Contadores desnormalizados: los mantienen las escrituras de ítems en crud
+    # (ver _apply_list_counters) y se recalculan con `python -m app.maintenance repair-counters`
+    items_count = Column(Integer, nullable=False, default=0, server_default="0")
+    pending_count = Column(Integer, nullable=False, default=0, server_default="0")
+    purchased_count = Column(Integer, nullable=False, default=0, server_default="0")
+    not_needed_count = Column(Integer, nullable=False, default=0, server_default="0")
+    estimated_total = Column(Float, nullable=False, default=0, server_default="0")
+    purchased_total = Column(Float, nullable=False, default=0, server_default="0")
+    # Sube con cada escritura de la lista o sus ítems; de aquí sale el ETag de las lecturas
+    version = Column(Integer, nullable=False, default=0, server_default="0")
+
     calendar = relationship("Calendar", back_populates="lists")
     owner = relationship("User", back_populates="lists")
     items = relationship("ListItem", back_populates="list")
@@ -86,10 +104,27 @@ class ShoppingList(Base):
 
 
 
+def normalize_product_name(name) -> str:
+    """
+    Clave de un producto dentro de su familia: minúsculas, sin tildes y con los
+    espacios colapsados, de modo que "Plátano" y "platano " son el mismo producto.
+    """
+    decomposed = unicodedata.normalize("NFKD", name or "")
+    folded = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return " ".join(folded.lower().split())
+
 class Product(Base):
     __tablename__ = 'products'
+    # Refresco incremental del índice de búsqueda (product_index) por updated_at
+    # y unicidad por nombre normalizado (upsert de get_or_create_product)
+    __table_args__ = (
+        Index('ix_products_family_updated', 'family_id', 'updated_at'),
+        Index('uq_products_family_normalized_name', 'family_id', 'normalized_name', unique=True),
+    )
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(255), nullable=False, index=True)
+    # Se mantiene desde name (validates); las inserciones Core lo calculan a mano
+    normalized_name = Column(String(255), nullable=True)
     description = Column(Text)
     category = Column(String(100), index=True)
     brand = Column(String(100), index=True)
@@ -103,6 +138,20 @@ class Product(Base):
     shared_image = relationship("SharedImage")
     price_history = relationship("PriceHistory", back_populates="product")
 
+    @validates('name')
+    def _normalize_name(self, key, name):
+        self.normalized_name = normalize_product_name(name)
+        return name
+
+class ProductFacet(Base):
+    # Productos por categoría y por marca de cada familia (filtros del catálogo),
+    # mantenido por crud en cada escritura de productos; recompute_product_facets lo rehace
+    __tablename__ = 'product_facets'
+    family_id = Column(Integer, ForeignKey('families.id', ondelete='CASCADE'), primary_key=True)
+    kind = Column(String(20), primary_key=True)  # 'category' o 'brand'
+    value = Column(String(100), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
 class PriceHistory(Base):
     __tablename__ = 'price_history'
     id = Column(Integer, primary_key=True, index=True)
@@ -114,6 +163,12 @@ class PriceHistory(Base):
 
 class ListItem(Base):
     __tablename__ = 'list_items'
+    # Paginación por cursor sobre (created_at, id) dentro de una lista
+    # y sincronización incremental por versión (/listas/{id}/changes)
+    __table_args__ = (
+        Index('ix_list_items_list_created_id', 'list_id', 'created_at', 'id'),
+        Index('ix_list_items_list_version', 'list_id', 'version'),
+    )
     id = Column(Integer, primary_key=True, index=True)
     list_id = Column(Integer, ForeignKey('shopping_lists.id'))
     product_id = Column(Integer, ForeignKey('products.id'), nullable=True)
@@ -127,6 +182,8 @@ class ListItem(Base):
     shared_image_id = Column(Integer, ForeignKey('shared_images.id'), nullable=True)
     creado_por_id = Column(Integer, ForeignKey('users.id'))
     created_at = Column(DateTime, default=tz_util.now)
+    # Versión de la lista en la última escritura del ítem
+    version = Column(Integer, nullable=False, default=0, server_default="0")
 
     list = relationship("ShoppingList", back_populates="items")
     product = relationship("Product")
@@ -138,6 +195,32 @@ class ListItem(Base):
     )
 
 
+class ListItemTombstone(Base):
+    """
+    Ítems borrados, para que /listas/{id}/changes pueda informar de las bajas.
+    """
+    __tablename__ = 'list_item_tombstones'
+    __table_args__ = (
+        Index('ix_list_item_tombstones_list_version', 'list_id', 'version'),
+    )
+    id = Column(Integer, primary_key=True)
+    list_id = Column(Integer, ForeignKey('shopping_lists.id', ondelete='CASCADE'), nullable=False)
+    item_id = Column(Integer, nullable=False)
+    version = Column(Integer, nullable=False)
+    deleted_at = Column(DateTime, default=tz_util.now)
+
+
+class AuthRevocation(Base):
+    """
+    Invalidaciones de la cache de principals, para que los demás workers las apliquen
+    (auth_cache.PrincipalCache.sync). user_id nulo: vaciar la cache entera.
+    """
+    __tablename__ = 'auth_revocations'
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, nullable=True)
+    created_at = Column(DateTime, default=tz_util.now, index=True)
+
+
 class Blame(Base):
     __tablename__ = 'blames'
     id = Column(Integer, primary_key=True, index=True)
@@ -219,4 +302,64 @@ class ImageSearchConfig(Base):
     
     is_active = Column(Boolean, default=True)
     is_default = Column(Boolean, default=False)
-    created_at = Column(DateTime, default=tz_util.now)
\ No newline at end of file
+    created_at = Column(DateTime, default=tz_util.now)
+
+class SchemaInfo(Base):
+    __tablename__ = 'schema_info'
+    key = Column(String(50), primary_key=True)
+    value = Column(String(255), nullable=False)
+    updated_at = Column(DateTime, default=tz_util.now, onupdate=tz_util.now)
+
+
+# --- Archivo histórico ---
+# Copias de las tablas calientes con las mismas columnas (se generan a partir de ellas para
+# que no se desalineen) más archived_at. Conservan los ids originales y no tienen FKs:
+# `python -m app.maintenance archive-lists` mueve aquí las listas antiguas.
+def _archive_table(source: Table, name: str, *indexes) -> Table:
+    columns = [
+        Column(
+            column.name, column.type, primary_key=column.primary_key, autoincrement=False, nullable=column.nullable,
+            server_default=column.server_default.arg if column.server_default is not None else None,
+        )
+        for column in source.columns
+    ]
+    return Table(name, Base.metadata, *columns, Column('archived_at', DateTime, default=tz_util.now), *indexes)
+
+list_items_archive = _archive_table(
+    ListItem.__table__, 'list_items_archive',
+    Index('ix_list_items_archive_list_id', 'list_id'),
+)
+blames_archive = _archive_table(
+    Blame.__table__, 'blames_archive',
+    Index('ix_blames_archive_entity', 'entity_type', 'entity_id'),
+)
+notifications_archive = _archive_table(
+    Notification.__table__, 'notifications_archive',
+    Index('ix_notifications_archive_user_id', 'user_id'),
+)
+
+class ListItemArchive(Base):
+    # Solo lectura: GET /listas/{id} e /items de una lista archivada
+    __table__ = list_items_archive
+    archived = True
+
+    product = relationship("Product", primaryjoin=lambda: foreign(ListItemArchive.product_id) == Product.id, viewonly=True)
+    creado_por = relationship("User", primaryjoin=lambda: foreign(ListItemArchive.creado_por_id) == User.id, viewonly=True)
+
+class ShoppingListArchive(Base):
+    __table__ = _archive_table(
+        ShoppingList.__table__, 'shopping_lists_archive',
+        Index('ix_shopping_lists_archive_calendar_date', 'calendar_id', 'list_for_date'),
+    )
+    archived = True
+
+    calendar = relationship(
+        "Calendar",
+        primaryjoin=lambda: foreign(ShoppingListArchive.calendar_id) == Calendar.id,
+        viewonly=True,
+    )
+    items = relationship(
+        "ListItemArchive",
+        primaryjoin=lambda: foreign(ListItemArchive.list_id) == ShoppingListArchive.id,
+        viewonly=True,
+    )
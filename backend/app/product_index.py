@@ -0,0 +1,369 @@
+import bisect
+import heapq
+import os
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from . import models, tz_util
+
+PRODUCT_INDEX_FAMILIES = int(os.getenv("PRODUCT_INDEX_FAMILIES", "256"))
+# Tope de memoria aproximado: productos en memoria entre todos los índices cargados
+PRODUCT_INDEX_MAX_PRODUCTS = int(os.getenv("PRODUCT_INDEX_MAX_PRODUCTS", "1000000"))
+# Cada cuánto se comprueba contra la base de datos si otro worker ha escrito productos
+PRODUCT_INDEX_TTL = float(os.getenv("PRODUCT_INDEX_TTL", "5"))
+# Margen sobre updated_at (precisión de segundos en MySQL) al pedir los cambios recientes
+REFRESH_OVERLAP = timedelta(seconds=2)
+
+# Clave del índice con los productos de todas las familias (búsqueda de administración)
+ALL_FAMILIES = None
+
+
+# (family_id, id, name, brand, category, last_price): lo que los hooks de crud entregan al índice
+ProductEntry = Tuple[Optional[int], int, str, Optional[str], Optional[str], Optional[float]]
+
+
+def index_entry(product: models.Product) -> ProductEntry:
+    return (product.family_id, product.id, product.name, product.brand, product.category, product.last_price)
+
+
+def normalize(text: Optional[str]) -> str:
+    # Misma clave que identifica al producto: "Plátano" y "platano " se encuentran igual
+    return models.normalize_product_name(text)
+
+
+def trigrams(text: str) -> Set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _tier(query: str, value: str, position: int) -> int:
+    # 0: prefijo, 1: inicio de una palabra, 2: subcadena
+    if position == 0:
+        return 0
+    if value[position - 1] == " " or (" " + query) in value:
+        return 1
+    return 2
+
+
+def _value_tiers(values: Dict[str, Set[int]], query: str) -> List[Set[int]]:
+    tiers = [set(), set(), set()]
+    for value, ids in values.items():
+        position = value.find(query)
+        if position >= 0:
+            tiers[_tier(query, value, position)] |= ids
+    return tiers
+
+
+class ProductIndex:
+    """
+    Índice de los productos de una familia (o de todas, para administración): trigramas
+    del nombre -> ids y, como marcas y categorías se repiten mucho, valor -> ids.
+    Las listas de trigramas solo crecen; los ids obsoletos se descartan al verificar
+    y se compactan cuando se acumulan.
+    """
+
+    def __init__(self):
+        self.docs: Dict[int, Tuple[str, str, str]] = {}
+        self.names: Dict[int, str] = {}
+        # Nombre tal cual y último precio, para las sugerencias de autocompletado
+        self.labels: Dict[int, Tuple[str, Optional[float]]] = {}
+        self.sorted_names: List[Tuple[str, int]] = []
+        self.grams: Dict[str, array] = {}
+        self.brands: Dict[str, Set[int]] = {}
+        self.categories: Dict[str, Set[int]] = {}
+        self.stale = 0
+        self.lock = threading.Lock()
+        self.checked_at = 0.0
+        self.synced_at = None
+
+    def _link(self, values: Dict[str, Set[int]], value: str, product_id: int):
+        if value:
+            values.setdefault(value, set()).add(product_id)
+
+    def _unlink(self, values: Dict[str, Set[int]], value: str, product_id: int):
+        ids = values.get(value)
+        if ids is not None:
+            ids.discard(product_id)
+            if not ids:
+                del values[value]
+
+    def _unsort(self, name: str, product_id: int):
+        position = bisect.bisect_left(self.sorted_names, (name, product_id))
+        if position < len(self.sorted_names) and self.sorted_names[position] == (name, product_id):
+            del self.sorted_names[position]
+
+    def load(self, rows):
+        # Carga inicial: ordenar una vez es mucho más barato que insertar ordenado fila a fila
+        for row in rows:
+            doc = (normalize(row.name), normalize(row.brand), normalize(row.category))
+            self.docs[row.id] = doc
+            self.names[row.id] = doc[0]
+            self.labels[row.id] = ((row.name or "").strip(), row.last_price)
+            for gram in trigrams(doc[0]):
+                self.grams.setdefault(gram, array("i")).append(row.id)
+            self._link(self.brands, doc[1], row.id)
+            self._link(self.categories, doc[2], row.id)
+        self.sorted_names = sorted((name, product_id) for product_id, name in self.names.items())
+
+    def put(self, product_id: int, name: str, brand: Optional[str], category: Optional[str], last_price: Optional[float]):
+        self.labels[product_id] = ((name or "").strip(), last_price)
+        doc = (normalize(name), normalize(brand), normalize(category))
+        previous = self.docs.get(product_id)
+        if previous == doc:
+            return
+        self.docs[product_id] = doc
+        self.names[product_id] = doc[0]
+        old_grams = set()
+        if previous is not None:
+            old_grams = trigrams(previous[0])
+            self._unlink(self.brands, previous[1], product_id)
+            self._unlink(self.categories, previous[2], product_id)
+        if previous is None or previous[0] != doc[0]:
+            if previous is not None:
+                self._unsort(previous[0], product_id)
+                self.stale += 1
+            bisect.insort(self.sorted_names, (doc[0], product_id))
+        for gram in trigrams(doc[0]) - old_grams:
+            self.grams.setdefault(gram, array("i")).append(product_id)
+        self._link(self.brands, doc[1], product_id)
+        self._link(self.categories, doc[2], product_id)
+        self._maybe_compact()
+
+    def discard(self, product_id: int):
+        doc = self.docs.pop(product_id, None)
+        if doc is None:
+            return
+        del self.names[product_id]
+        del self.labels[product_id]
+        self._unsort(doc[0], product_id)
+        self._unlink(self.brands, doc[1], product_id)
+        self._unlink(self.categories, doc[2], product_id)
+        self.stale += 1
+        self._maybe_compact()
+
+    def _maybe_compact(self):
+        if self.stale <= max(1024, len(self.docs) // 4):
+            return
+        self.grams = {}
+        for product_id, name in self.names.items():
+            for gram in trigrams(name):
+                self.grams.setdefault(gram, array("i")).append(product_id)
+        self.stale = 0
+
+    def _name_hits(self, query: str) -> List[int]:
+        names = self.names
+        if len(query) < 3:
+            return [product_id for product_id, name in names.items() if query in name]
+        # Todo nombre que contiene la consulta contiene todos sus trigramas: basta con
+        # verificar la lista más corta (dict.fromkeys quita los ids repetidos)
+        postings = [self.grams.get(gram) for gram in trigrams(query)]
+        if not all(postings):
+            return []
+        return [product_id for product_id in dict.fromkeys(min(postings, key=len)) if query in names.get(product_id, "")]
+
+    def prefix_range(self, query: str) -> Tuple[int, int]:
+        # Nombres que empiezan por query: tramo contiguo de sorted_names
+        low = bisect.bisect_left(self.sorted_names, (query,))
+        return low, bisect.bisect_left(self.sorted_names, (query + "\U0010ffff",), low)
+
+    def suggest(self, prefix: str, limit: int) -> List[dict]:
+        low, high = self.prefix_range(prefix)
+        suggestions = []
+        for _, product_id in self.sorted_names[low:min(high, low + limit)]:
+            name, last_price = self.labels[product_id]
+            suggestions.append({"id": product_id, "name": name, "last_price": last_price})
+        return suggestions
+
+    def search(self, query: str, skip: int, limit: int) -> Tuple[List[int], int]:
+        """
+        Relevancia: nombre > marca > categoría y, dentro de cada campo, prefijo >
+        inicio de palabra > subcadena; a igualdad, orden alfabético. Los niveles se
+        calculan y ordenan solo hasta completar la página.
+        """
+        names = self.names
+        hits = self._name_hits(query)
+        value_tiers = _value_tiers(self.brands, query) + _value_tiers(self.categories, query)
+        total = len(set(hits).union(*value_tiers))
+
+        wanted = skip + limit
+        low, high = self.prefix_range(query)
+        ranked = [product_id for _, product_id in self.sorted_names[low:min(high, low + wanted)]]
+        if len(ranked) < wanted:
+            seen = set(ranked)
+            rest = set(hits) - seen
+            word_start = " " + query
+            word = {product_id for product_id in rest if word_start in names[product_id]}
+            for tier in (word, rest - word, *value_tiers):
+                fresh = tier - seen
+                seen |= fresh
+                ranked.extend(heapq.nsmallest(wanted - len(ranked), fresh, key=names.__getitem__))
+                if len(ranked) >= wanted:
+                    break
+        return ranked[skip:wanted], total
+
+
+class ProductSearchIndex:
+    """
+    Índices por familia en un LRU. Las escrituras de este proceso los actualizan al
+    momento (hooks en crud); lo que escriban otros workers se incorpora como mucho
+    PRODUCT_INDEX_TTL segundos después con una consulta por updated_at.
+    """
+
+    def __init__(self, max_families: int = PRODUCT_INDEX_FAMILIES, max_products: int = PRODUCT_INDEX_MAX_PRODUCTS,
+                 ttl: float = PRODUCT_INDEX_TTL):
+        self.max_families = max_families
+        self.max_products = max_products
+        self.ttl = ttl
+        self._indexes: "OrderedDict[Optional[int], ProductIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.builds = 0
+        self.refreshes = 0
+        self.evictions = 0
+
+    def _products(self, db: Session, family_id: Optional[int]):
+        query = db.query(models.Product.id, models.Product.name, models.Product.brand, models.Product.category, models.Product.last_price)
+        if family_id is not ALL_FAMILIES:
+            query = query.filter(models.Product.family_id == family_id)
+        return query
+
+    def _ids(self, db: Session, family_id: Optional[int]):
+        query = db.query(models.Product.id)
+        if family_id is not ALL_FAMILIES:
+            query = query.filter(models.Product.family_id == family_id)
+        return query
+
+    def _count(self, db: Session, family_id: Optional[int]) -> int:
+        query = db.query(func.count(models.Product.id))
+        if family_id is not ALL_FAMILIES:
+            query = query.filter(models.Product.family_id == family_id)
+        return query.scalar()
+
+    def _build(self, db: Session, family_id: Optional[int]) -> ProductIndex:
+        index = ProductIndex()
+        index.synced_at = tz_util.now().replace(tzinfo=None)
+        index.load(self._products(db, family_id).yield_per(5000))
+        index.checked_at = time.monotonic()
+        self.builds += 1
+        return index
+
+    def _refresh(self, db: Session, family_id: Optional[int], index: ProductIndex) -> bool:
+        """
+        Aplica los productos cambiados desde la última sincronización y quita los borrados
+        en otros workers. Devuelve False si aun así no cuadra (filas sin updated_at) y hay
+        que reconstruir.
+        """
+        synced_at = tz_util.now().replace(tzinfo=None)
+        changed = self._products(db, family_id).filter(models.Product.updated_at >= index.synced_at - REFRESH_OVERLAP).all()
+        total = self._count(db, family_id)
+        ids = None
+        with index.lock:
+            for row in changed:
+                index.put(row.id, row.name, row.brand, row.category, row.last_price)
+            complete = total == len(index.docs)
+        if not complete:
+            ids = {row.id for row in self._ids(db, family_id)}
+        with index.lock:
+            if ids is not None:
+                for product_id in [product_id for product_id in index.docs if product_id not in ids]:
+                    index.discard(product_id)
+                if len(ids) != len(index.docs):
+                    return False
+            index.synced_at = synced_at
+            index.checked_at = time.monotonic()
+        self.refreshes += 1
+        return True
+
+    def get(self, db: Session, family_id: Optional[int]) -> ProductIndex:
+        with self._lock:
+            index = self._indexes.get(family_id)
+            if index is not None:
+                self._indexes.move_to_end(family_id)
+        if index is not None and time.monotonic() - index.checked_at < self.ttl:
+            return index
+        if index is None or not self._refresh(db, family_id, index):
+            index = self._build(db, family_id)
+            with self._lock:
+                self._indexes[family_id] = index
+                self._indexes.move_to_end(family_id)
+                self._evict()
+        return index
+
+    def _evict(self):
+        # Con self._lock tomado. El índice recién usado (el último) nunca se expulsa
+        products = sum(len(index.docs) for index in self._indexes.values())
+        while len(self._indexes) > 1 and (len(self._indexes) > self.max_families or products > self.max_products):
+            _, index = self._indexes.popitem(last=False)
+            products -= len(index.docs)
+            self.evictions += 1
+
+    def search(self, db: Session, family_id: Optional[int], query: str, skip: int = 0, limit: int = 10):
+        """
+        Devuelve (ids de la página ordenados por relevancia, total de coincidencias).
+        La consulta se normaliza como nombres, marcas y categorías (normalize).
+        """
+        query = normalize(query)
+        if not query:
+            return [], 0
+        index = self.get(db, family_id)
+        with index.lock:
+            return index.search(query, skip, limit)
+
+    def suggest(self, db: Session, family_id: int, prefix: str, limit: int = 10) -> List[dict]:
+        """
+        Productos cuyo nombre empieza por prefix, en orden alfabético, con su último precio.
+        """
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        index = self.get(db, family_id)
+        with index.lock:
+            return index.suggest(prefix, limit)
+
+    def _loaded(self, family_id: Optional[int]):
+        with self._lock:
+            return [self._indexes[key] for key in (family_id, ALL_FAMILIES) if key in self._indexes]
+
+    def upsert_many(self, entries: List[ProductEntry]):
+        """
+        Llamar tras el commit con index_entry() de cada producto (tomado antes del commit
+        si el objeto va a quedar expirado). Solo se tocan los índices ya cargados.
+        """
+        for family_id, product_id, name, brand, category, last_price in entries:
+            for index in self._loaded(family_id):
+                with index.lock:
+                    index.put(product_id, name, brand, category, last_price)
+
+    def upsert(self, product: models.Product):
+        self.upsert_many([index_entry(product)])
+
+    def remove(self, family_id: Optional[int], product_id: int):
+        for index in self._loaded(family_id):
+            with index.lock:
+                index.discard(product_id)
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            indexes = list(self._indexes.items())
+        return {
+            "families": len(indexes),
+            "max_families": self.max_families,
+            "max_products": self.max_products,
+            "ttl": self.ttl,
+            "products": sum(len(index.docs) for _, index in indexes),
+            "builds": self.builds,
+            "refreshes": self.refreshes,
+            "evictions": self.evictions,
+        }
+
+
+product_index = ProductSearchIndex()
@@ -0,0 +1,106 @@
+import logging
+import os
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import List, Optional, Tuple
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# En modo debug se cuentan las sentencias de cada petición y se añaden las cabeceras X-DB-*
+SQL_DEBUG = os.getenv("SQL_DEBUG", "false").lower() in ("1", "true", "yes")
+# Una misma forma de sentencia repetida más veces que esto en una petición se marca como N+1
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "5"))
+# Fuera de debug, una petición puede pedir el conteo con esta cabecera si QUERY_STATS_OPT_IN
+# está activo (tests, staging); el conteo queda limitado a esa petición
+REQUEST_HEADER = "X-Count-Queries"
+OPT_IN = os.getenv("QUERY_STATS_OPT_IN", "false").lower() in ("1", "true", "yes")
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0.0
+        self.shapes: Counter = Counter()
+
+    def record(self, statement: str, duration: float):
+        self.count += 1
+        self.total_time += duration
+        # Los parámetros van aparte, así que el texto de la sentencia ya es su "forma"
+        self.shapes[statement] += 1
+
+    def suspected_n_plus_one(self, threshold: int = None) -> List[Tuple[str, int]]:
+        threshold = N_PLUS_ONE_THRESHOLD if threshold is None else threshold
+        return [(shape, n) for shape, n in self.shapes.most_common() if n > threshold]
+
+
+_current: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+enabled = SQL_DEBUG
+
+def wanted(headers) -> bool:
+    """
+    Si hay que contar las sentencias de la petición: siempre en debug, o a petición.
+    """
+    return enabled or (OPT_IN and headers.get(REQUEST_HEADER) == "1")
+
+def start() -> Tuple[QueryStats, object]:
+    stats = QueryStats()
+    return stats, _current.set(stats)
+
+def stop(token):
+    _current.reset(token)
+
+def current() -> Optional[QueryStats]:
+    return _current.get()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    if stats is None:
+        return
+    started = conn.info.get("query_start_time")
+    duration = time.perf_counter() - started.pop() if started else 0.0
+    stats.record(statement, duration)
+
+def install(engine):
+    """
+    Registra los hooks de conteo en un engine síncrono (para AsyncEngine usar .sync_engine).
+    """
+    if event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def apply_headers(response, stats: QueryStats, path: str):
+    response.headers["X-DB-Queries"] = str(stats.count)
+    response.headers["X-DB-Time"] = f"{stats.total_time * 1000:.2f}ms"
+    suspects = stats.suspected_n_plus_one()
+    if suspects:
+        response.headers["X-DB-N-Plus-One"] = str(len(suspects))
+        for shape, n in suspects:
+            logger.warning(f"Suspected N+1 on {path}: {n}x {shape[:200]}")
+
+
+def assert_max_queries(client, method: str, url: str, max_queries: int, **kwargs):
+    """
+    Helper de tests: pide el conteo con REQUEST_HEADER (requiere QUERY_STATS_OPT_IN o
+    SQL_DEBUG en la app) y falla si la petición supera max_queries. Devuelve la
+    respuesta para poder seguir comprobándola.
+    """
+    kwargs["headers"] = {**(kwargs.get("headers") or {}), REQUEST_HEADER: "1"}
+    response = client.request(method, url, **kwargs)
+    assert "X-DB-Queries" in response.headers, "query counting is off: set QUERY_STATS_OPT_IN=true"
+    count = int(response.headers["X-DB-Queries"])
+    assert count <= max_queries, (
+        f"{method.upper()} {url} executed {count} queries (max {max_queries}); "
+        f"suspected N+1 shapes: {response.headers.get('X-DB-N-Plus-One', 0)}"
+    )
+    return response
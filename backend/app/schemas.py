@@ -10,6 +10,14 @@ class Page(BaseModel, Generic[T]):
     page: int
     size: int
 
+class CursorPage(BaseModel, Generic[T]):
+    items: List[T]
+    size: int
+    next_cursor: Optional[str] = None
+    # Solo se calcula si se pide (include_total) o en modo por páginas
+    total: Optional[int] = None
+    page: Optional[int] = None
+
 
 # Forward references for circular dependencies
 class UserInDBBase(BaseModel):
@@ -67,6 +75,23 @@ class Product(ProductBase):
         from_attributes = True
 
 
+# Autocompletado: solo lo que muestra el desplegable de alta de ítems
+class ProductSuggestion(BaseModel):
+    id: int
+    name: str
+    last_price: Optional[float] = None
+
+
+class FacetCount(BaseModel):
+    value: str
+    count: int
+
+
+class ProductFacets(BaseModel):
+    categories: List[FacetCount]
+    brands: List[FacetCount]
+
+
 # ---------- LIST ITEMS ----------
 class ListItemBase(BaseModel):
     comentario: Optional[str] = None
@@ -115,6 +140,17 @@ class ListItemStatusUpdate(BaseModel):
     status: str
 
 
+class ListItemBatchChange(BaseModel):
+    id: int
+    status: Optional[str] = None
+    cantidad: Optional[float] = None
+    precio_confirmado: Optional[float] = None
+
+
+class ListItemsBatchUpdate(BaseModel):
+    items: List[ListItemBatchChange]
+
+
 # ---------- SHOPPING LIST ----------
 class ShoppingListBase(BaseModel):
     name: str
@@ -136,9 +172,19 @@ class ShoppingListUpdate(BaseModel):
     budget: Optional[float] = None
 
 
-class ShoppingList(ShoppingListBase):
+class ShoppingListCounters(BaseModel):
+    items_count: int = 0
+    pending_count: int = 0
+    purchased_count: int = 0
+    not_needed_count: int = 0
+    estimated_total: float = 0
+    purchased_total: float = 0
+
+
+class ShoppingList(ShoppingListBase, ShoppingListCounters):
     id: int
     owner_id: int
+    version: int = 0
     list_for_date: Optional[datetime] = None
     items: List[ListItem] = []
     calendar: Optional["Calendar"] = None
@@ -148,9 +194,12 @@ class ShoppingList(ShoppingListBase):
         from_attributes = True
 
 
-class ShoppingListResponse(ShoppingListBase):
+class ShoppingListResponse(ShoppingListBase, ShoppingListCounters):
     id: int
     owner_id: int
+    version: int = 0
+    # True si la lista está en shopping_lists_archive (solo lectura)
+    archived: bool = False
     list_for_date: Optional[datetime] = None
     calendar: Optional["Calendar"] = None
     budget: Optional[float] = None
@@ -159,6 +208,21 @@ class ShoppingListResponse(ShoppingListBase):
         from_attributes = True
 
 
+class ListChanges(ShoppingListCounters):
+    list_id: int
+    version: int
+    # Datos de la propia lista: sus cambios también suben la versión
+    name: str
+    notas: Optional[str] = None
+    comentarios: Optional[str] = None
+    status: Optional[str] = None
+    budget: Optional[float] = None
+    # True si la respuesta es la lista completa y el cliente debe reemplazar su copia
+    full: bool = False
+    items: List[ListItem] = []
+    deleted_ids: List[int] = []
+
+
 # ---------- FAMILY ----------
 class FamilyBase(BaseModel):
     nombre: str
@@ -335,10 +399,30 @@ class ListItemCreateBulk(BaseModel):
 class ListItemsBulkCreate(BaseModel):
     items: List[ListItemCreateBulk]
 
+class ListCloneResult(BaseModel):
+    item_ids: List[int]
+    count: int
+
 class BudgetDetails(BaseModel):
     total_estimado: float
     total_comprado: float
 
+class CalendarDaySummary(BaseModel):
+    day: date
+    list_count: int
+    item_count: int
+    purchased_count: int
+    estimated_total: float
+    over_budget_count: int
+    pending_lists: int
+    reviewed_lists: int
+    not_reviewed_lists: int
+
+class ListBudgetDetails(BudgetDetails):
+    list_id: int
+    budget: Optional[float] = None
+    over_budget: bool
+
 class SharedImage(BaseModel):
     id: int
     file_path: str
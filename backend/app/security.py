@@ -1,7 +1,13 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import timedelta
-from typing import Optional
+from typing import Optional, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
+from fastapi import HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from . import tz_util
 
@@ -9,15 +15,144 @@ SECRET_KEY = "your-secret-key"  # Debería estar en una variable de entorno
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 20160 # 14 days
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Coste de bcrypt. Al cambiarlo, los hashes existentes se regeneran en el siguiente login.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+# Executor dedicado para bcrypt: no compite con el threadpool de las peticiones
+PASSWORD_HASH_EXECUTOR = os.getenv("PASSWORD_HASH_EXECUTOR", "process")  # process | thread
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 2)))
+PASSWORD_HASH_QUEUE_LIMIT = int(os.getenv("PASSWORD_HASH_QUEUE_LIMIT", "64"))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# --- Trabajo de bcrypt (se ejecuta en los workers del executor) ---
+def _hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+def _verify_and_update(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+class PasswordHasher:
+    """
+    Executor acotado para bcrypt. Si hay más de queue_limit operaciones pendientes
+    rechaza de inmediato con 503 en lugar de encolar indefinidamente.
+    """
+
+    def __init__(self, kind: str = PASSWORD_HASH_EXECUTOR, workers: int = PASSWORD_HASH_WORKERS, queue_limit: int = PASSWORD_HASH_QUEUE_LIMIT):
+        self.kind = kind
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.rejected = 0
+        self.rehashed = 0
+        self.logins = 0
+        self.login_failures = 0
+        self.login_seconds_total = 0.0
+        self.login_seconds_max = 0.0
+        self._started = time.monotonic()
+
+    @property
+    def executor(self) -> Executor:
+        # Creación diferida: los workers solo arrancan con el primer hash
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    if self.kind == "thread":
+                        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+                    else:
+                        self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def _acquire(self):
+        with self._lock:
+            if self.in_flight >= self.queue_limit:
+                self.rejected += 1
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Password service busy, try again later",
+                    headers={"Retry-After": "1"},
+                )
+            self.in_flight += 1
+
+    def _release(self, _future=None):
+        with self._lock:
+            self.in_flight -= 1
+
+    def submit(self, fn, *args):
+        self._acquire()
+        try:
+            future = self.executor.submit(fn, *args)
+        except Exception:
+            self._release()
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    async def run(self, fn, *args):
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+    def record_rehash(self):
+        with self._lock:
+            self.rehashed += 1
+
+    def record_login(self, duration: float, success: bool):
+        with self._lock:
+            self.logins += 1
+            if not success:
+                self.login_failures += 1
+            self.login_seconds_total += duration
+            self.login_seconds_max = max(self.login_seconds_max, duration)
+
+    def stats(self) -> dict:
+        with self._lock:
+            uptime = time.monotonic() - self._started
+            return {
+                "executor": self.kind,
+                "workers": self.workers,
+                "queue_limit": self.queue_limit,
+                "in_flight": self.in_flight,
+                "rejected": self.rejected,
+                "rehashed": self.rehashed,
+                "bcrypt_rounds": BCRYPT_ROUNDS,
+                "logins": self.logins,
+                "login_failures": self.login_failures,
+                "logins_per_second": self.logins / uptime if uptime else 0.0,
+                "login_latency_avg_seconds": self.login_seconds_total / self.logins if self.logins else 0.0,
+                "login_latency_max_seconds": self.login_seconds_max,
+            }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+password_hasher = PasswordHasher()
+
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    valid, _ = verify_and_update_password(plain_password, hashed_password)
+    return valid
+
+def verify_and_update_password(plain_password, hashed_password) -> Tuple[bool, Optional[str]]:
+    return password_hasher.submit(_verify_and_update, plain_password, hashed_password).result()
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return password_hasher.submit(_hash_password, password).result()
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Devuelve (válida, nuevo_hash). nuevo_hash no es None cuando el hash guardado
+    usa otro coste y debe reemplazarse.
+    """
+    return await password_hasher.run(_verify_and_update, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    return await password_hasher.run(_hash_password, password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -27,4 +162,4 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
         expire = tz_util.now() + timedelta(minutes=15)
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
\ No newline at end of file
+    return encoded_jwt
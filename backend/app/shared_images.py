@@ -1,20 +1,23 @@
 import os
 import uuid
-import httpx
 from sqlalchemy.orm import Session
 from fastapi import UploadFile, HTTPException, status
 from typing import Optional
 
 from . import models
 from . import crud
+from . import metrics
 
 # Define the static directory for images
 # This should be configured appropriately for production
 STATIC_DIR = "static"
 IMAGES_SUBDIR = os.path.join(STATIC_DIR, "images")
 
-# Ensure the static directories exist
-os.makedirs(IMAGES_SUBDIR, exist_ok=True)
+def ensure_images_dir():
+    """
+    Ensures the static directories exist. Called once at startup instead of at import time.
+    """
+    os.makedirs(IMAGES_SUBDIR, exist_ok=True)
 
 async def save_image(db: Session, file: UploadFile, user_id: Optional[int] = None) -> models.SharedImage:
     # ... existing save_image implementation ...
@@ -53,11 +56,14 @@ async def save_image_from_url(db: Session, url: str, user_id: Optional[int] = No
     """
     Downloads an image from a URL, saves it to the static directory, and creates a database record.
     """
+    import httpx  # deferred: only needed when downloading images
+
     print(f"DEBUG: Starting download from URL: {url}")
     try:
         async with httpx.AsyncClient() as client:
             # Longer timeout for heavy downloads or slow servers
-            response = await client.get(url, timeout=60.0)
+            with metrics.observe_outbound("save_image_from_url"):
+                response = await client.get(url, timeout=60.0)
             response.raise_for_status()
             
             content_type = response.headers.get("content-type", "")
@@ -0,0 +1,277 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos para SQLite
+    fcntl = None
+
+from sqlalchemy import Date, DateTime, inspect, select, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateColumn, CreateIndex, CreateTable
+
+from . import crud, models
+
+logger = logging.getLogger(__name__)
+
+STARTUP_MAX_RETRIES = int(os.getenv("STARTUP_MAX_RETRIES", "10"))
+STARTUP_RETRY_BASE_DELAY = float(os.getenv("STARTUP_RETRY_BASE_DELAY", "0.5"))
+STARTUP_RETRY_MAX_DELAY = float(os.getenv("STARTUP_RETRY_MAX_DELAY", "10"))
+STARTUP_TARGET_SECONDS = float(os.getenv("STARTUP_TARGET_SECONDS", "2"))
+# Espera máxima por el cerrojo de migración (las correcciones de datos pueden tardar)
+SCHEMA_LOCK_TIMEOUT = int(os.getenv("SCHEMA_LOCK_TIMEOUT", "600"))
+SCHEMA_LOCK_NAME = "shopping_schema_migration"
+
+FINGERPRINT_KEY = "schema_fingerprint"
+# Pasos de _migrate que no se ven en el DDL: entran en el fingerprint para que las
+# bases ya migradas vuelvan a pasar por ellos al añadir uno
+MIGRATION_STEPS = ("add_missing_columns_and_indexes", "narrow_date_columns")
+
+
+class StartupTimer:
+    """
+    Acumula la duración de cada fase del arranque para poder reportarla.
+    """
+
+    def __init__(self, started_at: float):
+        self.started_at = started_at
+        self.phases: List[Tuple[str, float]] = []
+        self._last = started_at
+
+    def mark(self, phase: str):
+        now = time.perf_counter()
+        self.phases.append((phase, round(now - self._last, 4)))
+        self._last = now
+
+    def report(self) -> Dict:
+        total = round(self._last - self.started_at, 4)
+        return {
+            "phases": dict(self.phases),
+            "total_seconds": total,
+            "target_seconds": STARTUP_TARGET_SECONDS,
+            "within_target": total <= STARTUP_TARGET_SECONDS,
+        }
+
+
+def schema_fingerprint(engine) -> str:
+    """
+    Hash estable del DDL que generan los modelos para el dialecto del engine.
+    """
+    digest = hashlib.sha256()
+    for table in models.Base.metadata.sorted_tables:
+        digest.update(str(CreateTable(table).compile(dialect=engine.dialect)).encode())
+        for index in sorted(table.indexes, key=lambda i: i.name or ""):
+            digest.update(str(CreateIndex(index).compile(dialect=engine.dialect)).encode())
+    digest.update(repr(MIGRATION_STEPS).encode())
+    return digest.hexdigest()
+
+
+def _stored_fingerprint(engine):
+    table = models.SchemaInfo.__table__
+    with engine.connect() as conn:
+        # Primer arranque: la tabla schema_info todavía no existe
+        if not inspect(conn).has_table(table.name):
+            return None
+        return conn.execute(select(table.c.value).where(table.c.key == FINGERPRINT_KEY)).scalar()
+
+
+def _add_missing_columns_and_indexes(conn) -> List[str]:
+    """
+    create_all no toca tablas existentes: añade aquí las columnas e índices nuevos
+    de los modelos. Solo cambios aditivos; un índice se omite si ya hay otro
+    (o la PK) sobre las mismas columnas, aunque tenga otro nombre.
+    """
+    inspector = inspect(conn)
+    preparer = conn.dialect.identifier_preparer
+    applied = []
+    for table in models.Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+
+        existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing_columns:
+                column_ddl = CreateColumn(column).compile(dialect=conn.dialect)
+                conn.execute(text(f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {column_ddl}"))
+                applied.append(f"column {table.name}.{column.name}")
+
+        covered = {tuple(index["column_names"]) for index in inspector.get_indexes(table.name)}
+        covered.update(tuple(uc["column_names"]) for uc in inspector.get_unique_constraints(table.name))
+        covered.add(tuple(inspector.get_pk_constraint(table.name)["constrained_columns"]))
+        for index in table.indexes:
+            if tuple(column.name for column in index.columns) not in covered:
+                index.create(conn)
+                applied.append(f"index {index.name}")
+    return applied
+
+
+def _narrow_date_columns(conn) -> List[str]:
+    """
+    Columnas Date en el modelo que la base tiene como DATETIME (creadas antes de
+    cambiar el tipo, p. ej. shopping_lists.list_for_date): se quita la hora y, en
+    MySQL/MariaDB, se cambia el tipo. Quitar antes la hora evita que el ALTER trunque
+    datos (error en modo estricto). En SQLite el tipo es nominal: basta con los datos.
+    """
+    inspector = inspect(conn)
+    preparer = conn.dialect.identifier_preparer
+    applied = []
+    for table in models.Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"]: column["type"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if not isinstance(column.type, Date) or not isinstance(existing.get(column.name), DateTime):
+                continue
+            table_name = preparer.format_table(table)
+            column_name = preparer.format_column(column)
+            result = conn.execute(text(
+                f"UPDATE {table_name} SET {column_name} = DATE({column_name}) "
+                f"WHERE {column_name} IS NOT NULL AND {column_name} <> DATE({column_name})"
+            ))
+            if conn.dialect.name == "mysql":
+                column_ddl = CreateColumn(column).compile(dialect=conn.dialect)
+                conn.execute(text(f"ALTER TABLE {table_name} MODIFY {column_ddl}"))
+                applied.append(f"type {table.name}.{column.name} DATE ({result.rowcount} rows truncated)")
+            elif result.rowcount:
+                applied.append(f"data {table.name}.{column.name}: time removed from {result.rowcount} rows")
+    return applied
+
+
+@contextmanager
+def _schema_lock(engine):
+    """
+    Cerrojo entre procesos para la migración del arranque: con varios workers solo uno
+    aplica el DDL y las correcciones de datos, el resto espera. En MySQL/MariaDB es
+    GET_LOCK (se libera solo si la conexión cae); en SQLite, flock sobre <bd>.lock.
+    """
+    if engine.dialect.name == "mysql":
+        with engine.connect() as conn:
+            if not conn.execute(text("SELECT GET_LOCK(:name, :timeout)"), {"name": SCHEMA_LOCK_NAME, "timeout": SCHEMA_LOCK_TIMEOUT}).scalar():
+                raise RuntimeError(f"Timed out after {SCHEMA_LOCK_TIMEOUT}s waiting for the schema migration lock")
+            try:
+                yield
+            finally:
+                conn.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": SCHEMA_LOCK_NAME})
+        return
+    database = engine.url.database
+    if engine.dialect.name != "sqlite" or fcntl is None or not database or database == ":memory:":
+        yield
+        return
+    with open(f"{database}.lock", "w") as lock_file:
+        deadline = time.monotonic() + SCHEMA_LOCK_TIMEOUT
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"Timed out after {SCHEMA_LOCK_TIMEOUT}s waiting for the schema migration lock")
+                time.sleep(0.1)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _store_fingerprint(engine, fingerprint: str):
+    table = models.SchemaInfo.__table__
+    with engine.begin() as conn:
+        updated = conn.execute(
+            table.update().where(table.c.key == FINGERPRINT_KEY).values(value=fingerprint)
+        ).rowcount
+        if not updated:
+            conn.execute(table.insert().values(key=FINGERPRINT_KEY, value=fingerprint))
+
+
+def _ensure_schema(engine, fingerprint: str) -> bool:
+    """
+    Ejecuta create_all solo si el fingerprint guardado no coincide.
+    Devuelve True si se ejecutó DDL.
+    """
+    if _stored_fingerprint(engine) == fingerprint:
+        return False
+
+    with _schema_lock(engine):
+        # Otro worker puede haber migrado mientras se esperaba el cerrojo
+        if _stored_fingerprint(engine) == fingerprint:
+            return False
+        _migrate(engine)
+        # Al final: los workers que arranquen entretanto esperan a las correcciones de datos
+        _store_fingerprint(engine, fingerprint)
+    return True
+
+
+def _migrate(engine):
+    """
+    DDL aditivo y las correcciones de datos que dependen de él. Se llama con el cerrojo.
+    """
+    models.Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        changes = _add_missing_columns_and_indexes(conn) + _narrow_date_columns(conn)
+        for change in changes:
+            logger.info(f"Schema updated: {change}")
+
+    if "column shopping_lists.items_count" in changes:
+        # Columnas de contadores recién añadidas: arrancan en 0 hasta recalcularlas
+        db = Session(bind=engine)
+        try:
+            logger.info(f"Recomputed counters for {crud.recompute_list_counters(db)} lists")
+        finally:
+            db.close()
+    if "column products.normalized_name" in changes:
+        # Clave nueva: fusionar duplicados antes de rellenarla (índice único)
+        db = Session(bind=engine)
+        try:
+            logger.info(f"Merged duplicate products: {crud.merge_duplicate_products(db)}")
+        finally:
+            db.close()
+    db = Session(bind=engine)
+    try:
+        # Facetas vacías con productos: tabla recién creada o base cargada sin pasar por crud
+        if db.query(models.ProductFacet.family_id).first() is None and db.query(models.Product.id).first() is not None:
+            logger.info(f"Recomputed {crud.recompute_product_facets(db)} product facets")
+    finally:
+        db.close()
+
+
+async def run_startup(engine, timer: StartupTimer, prepare=None) -> Dict:
+    """
+    Arranque no bloqueante: el DDL corre en un hilo y los reintentos usan asyncio.sleep
+    con backoff exponencial en lugar de time.sleep.
+    """
+    # Tiempo entre el fin de los imports y el evento de arranque (servidor, middlewares)
+    timer.mark("server_boot")
+
+    if prepare is not None:
+        prepare()
+        timer.mark("prepare")
+
+    fingerprint = schema_fingerprint(engine)
+    timer.mark("fingerprint")
+
+    for attempt in range(1, STARTUP_MAX_RETRIES + 1):
+        try:
+            ddl_ran = await asyncio.to_thread(_ensure_schema, engine, fingerprint)
+            timer.mark("schema")
+            break
+        except OperationalError as e:
+            delay = min(STARTUP_RETRY_BASE_DELAY * 2 ** (attempt - 1), STARTUP_RETRY_MAX_DELAY)
+            logger.warning(f"Database connection failed: {e}. Retrying in {delay:.1f}s ({attempt}/{STARTUP_MAX_RETRIES})...")
+            await asyncio.sleep(delay)
+    else:
+        logger.error("Could not connect to the database. Exiting.")
+        raise SystemExit(1)
+
+    report = timer.report()
+    report["schema_changed"] = ddl_ran
+    if report["within_target"]:
+        logger.info(f"Startup completed in {report['total_seconds']}s (schema changed: {ddl_ran}): {report['phases']}")
+    else:
+        logger.warning(f"Startup took {report['total_seconds']}s (target {STARTUP_TARGET_SECONDS}s): {report['phases']}")
+    return report
@@ -7,3 +7,6 @@ def now():
     tz_str = os.environ.get('TZ', 'UTC')
     tz = pytz.timezone(tz_str)
     return datetime.datetime.now(tz)
+
+def today():
+    return now().date()
@@ -0,0 +1,13 @@
+"""
+HTTP benchmark suite for the backend hot paths.
+
+    cd backend
+    python -m benchmarks --family-size 4 --list-length 300 --concurrency 16 --requests 500 --output run.json
+
+By default the app is booted with uvicorn against a freshly seeded SQLite file;
+pass --url to drive an already running server (e.g. against MariaDB) seeded with --seed-only.
+
+For scale tests, benchmarks.datagen bulk-loads thousands of families with years of history:
+
+    python -m benchmarks.datagen --database-url sqlite:////tmp/scale.db --families 2000 --years 3
+"""
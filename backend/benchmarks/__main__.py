@@ -0,0 +1,134 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from dataclasses import asdict
+
+import httpx
+
+from .seed import Scenario
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Benchmark HTTP de las rutas calientes")
+    parser.add_argument("--family-size", type=int, default=4, help="usuarios en la familia")
+    parser.add_argument("--list-length", type=int, default=300, help="ítems en la lista de prueba")
+    parser.add_argument("--products", type=int, default=500, help="productos en el catálogo de la familia")
+    parser.add_argument("--notifications", type=int, default=200, help="notificaciones del primer usuario")
+    parser.add_argument("--concurrency", type=int, default=16, help="peticiones simultáneas por endpoint")
+    parser.add_argument("--requests", type=int, default=500, help="peticiones por endpoint")
+    parser.add_argument("--warmup", type=int, default=10, help="peticiones de calentamiento por endpoint")
+    parser.add_argument("--endpoints", help="lista separada por comas (por defecto todos)")
+    parser.add_argument("--seed", type=int, default=42, help="semilla del generador de datos")
+    parser.add_argument("--database-url", help="BD a sembrar (por defecto un SQLite temporal)")
+    parser.add_argument("--url", help="servidor ya arrancado; no se lanza uvicorn")
+    parser.add_argument("--workers", type=int, default=1, help="workers de uvicorn")
+    parser.add_argument("--bcrypt-rounds", type=int, default=12)
+    parser.add_argument("--seed-only", action="store_true", help="solo sembrar --database-url e imprimir los ids")
+    parser.add_argument("--output", help="fichero JSON de salida (por defecto stdout)")
+    return parser.parse_args(argv)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def uvicorn_server(database_url: str, workers: int, env_overrides: dict, startup_timeout: float = 60):
+    port = free_port()
+    env = dict(os.environ, DATABASE_URL=database_url, **env_overrides)
+    cmd = [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+           "--workers", str(workers), "--log-level", "warning", "--no-access-log"]
+    process = subprocess.Popen(cmd, cwd=BACKEND_DIR, env=env)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + startup_timeout
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with code {process.returncode}")
+            try:
+                if httpx.get(f"{base_url}/status", timeout=1).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError("uvicorn did not become ready in time")
+            time.sleep(0.2)
+        yield base_url
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    scenario = Scenario(family_size=args.family_size, list_length=args.list_length, products=args.products,
+                        notifications=args.notifications, seed=args.seed)
+
+    tmpdir = None
+    database_url = args.database_url
+    if database_url is None:
+        tmpdir = tempfile.TemporaryDirectory(prefix="bench-")
+        database_url = f"sqlite:///{os.path.join(tmpdir.name, 'bench.db')}"
+
+    # El servidor y el sembrado deben usar el mismo coste de bcrypt
+    server_env = {"BCRYPT_ROUNDS": str(args.bcrypt_rounds)}
+    os.environ.update(server_env)
+    os.environ.setdefault("DATABASE_URL", database_url)
+    sys.path.insert(0, BACKEND_DIR)
+    from .seed import seed_database
+    from .runner import run_suite
+
+    only = [name.strip() for name in args.endpoints.split(",")] if args.endpoints else None
+    try:
+        seed = seed_database(database_url, scenario)
+        if args.seed_only:
+            print(json.dumps(asdict(seed), indent=2))
+            return
+        if args.url:
+            results = asyncio.run(run_suite(args.url, seed, args.requests, args.concurrency, only, args.warmup))
+        else:
+            with uvicorn_server(database_url, args.workers, server_env) as base_url:
+                results = asyncio.run(run_suite(base_url, seed, args.requests, args.concurrency, only, args.warmup))
+    finally:
+        if tmpdir is not None:
+            tmpdir.cleanup()
+
+    report = {
+        "config": {
+            **asdict(scenario),
+            "concurrency": args.concurrency,
+            "requests_per_endpoint": args.requests,
+            "warmup": args.warmup,
+            "workers": args.workers,
+            "bcrypt_rounds": args.bcrypt_rounds,
+            "database": database_url.split(":", 1)[0],
+            "python": platform.python_version(),
+        },
+        "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "endpoints": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,352 @@
+"""
+Generador de datos sintéticos para pruebas de escala.
+
+    cd backend
+    python -m benchmarks.datagen --database-url sqlite:////tmp/scale.db --families 2000 --years 3
+
+Inserta directamente sobre las tablas Core de models.py con executemany por lotes
+y ids asignados en Python (sin round-trips para recuperar claves). Con la misma
+semilla, los mismos parámetros y la misma --end-date el resultado es idéntico.
+"""
+import argparse
+import bisect
+import math
+import os
+import random
+import sys
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from itertools import accumulate
+from typing import Dict, List, Optional
+
+from sqlalchemy import create_engine, func, select, text
+from sqlalchemy.orm import Session
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Tamaños de hogar aproximados (1 a 6 miembros)
+FAMILY_SIZE_WEIGHTS = [(1, 0.28), (2, 0.34), (3, 0.16), (4, 0.14), (5, 0.06), (6, 0.02)]
+
+CATALOGUE = {
+    "Lacteos": ["Leche", "Yogur", "Queso", "Mantequilla", "Crema", "Kefir"],
+    "Panaderia": ["Pan", "Tortillas", "Galletas", "Pan integral", "Bollos"],
+    "Frutas": ["Manzana", "Platano", "Naranja", "Uvas", "Fresas", "Pera", "Mango", "Limon"],
+    "Verduras": ["Tomate", "Cebolla", "Papa", "Zanahoria", "Lechuga", "Pimiento", "Ajo", "Calabacin"],
+    "Carnes": ["Pollo", "Carne molida", "Cerdo", "Jamon", "Salchichas", "Pescado"],
+    "Despensa": ["Arroz", "Frijoles", "Pasta", "Aceite", "Azucar", "Sal", "Harina", "Cafe", "Atun"],
+    "Bebidas": ["Agua", "Jugo", "Refresco", "Cerveza", "Te"],
+    "Limpieza": ["Detergente", "Jabon", "Cloro", "Papel higienico", "Suavizante", "Esponjas"],
+}
+BRANDS = ["La Granja", "Del Valle", "Casa", "Premium", "Economica", "Natural", None]
+VARIANTS = ["", " light", " grande", " familiar", " organico", " 1kg", " 500g", " pack"]
+QUANTITIES = [1, 1, 1, 1, 2, 2, 3, 0.5, 6]
+UNITS = [None, None, None, "kg", "l", "pz"]
+
+STATUS_COUNTERS = {"pendiente": "pending_count", "comprado": "purchased_count", "ya no se necesita": "not_needed_count"}
+COUNTER_COLUMNS = ["items_count", *STATUS_COUNTERS.values(), "estimated_total", "purchased_total"]
+
+# Orden de volcado: los padres siempre llegan antes que los hijos
+TABLE_ORDER = [
+    "users", "families", "user_families", "calendars", "products",
+    "shopping_lists", "list_items", "price_history", "blames", "notifications",
+]
+
+
+@dataclass
+class Config:
+    families: int = 100
+    years: float = 2.0
+    lists_per_week: float = 1.5
+    items_per_list: float = 18.0
+    products_per_family: int = 250
+    zipf_exponent: float = 1.1
+    price_history_rate: float = 0.3
+    item_notification_rate: float = 0.1
+    batch_size: int = 20000
+    seed: int = 1
+    end_date: Optional[date] = None
+
+
+class Buffers:
+    """
+    Acumula filas por tabla y las vuelca con executemany cuando se supera batch_size.
+    """
+
+    def __init__(self, conn, tables: Dict[str, object], batch_size: int):
+        self.conn = conn
+        self.tables = tables
+        self.batch_size = batch_size
+        self.rows: Dict[str, List[dict]] = {name: [] for name in TABLE_ORDER}
+        self.pending = 0
+        self.inserted: Dict[str, int] = {name: 0 for name in TABLE_ORDER}
+        self.started = time.perf_counter()
+
+    def add(self, table: str, row: dict):
+        self.rows[table].append(row)
+        self.pending += 1
+
+    def maybe_flush(self):
+        if self.pending >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        for name in TABLE_ORDER:
+            rows = self.rows[name]
+            if rows:
+                self.conn.execute(self.tables[name].insert(), rows)
+                self.inserted[name] += len(rows)
+                self.rows[name] = []
+        self.conn.commit()
+        self.pending = 0
+        total = sum(self.inserted.values())
+        elapsed = time.perf_counter() - self.started
+        print(f"  {total:>12,} rows  {elapsed:8.1f}s  {total / elapsed if elapsed else 0:,.0f} rows/s", file=sys.stderr)
+
+
+class IdAllocator:
+    def __init__(self, conn, tables: Dict[str, object]):
+        # Se continúa después del máximo actual para poder generar sobre una BD con datos
+        self.next_ids = {}
+        for name, table in tables.items():
+            if "id" in table.c:
+                self.next_ids[name] = (conn.execute(select(func.max(table.c.id))).scalar() or 0) + 1
+
+    def __call__(self, table: str) -> int:
+        value = self.next_ids[table]
+        self.next_ids[table] = value + 1
+        return value
+
+
+def zipf_cum_weights(n: int, exponent: float) -> List[float]:
+    return list(accumulate(1.0 / (rank ** exponent) for rank in range(1, n + 1)))
+
+
+def weighted_index(rng: random.Random, cum_weights: List[float]) -> int:
+    return bisect.bisect(cum_weights, rng.random() * cum_weights[-1])
+
+
+def lognormal_count(rng: random.Random, mean: float, sigma: float = 0.5) -> int:
+    # mu ajustado para que la media de la lognormal sea `mean`
+    mu = math.log(mean) - sigma * sigma / 2
+    return max(1, int(round(rng.lognormvariate(mu, sigma))))
+
+
+def generate(conn, tables: Dict[str, object], config: Config, hashed_password: str) -> Dict[str, int]:
+    from app.models import normalize_product_name
+
+    rng = random.Random(config.seed)
+    next_id = IdAllocator(conn, tables)
+    buffers = Buffers(conn, tables, config.batch_size)
+
+    end = datetime.combine(config.end_date or date.today(), datetime.min.time())
+    start = end - timedelta(days=int(config.years * 365))
+    span_seconds = (end - start).total_seconds()
+
+    sizes, size_weights = zip(*FAMILY_SIZE_WEIGHTS)
+    size_cum = list(accumulate(size_weights))
+    # Todas las familias comparten la misma curva de popularidad; cambia qué producto ocupa cada rango
+    popularity = zipf_cum_weights(config.products_per_family, config.zipf_exponent)
+    base_names = [(category, name) for category, names in CATALOGUE.items() for name in names]
+    yearly_inflation = 0.06
+
+    for _ in range(config.families):
+        family_size = sizes[bisect.bisect(size_cum, rng.random() * size_cum[-1])]
+        joined_at = start + timedelta(seconds=rng.random() * span_seconds * 0.2)
+
+        member_ids = []
+        for _ in range(family_size):
+            user_id = next_id("users")
+            member_ids.append(user_id)
+            buffers.add("users", {
+                "id": user_id, "email": f"user{user_id}@example.com", "username": f"user{user_id}",
+                "hashed_password": hashed_password, "is_admin": False, "nombre": f"Usuario {user_id}",
+                "created_at": joined_at,
+            })
+
+        family_id = next_id("families")
+        buffers.add("families", {
+            "id": family_id, "code": f"F{family_id:09d}", "nombre": f"Familia {family_id}",
+            "owner_id": member_ids[0], "created_at": joined_at,
+        })
+        for user_id in member_ids:
+            buffers.add("user_families", {"user_id": user_id, "family_id": family_id})
+
+        calendar_ids = []
+        for n in range(1 if rng.random() < 0.8 else 2):
+            calendar_id = next_id("calendars")
+            calendar_ids.append(calendar_id)
+            buffers.add("calendars", {
+                "id": calendar_id, "nombre": "Compras" if n == 0 else "Extras", "family_id": family_id,
+                "owner_id": member_ids[0], "created_at": joined_at,
+            })
+
+        # Catálogo de la familia ordenado por popularidad (índice 0 = el más comprado)
+        products = []
+        for rank in range(config.products_per_family):
+            category, name = base_names[rng.randrange(len(base_names))]
+            base_price = round(rng.uniform(0.5, 25.0), 2)
+            last_price = round(base_price * (1 + yearly_inflation) ** config.years, 2)
+            product_id = next_id("products")
+            products.append((product_id, f"{name}{rng.choice(VARIANTS)} #{rank}", base_price, last_price))
+            buffers.add("products", {
+                "id": product_id, "name": products[-1][1], "normalized_name": normalize_product_name(products[-1][1]),
+                "category": category, "brand": rng.choice(BRANDS),
+                "family_id": family_id, "last_price": last_price,
+                "created_at": joined_at, "updated_at": joined_at,
+            })
+
+        # Actividad heterogénea: unas familias compran mucho más que otras
+        weekly_rate = config.lists_per_week * rng.lognormvariate(-0.125, 0.5)
+        active_days = (end - joined_at).days
+        list_count = max(1, int(weekly_rate * active_days / 7))
+
+        for list_date in sorted(joined_at + timedelta(seconds=rng.random() * (end - joined_at).total_seconds()) for _ in range(list_count)):
+            is_recent = (end - list_date).days < 14
+            owner_id = rng.choice(member_ids)
+            created_at = list_date - timedelta(hours=rng.randint(1, 72))
+            list_id = next_id("shopping_lists")
+            counters = dict.fromkeys(COUNTER_COLUMNS, 0)
+            buffers.add("shopping_lists", counters)
+            counters.update({
+                "id": list_id, "name": f"Compra {list_date:%d/%m/%Y}",
+                "status": "pendiente" if is_recent else rng.choice(["revisada", "revisada", "no revisada"]),
+                "budget": round(rng.uniform(50, 400), 0) if rng.random() < 0.6 else None,
+                "calendar_id": rng.choice(calendar_ids), "owner_id": owner_id,
+                "list_for_date": list_date.date(), "created_at": created_at,
+            })
+            buffers.add("blames", {
+                "id": next_id("blames"), "user_id": owner_id, "action": "create", "entity_type": "lista",
+                "entity_id": list_id, "timestamp": created_at, "detalles": "Lista creada.",
+            })
+            for user_id in member_ids:
+                if user_id != owner_id:
+                    buffers.add("notifications", {
+                        "id": next_id("notifications"), "user_id": user_id, "family_id": family_id,
+                        "message": f"user{owner_id} ha creado la lista 'Compra {list_date:%d/%m/%Y}'.",
+                        "is_read": not is_recent, "created_at": created_at, "created_by_id": owner_id,
+                        "link": f"/shopping-list/{list_id}",
+                    })
+
+            price_factor = (1 + yearly_inflation) ** ((list_date - start).days / 365)
+            for _ in range(lognormal_count(rng, config.items_per_list)):
+                product_id, product_name, base_price, last_price = products[weighted_index(rng, popularity)]
+                creator_id = rng.choice(member_ids)
+                item_created = created_at + timedelta(minutes=rng.randint(0, 600))
+                estimated = round(base_price * price_factor, 2)
+                roll = rng.random()
+                status = "pendiente" if is_recent or roll < 0.05 else ("ya no se necesita" if roll < 0.13 else "comprado")
+                confirmed = round(estimated * rng.uniform(0.9, 1.15), 2) if status == "comprado" else None
+                quantity = rng.choice(QUANTITIES)
+                # Mismo criterio que crud._item_counters
+                amount = (confirmed if confirmed is not None else last_price) * quantity
+                counters["items_count"] += 1
+                counters[STATUS_COUNTERS[status]] += 1
+                counters["estimated_total"] += amount
+                if status == "comprado":
+                    counters["purchased_total"] += amount
+                item_id = next_id("list_items")
+                buffers.add("list_items", {
+                    "id": item_id, "list_id": list_id, "product_id": product_id, "nombre": product_name,
+                    "cantidad": quantity, "unit": rng.choice(UNITS), "status": status,
+                    "precio_estimado": estimated, "precio_confirmado": confirmed,
+                    "creado_por_id": creator_id, "created_at": item_created,
+                })
+                buffers.add("blames", {
+                    "id": next_id("blames"), "user_id": creator_id, "action": "create", "entity_type": "item",
+                    "entity_id": item_id, "timestamp": item_created,
+                    "detalles": f"Producto '{product_name}' agregado a la lista.",
+                })
+                if status != "pendiente":
+                    buffers.add("blames", {
+                        "id": next_id("blames"), "user_id": creator_id, "action": "update", "entity_type": "item",
+                        "entity_id": item_id, "timestamp": list_date,
+                        "detalles": f"Estado del producto '{product_name}' cambiado de 'pendiente' a '{status}'.",
+                    })
+                if confirmed is not None and rng.random() < config.price_history_rate:
+                    buffers.add("price_history", {
+                        "id": next_id("price_history"), "product_id": product_id, "price": confirmed, "created_at": list_date,
+                    })
+                if rng.random() < config.item_notification_rate:
+                    for user_id in member_ids:
+                        if user_id != creator_id:
+                            buffers.add("notifications", {
+                                "id": next_id("notifications"), "user_id": user_id, "family_id": family_id,
+                                "message": f"user{creator_id} ha agregado el producto '{product_name}' a la lista.",
+                                "is_read": not is_recent, "created_at": item_created, "created_by_id": creator_id,
+                                "link": f"/shopping-list/{list_id}",
+                            })
+            buffers.maybe_flush()
+
+    buffers.flush()
+    return buffers.inserted
+
+
+def _tune_connection(conn):
+    # Solo afecta a esta conexión de carga
+    dialect = conn.dialect.name
+    if dialect == "sqlite":
+        conn.execute(text("PRAGMA synchronous=OFF"))
+        conn.execute(text("PRAGMA journal_mode=WAL"))
+    elif dialect in ("mysql", "mariadb"):
+        conn.execute(text("SET unique_checks=0, foreign_key_checks=0"))
+
+
+def parse_args(argv=None):
+    defaults = Config()
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.datagen", description="Genera un dataset sintético a escala")
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"), help="por defecto $DATABASE_URL")
+    parser.add_argument("--families", type=int, default=defaults.families)
+    parser.add_argument("--years", type=float, default=defaults.years, help="años de historial")
+    parser.add_argument("--lists-per-week", type=float, default=defaults.lists_per_week, help="media por familia")
+    parser.add_argument("--items-per-list", type=float, default=defaults.items_per_list, help="media (lognormal)")
+    parser.add_argument("--products-per-family", type=int, default=defaults.products_per_family)
+    parser.add_argument("--zipf-exponent", type=float, default=defaults.zipf_exponent, help="sesgo de popularidad de productos")
+    parser.add_argument("--price-history-rate", type=float, default=defaults.price_history_rate)
+    parser.add_argument("--item-notification-rate", type=float, default=defaults.item_notification_rate)
+    parser.add_argument("--batch-size", type=int, default=defaults.batch_size)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument("--end-date", type=date.fromisoformat, help="fecha final del historial (YYYY-MM-DD, por defecto hoy)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.database_url:
+        raise SystemExit("--database-url or DATABASE_URL is required")
+    config = Config(
+        families=args.families, years=args.years, lists_per_week=args.lists_per_week,
+        items_per_list=args.items_per_list, products_per_family=args.products_per_family,
+        zipf_exponent=args.zipf_exponent, price_history_rate=args.price_history_rate,
+        item_notification_rate=args.item_notification_rate, batch_size=args.batch_size,
+        seed=args.seed, end_date=args.end_date,
+    )
+
+    os.environ.setdefault("DATABASE_URL", args.database_url)
+    sys.path.insert(0, BACKEND_DIR)
+    from app import crud, models, security
+
+    engine = create_engine(args.database_url)
+    models.Base.metadata.create_all(bind=engine)
+    tables = {name: models.Base.metadata.tables[name] for name in TABLE_ORDER}
+    # Un único hash para todos los usuarios: la contraseña es "password"
+    hashed_password = security.pwd_context.hash("password")
+
+    started = time.perf_counter()
+    with engine.connect() as conn:
+        _tune_connection(conn)
+        inserted = generate(conn, tables, config, hashed_password)
+    # Las facetas de categoría y marca no se mantienen en estas inserciones directas
+    with Session(engine) as db:
+        crud.recompute_product_facets(db)
+    engine.dispose()
+
+    elapsed = time.perf_counter() - started
+    total = sum(inserted.values())
+    for name in TABLE_ORDER:
+        print(f"{name:>16}: {inserted[name]:>12,}")
+    print(f"{'total':>16}: {total:>12,} rows in {elapsed:.1f}s ({total / elapsed if elapsed else 0:,.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+from .seed import PASSWORD, SeedResult
+
+RequestFactory = Callable[[httpx.AsyncClient, int], Awaitable[httpx.Response]]
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    # Nearest-rank: sin interpolación, así p99 es siempre una latencia observada
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100.0 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> dict:
+    ordered = sorted(latencies)
+    total = len(latencies) + errors
+    return {
+        "requests": total,
+        "errors": errors,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 2) if ordered else 0.0,
+        "p50_ms": round(percentile(ordered, 50) * 1000, 2),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 2),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 2),
+        "max_ms": round(ordered[-1] * 1000, 2) if ordered else 0.0,
+    }
+
+
+async def drive(client: httpx.AsyncClient, make_request: RequestFactory, total: int, concurrency: int) -> dict:
+    """
+    Lanza `total` peticiones con `concurrency` workers en paralelo. Las respuestas
+    con status >= 400 o las excepciones de red cuentan como errores y no entran en las latencias.
+    """
+    latencies: List[float] = []
+    errors = 0
+    counter = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            started = time.perf_counter()
+            try:
+                response = await make_request(client, i)
+                ok = response.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - started)
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+async def login(client: httpx.AsyncClient, username: str) -> str:
+    response = await client.post("/token", data={"username": username, "password": PASSWORD})
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+def hot_endpoints(seed: SeedResult, tokens: List[str]) -> Dict[str, RequestFactory]:
+    """
+    Rutas calientes de la app. Cada petición rota el usuario de la familia
+    para que la caché de principals y el read-your-writes se comporten como en producción.
+    """
+    def auth(i: int) -> dict:
+        return {"Authorization": f"Bearer {tokens[i % len(tokens)]}"}
+
+    def item_id(i: int) -> int:
+        return seed.item_ids[i % len(seed.item_ids)]
+
+    list_id, family_id = seed.list_id, seed.family_id
+
+    return {
+        "login": lambda c, i: c.post("/token", data={"username": seed.usernames[i % len(seed.usernames)], "password": PASSWORD}),
+        "list_items": lambda c, i: c.get(f"/listas/{list_id}/items", params={"page": 1 + i % 5, "size": 50}, headers=auth(i)),
+        "list_items_cursor": lambda c, i: c.get(f"/listas/{list_id}/items", params={"size": 50}, headers=auth(i)),
+        "list_items_filtered": lambda c, i: c.get(f"/listas/{list_id}/items", params={"status": "pendiente", "size": 50}, headers=auth(i)),
+        "get_list": lambda c, i: c.get(f"/listas/{list_id}", headers=auth(i)),
+        "budget_details": lambda c, i: c.get(f"/listas/{list_id}/budget-details", headers=auth(i)),
+        "filter_options": lambda c, i: c.get(f"/listas/{list_id}/filter-options", headers=auth(i)),
+        "family_filters": lambda c, i: c.get(f"/families/{family_id}/filters", headers=auth(i)),
+        "create_item": lambda c, i: c.post("/items/", json={"nombre": f"Producto {i % 700:05d}", "cantidad": 1, "list_id": list_id}, headers=auth(i)),
+        "update_item": lambda c, i: c.put(f"/items/{item_id(i)}", json={"status": "comprado" if i % 2 else "pendiente"}, headers=auth(i)),
+        "product_search": lambda c, i: c.get("/products/search", params={"family_id": family_id, "q": seed.product_terms[i % len(seed.product_terms)]}, headers=auth(i)),
+        "family_products": lambda c, i: c.get(f"/families/{family_id}/products", params={"page": 1 + i % 5, "size": 20}, headers=auth(i)),
+        "notifications": lambda c, i: c.get("/notifications", headers=auth(i)),
+        "previous_lists": lambda c, i: c.get(f"/families/{family_id}/previous_lists", headers=auth(i)),
+    }
+
+
+async def run_suite(base_url: str, seed: SeedResult, requests_per_endpoint: int, concurrency: int,
+                    only: Optional[List[str]] = None, warmup: int = 10) -> Dict[str, dict]:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        tokens = [await login(client, username) for username in seed.usernames]
+        endpoints = hot_endpoints(seed, tokens)
+        if only:
+            unknown = set(only) - set(endpoints)
+            if unknown:
+                raise ValueError(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+            endpoints = {name: endpoints[name] for name in only}
+
+        results = {}
+        # Los endpoints se miden por separado para que los números sean comparables entre ejecuciones
+        for name, make_request in endpoints.items():
+            if warmup:
+                await drive(client, make_request, warmup, min(concurrency, warmup))
+            results[name] = await drive(client, make_request, requests_per_endpoint, concurrency)
+        return results
@@ -0,0 +1,154 @@
+import random
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+CATEGORIES = ["Lacteos", "Panaderia", "Frutas", "Verduras", "Carnes", "Limpieza", "Bebidas", "Despensa"]
+BRANDS = ["Marca A", "Marca B", "Marca C", "Marca D", "Generica"]
+PASSWORD = "benchmark"
+SEED_FAMILY_CODE = "BENCH001"
+PRODUCT_TERMS = ["prod", "0001", "lac", "marca"]
+
+
+@dataclass
+class Scenario:
+    family_size: int = 4
+    list_length: int = 300
+    products: int = 500
+    notifications: int = 200
+    seed: int = 42
+
+
+@dataclass
+class SeedResult:
+    family_id: int
+    list_id: int
+    usernames: List[str]
+    item_ids: List[int]
+    product_terms: List[str] = field(default_factory=list)
+
+
+def _existing_seed(db, models, scenario: Scenario) -> Optional[SeedResult]:
+    """
+    Datos de una siembra anterior en la misma base, o None. Si no corresponden al
+    escenario pedido se aborta en vez de medir otro volumen de datos.
+    """
+    family = db.query(models.Family).filter(models.Family.code == SEED_FAMILY_CODE).first()
+    if family is None:
+        return None
+    users = sorted(family.users, key=lambda user: user.id)
+    shopping_list = db.query(models.ShoppingList).join(models.Calendar).filter(
+        models.Calendar.family_id == family.id
+    ).order_by(models.ShoppingList.id).first()
+    products = db.query(models.Product).filter(models.Product.family_id == family.id).count()
+    # create_item añade ítems en cada ejecución: se usan los sembrados, los primeros
+    item_ids = [] if shopping_list is None else [row.id for row in db.query(models.ListItem.id).filter(
+        models.ListItem.list_id == shopping_list.id
+    ).order_by(models.ListItem.id).limit(scenario.list_length)]
+    if len(users) != scenario.family_size or products != scenario.products or len(item_ids) != scenario.list_length:
+        raise RuntimeError(
+            f"La base ya tiene una siembra con otro escenario ({len(users)} usuarios, {products} productos, "
+            f"{len(item_ids)} ítems): usa otra --database-url"
+        )
+    return SeedResult(
+        family_id=family.id,
+        list_id=shopping_list.id,
+        usernames=[user.username for user in users],
+        item_ids=item_ids,
+        product_terms=PRODUCT_TERMS,
+    )
+
+
+def seed_database(database_url: str, scenario: Scenario) -> SeedResult:
+    """
+    Crea el esquema y una familia con un calendario, una lista de list_length ítems,
+    un catálogo de productos y notificaciones para el primer usuario. Si la base ya
+    está sembrada (segunda ejecución con --database-url) reutiliza esos datos.
+    """
+    # Importación diferida: DATABASE_URL/BCRYPT_ROUNDS deben estar fijados antes
+    from app import crud, models, security
+
+    rng = random.Random(scenario.seed)
+    engine = create_engine(database_url)
+    models.Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    db = Session()
+    try:
+        existing = _existing_seed(db, models, scenario)
+        if existing is not None:
+            return existing
+
+        hashed_password = security.pwd_context.hash(PASSWORD)
+        users = []
+        for i in range(scenario.family_size):
+            users.append(models.User(
+                email=f"bench{i}@example.com",
+                username=f"bench{i}",
+                hashed_password=hashed_password,
+                is_admin=(i == 0),
+                nombre=f"Bench {i}",
+            ))
+        db.add_all(users)
+        db.flush()
+
+        family = models.Family(code=SEED_FAMILY_CODE, nombre="Benchmark", owner_id=users[0].id)
+        family.users.extend(users)
+        db.add(family)
+        db.flush()
+
+        calendar = models.Calendar(nombre="Benchmark", family_id=family.id, owner_id=users[0].id)
+        db.add(calendar)
+        db.flush()
+
+        products = []
+        for i in range(scenario.products):
+            products.append(models.Product(
+                name=f"Producto {i:05d}",
+                category=rng.choice(CATEGORIES),
+                brand=rng.choice(BRANDS),
+                family_id=family.id,
+                last_price=round(rng.uniform(0.5, 30), 2),
+            ))
+        db.add_all(products)
+        db.flush()
+
+        shopping_list = models.ShoppingList(name="Benchmark", calendar_id=calendar.id, owner_id=users[0].id, budget=500)
+        db.add(shopping_list)
+        db.flush()
+
+        items = []
+        for i in range(scenario.list_length):
+            product = rng.choice(products)
+            items.append(models.ListItem(
+                list_id=shopping_list.id,
+                product_id=product.id,
+                nombre=product.name,
+                cantidad=rng.randint(1, 5),
+                status=rng.choice(["pendiente", "pendiente", "comprado"]),
+                creado_por_id=rng.choice(users).id,
+            ))
+        db.add_all(items)
+
+        for i in range(scenario.notifications):
+            db.add(models.Notification(
+                user_id=users[0].id,
+                family_id=family.id,
+                message=f"Notificación {i}",
+                created_by_id=users[-1].id,
+            ))
+        db.commit()
+        crud.recompute_list_counters(db, [shopping_list.id])
+        crud.recompute_product_facets(db, [family.id])
+
+        return SeedResult(
+            family_id=family.id,
+            list_id=shopping_list.id,
+            usernames=[u.username for u in users],
+            item_ids=[i.id for i in items],
+            product_terms=PRODUCT_TERMS,
+        )
+    finally:
+        db.close()
+        engine.dispose()
@@ -0,0 +1,117 @@
+"""
+Los tests arrancan la app en proceso contra un SQLite temporal. El entorno se fija
+aquí, antes de importar app, porque database.py lee DATABASE_URL al importarse.
+
+La réplica de lectura es un segundo fichero SQLite que solo se pone al día cuando
+el test llama a replicate(): entre medias simula el retraso de replicación.
+
+    cd backend
+    python -m pytest tests
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TMP_DIR = tempfile.mkdtemp(prefix="shopping-tests-")
+
+PRIMARY_PATH = os.path.join(TMP_DIR, "primary.db")
+REPLICA_PATH = os.path.join(TMP_DIR, "replica.db")
+
+os.environ["DATABASE_URL"] = f"sqlite:///{PRIMARY_PATH}"
+os.environ["DATABASE_READ_URL"] = f"sqlite:///{REPLICA_PATH}"
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+os.environ["QUERY_STATS_OPT_IN"] = "true"
+# Las revocaciones de otros workers se aplican cuando el test llama a principal_cache.sync()
+os.environ["PRINCIPAL_CACHE_SYNC"] = "3600"
+sys.path.insert(0, BACKEND_DIR)
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app.main import app  # noqa: E402
+
+PASSWORD = "password"
+
+
+def replicate():
+    """
+    Copia el primario sobre la réplica (API de backup de SQLite).
+    """
+    source = sqlite3.connect(PRIMARY_PATH)
+    target = sqlite3.connect(REPLICA_PATH)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(app) as test_client:
+        # La réplica arranca con el esquema creado en el startup
+        replicate()
+        yield test_client
+
+
+def login(client, username: str) -> dict:
+    response = client.post("/token", data={"username": username, "password": PASSWORD})
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture(scope="session")
+def admin(client):
+    """
+    Administrador creado con /setup, su familia y un calendario.
+    """
+    response = client.post("/setup", json={
+        "admin": {"email": "admin@example.com", "username": "admin", "password": PASSWORD, "nombre": "Admin"},
+        "family": {"nombre": "Tests"},
+    })
+    assert response.status_code == 200, response.text
+    headers = login(client, "admin")
+    family_id = client.get("/families/my", headers=headers).json()[0]["id"]
+    calendar = client.post(f"/families/{family_id}/calendars", json={"nombre": "Tests"}, headers=headers).json()
+    return {"headers": headers, "family_id": family_id, "calendar_id": calendar["id"]}
+
+
+@pytest.fixture
+def make_family(client, admin):
+    """
+    Crea una familia nueva del administrador: datos aislados del resto de tests.
+    """
+    def make(nombre: str) -> int:
+        response = client.post("/families", json={"nombre": nombre}, headers=admin["headers"])
+        assert response.status_code == 200, response.text
+        return response.json()["id"]
+
+    return make
+
+
+@pytest.fixture
+def make_list(client, admin):
+    """
+    Crea una lista con n ítems, cada uno con su producto (con precio) y su autor.
+    """
+    created = []
+
+    def make(n_items: int) -> int:
+        headers = admin["headers"]
+        list_id = client.post("/listas/", json={
+            "name": f"Lista {len(created)}", "calendar_id": admin["calendar_id"], "list_for_date": "2026-10-01",
+        }, headers=headers).json()["id"]
+        prefix = f"Producto {list_id}"
+        response = client.post(f"/listas/{list_id}/items/bulk", json={
+            "items": [{"nombre": f"{prefix}-{i}", "cantidad": 1 + i % 3, "category": f"Cat {i % 4}"} for i in range(n_items)],
+        }, headers=headers)
+        assert response.status_code == 200, response.text
+        for item in response.json()[::2]:
+            client.put(f"/items/{item['id']}", json={"status": "comprado", "precio_confirmado": 1.5}, headers=headers)
+        created.append(list_id)
+        return list_id
+
+    return make
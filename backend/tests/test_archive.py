@@ -0,0 +1,85 @@
+"""
+Archivo de listas antiguas (archive.archive_lists): los lotes mueven listas, ítems y
+blames a las tablas de archivo y la API sigue devolviéndolos desde allí.
+"""
+import datetime
+
+from sqlalchemy import func, or_, select
+
+from app import archive, models
+from app.database import SessionLocal
+
+from conftest import replicate
+
+CUTOFF = datetime.date(2021, 1, 1)
+
+
+def hot_rows(db, list_ids, item_ids) -> dict:
+    blames = models.Blame
+    return {
+        "shopping_lists": db.query(models.ShoppingList).filter(models.ShoppingList.id.in_(list_ids)).count(),
+        "list_items": db.query(models.ListItem).filter(models.ListItem.list_id.in_(list_ids)).count(),
+        "blames": db.query(blames).filter(or_(
+            (blames.entity_type == "lista") & blames.entity_id.in_(list_ids),
+            (blames.entity_type == "item") & blames.entity_id.in_(item_ids),
+        )).count(),
+        "list_item_tombstones": db.query(models.ListItemTombstone).filter(models.ListItemTombstone.list_id.in_(list_ids)).count(),
+    }
+
+
+def test_archived_lists_leave_the_hot_tables_and_stay_readable(client, admin, make_family):
+    headers = admin["headers"]
+    family_id = make_family("Archivo")
+    calendar_id = client.post(f"/families/{family_id}/calendars", json={"nombre": "Archivo"}, headers=headers).json()["id"]
+
+    def create_list(name: str, day: str, names) -> tuple:
+        list_id = client.post("/listas/", json={"name": name, "calendar_id": calendar_id, "list_for_date": day}, headers=headers).json()["id"]
+        response = client.post(f"/listas/{list_id}/items/bulk", json={"items": [{"nombre": n, "cantidad": 1} for n in names]}, headers=headers)
+        assert response.status_code == 200, response.text
+        return list_id, [item["id"] for item in response.json()]
+
+    old_ids = []
+    old_items = []
+    for day in ("2020-03-01", "2020-06-01"):
+        list_id, item_ids = create_list(f"Compra {day}", day, ["Arroz", "Lentejas", "Aceite"])
+        old_ids.append(list_id)
+        old_items += item_ids
+    # Un ítem borrado deja un tombstone, que se descarta al archivar
+    assert client.delete(f"/items/{old_items[-1]}", headers=headers).status_code == 200
+    old_items.pop()
+    recent_id, _ = create_list("Compra reciente", datetime.date.today().isoformat(), ["Pan"])
+
+    db = SessionLocal()
+    try:
+        before = hot_rows(db, old_ids, old_items)
+        assert before["blames"] > 0 and before["list_item_tombstones"] == 1
+        report = archive.archive_report(db, CUTOFF)
+        assert {name: report["tables"][name]["rows"] for name in before} == before
+
+        # Lotes de una lista: varias transacciones de mover y borrar
+        moved = archive.archive_lists(db, CUTOFF, batch_size=1)
+        assert {name: moved[name] for name in before} == before
+        assert hot_rows(db, old_ids, old_items) == dict.fromkeys(before, 0)
+
+        archived_items = db.execute(
+            select(func.count()).select_from(models.list_items_archive).where(models.list_items_archive.c.list_id.in_(old_ids))
+        ).scalar()
+        assert archived_items == len(old_items)
+        assert db.query(models.ShoppingList).filter(models.ShoppingList.id == recent_id).count() == 1
+    finally:
+        db.close()
+    replicate()
+
+    response = client.get(f"/families/{family_id}/previous_lists", params={"size": 10}, headers=headers)
+    assert response.status_code == 200, response.text
+    page = response.json()
+    assert page["total"] == 3
+    assert {(entry["id"], entry["archived"]) for entry in page["items"]} == {(recent_id, False), *((list_id, True) for list_id in old_ids)}
+
+    for list_id in old_ids:
+        response = client.get(f"/listas/{list_id}", headers=headers)
+        assert response.status_code == 200, response.text
+        response = client.get(f"/listas/{list_id}/items", params={"size": 10}, headers=headers)
+        assert response.status_code == 200, response.text
+    items = client.get(f"/listas/{old_ids[0]}/items", params={"size": 10}, headers=headers).json()["items"]
+    assert sorted(item["nombre"] for item in items) == ["Aceite", "Arroz", "Lentejas"]
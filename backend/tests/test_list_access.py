@@ -0,0 +1,53 @@
+"""
+Guardas de acceso a listas e ítems: los 404 conservan los mensajes que ya reciben
+los clientes en cada endpoint.
+"""
+import pytest
+from sqlalchemy import text
+
+from app.database import SessionLocal
+
+MISSING = 999999
+
+
+@pytest.mark.parametrize("method, url, body, detail", [
+    ("post", "/items/", {"nombre": "x", "cantidad": 1, "list_id": MISSING}, "Shopping list not found"),
+    ("post", f"/listas/{MISSING}/items/bulk", {"items": [{"nombre": "x", "cantidad": 1}]}, "Shopping list not found"),
+    ("put", f"/listas/{MISSING}", {"name": "x"}, "Lista no encontrada"),
+    ("get", f"/listas/{MISSING}/items", None, "Lista no encontrada"),
+    ("get", f"/listas/{MISSING}/budget-details", None, "Lista no encontrada"),
+    ("put", f"/items/{MISSING}", {"status": "comprado"}, "Item not found"),
+    ("delete", f"/items/{MISSING}", None, "Item not found"),
+    ("get", f"/blame/item/{MISSING}", None, "Ítem no encontrado"),
+])
+def test_not_found_details(client, admin, method, url, body, detail):
+    kwargs = {"json": body} if body is not None else {}
+    response = getattr(client, method)(url, headers=admin["headers"], **kwargs)
+    assert response.status_code == 404, response.text
+    assert response.json()["detail"] == detail
+
+
+def run_sql(sql: str, **params):
+    db = SessionLocal()
+    try:
+        db.execute(text(sql), params)
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_item_of_a_missing_list(client, admin, make_list):
+    list_id = make_list(1)
+    item_id = client.get(f"/listas/{list_id}/items?size=5", headers=admin["headers"]).json()["items"][0]["id"]
+    # Sin cascada: el ítem queda apuntando a una lista que ya no existe
+    run_sql("DELETE FROM shopping_lists WHERE id = :id", id=list_id)
+    try:
+        response = client.put(f"/items/{item_id}", json={"status": "comprado"}, headers=admin["headers"])
+        assert response.status_code == 404
+        assert response.json()["detail"] == "Shopping list not found for this item"
+        response = client.get(f"/blame/item/{item_id}", headers=admin["headers"])
+        assert response.status_code == 404
+        assert response.json()["detail"] == "Lista no encontrada"
+    finally:
+        # SQLite reutiliza el id de la lista: el ítem huérfano no debe colarse en la siguiente
+        run_sql("DELETE FROM list_items WHERE list_id = :id", id=list_id)
@@ -0,0 +1,59 @@
+"""
+Sincronización incremental de /listas/{id}/changes: versiones, tombstones, datos de
+la lista y respuesta completa cuando la versión del cliente no sirve.
+"""
+
+
+def changes(client, admin, list_id: int, since: int) -> dict:
+    response = client.get(f"/listas/{list_id}/changes", params={"since": since}, headers=admin["headers"])
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_changes_follow_item_and_list_versions(client, admin, make_list):
+    headers = admin["headers"]
+    list_id = make_list(3)
+
+    initial = changes(client, admin, list_id, 0)
+    assert initial["full"] is True
+    assert initial["items_count"] == 3
+    edited, deleted, _ = [item["id"] for item in initial["items"]]
+    version = initial["version"]
+
+    assert client.put(f"/items/{edited}", json={"cantidad": 7}, headers=headers).status_code == 200
+    delta = changes(client, admin, list_id, version)
+    assert delta["full"] is False
+    assert [item["id"] for item in delta["items"]] == [edited]
+    assert delta["items"][0]["cantidad"] == 7
+    assert delta["deleted_ids"] == []
+    assert delta["version"] > version
+    version = delta["version"]
+
+    assert client.delete(f"/items/{deleted}", headers=headers).status_code == 200
+    delta = changes(client, admin, list_id, version)
+    assert delta["items"] == []
+    assert delta["deleted_ids"] == [deleted]
+    assert delta["items_count"] == 2
+    version = delta["version"]
+
+    response = client.put(f"/listas/{list_id}", json={"name": "Renombrada", "budget": 50, "notas": "Sin gluten"}, headers=headers)
+    assert response.status_code == 200, response.text
+    delta = changes(client, admin, list_id, version)
+    assert delta["version"] > version
+    assert (delta["name"], delta["budget"], delta["notas"]) == ("Renombrada", 50, "Sin gluten")
+    assert delta["items"] == [] and delta["deleted_ids"] == []
+
+    # Al día: nada que enviar
+    current = changes(client, admin, list_id, delta["version"])
+    assert current["full"] is False
+    assert current["items"] == [] and current["deleted_ids"] == []
+
+
+def test_unknown_version_returns_the_full_list(client, admin, make_list):
+    list_id = make_list(2)
+    version = changes(client, admin, list_id, 0)["version"]
+
+    full = changes(client, admin, list_id, version + 100)
+    assert full["full"] is True
+    assert len(full["items"]) == 2
+    assert full["deleted_ids"] == []
@@ -0,0 +1,32 @@
+"""
+Etiquetas de ruta de /metrics: plantilla de la ruta, resuelta una vez por método y path.
+"""
+from app import metrics
+
+
+def test_route_is_resolved_once_per_method_and_path(client, admin, make_list, monkeypatch):
+    list_id = make_list(1)
+    calls = []
+    resolve = metrics.resolve_route
+
+    def counting_resolve(scope):
+        calls.append(scope["path"])
+        return resolve(scope)
+
+    monkeypatch.setattr(metrics, "resolve_route", counting_resolve)
+    url = f"/listas/{list_id}/items?size=5"
+    for _ in range(3):
+        assert client.get(url, headers=admin["headers"]).status_code == 200
+    assert calls.count(f"/listas/{list_id}/items") <= 1
+
+    body = client.get("/metrics").text
+    assert 'route="/listas/{lista_id}/items"' in body
+    assert f'route="/listas/{list_id}/items"' not in body
+
+
+def test_route_cache_is_bounded(client, admin, make_list, monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_ROUTE_CACHE_SIZE", 2)
+    for _ in range(3):
+        list_id = make_list(1)
+        client.get(f"/listas/{list_id}/items", headers=admin["headers"])
+    assert len(metrics._route_labels) <= 2
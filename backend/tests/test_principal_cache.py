@@ -0,0 +1,101 @@
+"""
+Revocación de la cache de principals entre workers: lo que invalida un proceso lo
+aplican los demás en su siguiente sincronización, sin esperar al TTL. La tarea de
+fondo no corre durante los tests (PRINCIPAL_CACHE_SYNC en conftest): el test llama
+a principal_cache.sync() para simular su siguiente pasada.
+"""
+import asyncio
+
+import pytest
+
+from app import models
+from app.auth_cache import PrincipalCache, principal_cache
+from app.database import SessionLocal
+
+from conftest import PASSWORD, login
+
+
+@pytest.fixture
+def member(client, admin, make_family):
+    """
+    Usuario normal, miembro de una familia nueva, con su principal ya en cache.
+    """
+    headers = admin["headers"]
+    family_id = make_family("Revocaciones")
+    username = f"member{family_id}"
+    user = client.post("/admin/users", json={"email": f"{username}@example.com", "username": username, "password": PASSWORD}, headers=headers).json()
+    response = client.post(f"/admin/families/{family_id}/members/{user['id']}", headers=headers)
+    assert response.status_code == 200, response.text
+    member_headers = login(client, username)
+    assert client.get(f"/families/{family_id}/calendars", headers=member_headers).status_code == 200
+    return {"id": user["id"], "family_id": family_id, "headers": member_headers}
+
+
+@pytest.fixture
+def other_worker():
+    """
+    Cache de otro proceso.
+    """
+    return PrincipalCache()
+
+
+def run_sql(statement):
+    db = SessionLocal()
+    try:
+        db.execute(statement)
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_membership_removed_in_another_worker_is_revoked(client, other_worker, member):
+    url = f"/families/{member['family_id']}/calendars"
+    run_sql(models.user_families.delete().where(models.user_families.c.user_id == member["id"]))
+    other_worker.invalidate_user(member["id"])
+
+    # Sin sincronizar, este worker sigue usando el principal en cache
+    assert client.get(url, headers=member["headers"]).status_code == 200
+    principal_cache.sync()
+    assert client.get(url, headers=member["headers"]).status_code == 403
+
+
+def test_user_deleted_in_another_worker_is_revoked(client, other_worker, member):
+    url = f"/families/{member['family_id']}/calendars"
+    run_sql(models.user_families.delete().where(models.user_families.c.user_id == member["id"]))
+    run_sql(models.User.__table__.delete().where(models.User.id == member["id"]))
+    other_worker.invalidate_user(member["id"])
+
+    principal_cache.sync()
+    assert client.get(url, headers=member["headers"]).status_code == 401
+
+
+def test_clear_in_another_worker_empties_the_cache(client, other_worker, member):
+    other_worker.clear()
+    principal_cache.sync()
+    client.get(f"/families/{member['family_id']}/calendars", headers=member["headers"])
+    assert principal_cache.stats()["size"] == 1
+
+
+def test_own_revocations_are_not_applied_twice(client, member):
+    url = f"/families/{member['family_id']}/calendars"
+    principal_cache.invalidate_user(member["id"])
+    client.get(url, headers=member["headers"])
+    principal_cache.sync()
+
+    hits = principal_cache.stats()["hits"]
+    client.get(url, headers=member["headers"])
+    assert principal_cache.stats()["hits"] == hits + 1
+
+
+def test_background_task_syncs_periodically(monkeypatch):
+    cache = PrincipalCache(sync_interval=0.01)
+    calls = []
+    monkeypatch.setattr(cache, "sync", lambda: calls.append(True))
+
+    async def run_briefly():
+        task = asyncio.create_task(cache.sync_forever())
+        await asyncio.sleep(0.1)
+        task.cancel()
+
+    asyncio.run(run_briefly())
+    assert len(calls) >= 2
@@ -0,0 +1,52 @@
+"""
+Facetas de categoría/marca en el alta masiva: solo suman los productos que inserta
+la propia petición, aunque otra cree el mismo en el mismo segundo.
+"""
+import datetime
+
+import pytz
+
+from app import crud, tz_util
+from app.database import SessionLocal
+
+
+def facet_counts(client, admin, family_id: int) -> dict:
+    response = client.get(f"/families/{family_id}/facets", headers=admin["headers"])
+    assert response.status_code == 200, response.text
+    return {facet["value"]: facet["count"] for facet in response.json()["categories"]}
+
+
+def test_bulk_counts_facets_only_for_products_it_inserted(client, admin, make_family, monkeypatch):
+    headers = admin["headers"]
+    family_id = make_family("Facetas")
+    calendar_id = client.post(f"/families/{family_id}/calendars", json={"nombre": "Facetas"}, headers=headers).json()["id"]
+    list_id = client.post("/listas/", json={"name": "Compra", "calendar_id": calendar_id}, headers=headers).json()["id"]
+
+    # Todo ocurre en el mismo segundo
+    fixed = datetime.datetime(2026, 10, 1, 12, 0, 0, tzinfo=pytz.utc)
+    monkeypatch.setattr(tz_util, "now", lambda: fixed)
+    upsert = crud._product_upsert
+    raced = []
+
+    def racing_upsert(db, assignments=None):
+        # Otra petición crea "Leche" entre la lectura de productos y el INSERT
+        if not raced:
+            raced.append(True)
+            other = SessionLocal()
+            try:
+                crud.get_or_create_product(other, "Leche", family_id, category="Lácteos")
+                other.commit()
+            finally:
+                other.close()
+        return upsert(db, assignments)
+
+    monkeypatch.setattr(crud, "_product_upsert", racing_upsert)
+    response = client.post(f"/listas/{list_id}/items/bulk", json={"items": [
+        {"nombre": "leche", "cantidad": 1, "category": "Lácteos"},
+        {"nombre": "Pan", "cantidad": 1, "category": "Panadería"},
+    ]}, headers=headers)
+    assert response.status_code == 200, response.text
+    assert raced
+    assert len({item["product_id"] for item in response.json()}) == 2
+
+    assert facet_counts(client, admin, family_id) == {"Lácteos": 1, "Panadería": 1}
@@ -0,0 +1,56 @@
+"""
+Búsqueda de productos sobre el índice en memoria: relevancia por campo y posición
+y coincidencia sin tildes ni mayúsculas.
+"""
+import pytest
+
+PRODUCTS = [
+    {"name": "Girasol"},
+    {"name": "Crema", "category": "Protección Solar"},
+    {"name": "Zumo", "brand": "Fuensol"},
+    {"name": "Aceite de Sol"},
+    {"name": "Agua con gas", "brand": "Solán de Cabras"},
+    {"name": "Solomillo"},
+    {"name": "Plátano", "category": "Frutas"},
+]
+
+
+@pytest.fixture(scope="module")
+def family(client, admin):
+    response = client.post("/families", json={"nombre": "Búsqueda"}, headers=admin["headers"])
+    family_id = response.json()["id"]
+    for product in PRODUCTS:
+        response = client.post(f"/families/{family_id}/products", json=product, headers=admin["headers"])
+        assert response.status_code == 200, response.text
+    return family_id
+
+
+def search(client, admin, family_id: int, q: str, page: int = 1, size: int = 10):
+    response = client.get("/products/search", params={"q": q, "family_id": family_id, "page": page, "size": size}, headers=admin["headers"])
+    assert response.status_code == 200, response.text
+    body = response.json()
+    return [product["name"] for product in body["items"]], body["total"]
+
+
+def test_ranking_is_name_then_brand_then_category_and_prefix_first(client, admin, family):
+    names, total = search(client, admin, family, "sol")
+    assert names == ["Solomillo", "Aceite de Sol", "Girasol", "Agua con gas", "Zumo", "Crema"]
+    assert total == 6
+
+
+def test_ranking_holds_across_pages(client, admin, family):
+    assert search(client, admin, family, "sol", page=2, size=2) == (["Girasol", "Agua con gas"], 6)
+
+
+@pytest.mark.parametrize("q, expected", [
+    ("platano", ["Plátano"]),
+    ("PLÁTANO", ["Plátano"]),
+    ("  aceite   de  sol ", ["Aceite de Sol"]),
+    ("solan", ["Agua con gas"]),
+    ("proteccion", ["Crema"]),
+    ("frutas", ["Plátano"]),
+])
+def test_matching_ignores_accents_case_and_spacing(client, admin, family, q, expected):
+    names, total = search(client, admin, family, q)
+    assert names == expected
+    assert total == len(expected)
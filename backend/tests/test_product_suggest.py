@@ -0,0 +1,39 @@
+"""
+Autocompletado de productos: el prefijo se normaliza igual que el nombre del
+producto (sin tildes, minúsculas y espacios colapsados).
+"""
+import pytest
+
+
+@pytest.fixture
+def family(client, admin, make_family):
+    family_id = make_family("Sugerencias")
+    for name, price in (("Plátano", 1.2), ("Leche Entera", 0.9), ("Lechuga", 0.7)):
+        response = client.post(f"/families/{family_id}/products", json={"name": name, "last_price": price}, headers=admin["headers"])
+        assert response.status_code == 200, response.text
+    return family_id
+
+
+def suggest(client, admin, family_id: int, prefix: str) -> list:
+    response = client.get(f"/families/{family_id}/products/suggest", params={"prefix": prefix}, headers=admin["headers"])
+    assert response.status_code == 200, response.text
+    return [suggestion["name"] for suggestion in response.json()]
+
+
+@pytest.mark.parametrize("prefix, expected", [
+    ("pla", ["Plátano"]),
+    ("platano", ["Plátano"]),
+    ("PLÁT", ["Plátano"]),
+    ("leche  entera", ["Leche Entera"]),
+    ("  Lech", ["Leche Entera", "Lechuga"]),
+    ("pera", []),
+])
+def test_suggest_folds_accents_and_whitespace(client, admin, family, prefix, expected):
+    assert suggest(client, admin, family, prefix) == expected
+
+
+def test_suggest_keeps_the_display_name_and_price(client, admin, family):
+    response = client.get(f"/families/{family}/products/suggest", params={"prefix": "platano"}, headers=admin["headers"])
+    [suggestion] = response.json()
+    assert suggestion["name"] == "Plátano"
+    assert suggestion["last_price"] == 1.2
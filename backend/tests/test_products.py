@@ -0,0 +1,119 @@
+"""
+Identidad de producto por nombre normalizado: upsert de get_or_create_product, 409
+ante un alta concurrente y fusión de duplicados (merge_duplicate_products).
+"""
+import datetime
+
+import pytest
+from sqlalchemy.dialects import mysql
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+
+from app import crud, models
+from app.database import SessionLocal
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def family_id(make_family):
+    return make_family("Productos")
+
+
+def test_names_with_the_same_key_resolve_to_one_product(db, family_id):
+    first = crud.get_or_create_product(db, "Plátano", family_id, category="Fruta")
+    second = crud.get_or_create_product(db, "  platano ", family_id, brand="Canarias")
+    third = crud.get_or_create_product(db, "PLATANO", family_id)
+    db.commit()
+
+    assert first.id == second.id == third.id
+    assert (third.name, third.normalized_name) == ("Plátano", "platano")
+    assert (third.category, third.brand) == ("Fruta", "Canarias")
+    assert db.query(models.Product).filter(models.Product.family_id == family_id).count() == 1
+
+
+def test_bulk_items_with_equivalent_names_share_the_product(client, admin, family_id):
+    headers = admin["headers"]
+    calendar_id = client.post(f"/families/{family_id}/calendars", json={"nombre": "Productos"}, headers=headers).json()["id"]
+    list_id = client.post("/listas/", json={"name": "Compra", "calendar_id": calendar_id}, headers=headers).json()["id"]
+    response = client.post(f"/listas/{list_id}/items/bulk", json={"items": [
+        {"nombre": "Leche Entera", "cantidad": 1}, {"nombre": "leche  entera", "cantidad": 2},
+    ]}, headers=headers)
+    assert response.status_code == 200, response.text
+    assert len({item["product_id"] for item in response.json()}) == 1
+
+
+def test_concurrent_create_answers_409(client, admin, family_id, monkeypatch):
+    headers = admin["headers"]
+    url = f"/families/{family_id}/products"
+    assert client.post(url, json={"name": "Café"}, headers=headers).status_code == 200
+    assert client.post(url, json={"name": "cafe "}, headers=headers).status_code == 409
+
+    # La comprobación previa no ve el producto: lo ha creado otra petición entretanto
+    monkeypatch.setattr(crud, "find_product_by_name", lambda *args, **kwargs: None)
+    response = client.post(url, json={"name": "CAFÉ"}, headers=headers)
+    assert response.status_code == 409, response.text
+
+
+def test_mysql_upsert_returns_the_existing_id_first():
+    table = models.Product.__table__
+    statement = mysql_insert(table).values(name="Leche", normalized_name="leche", family_id=1)
+    statement = statement.on_duplicate_key_update(crud._product_upsert_assignments(statement.inserted, mysql=True))
+    sql = str(statement.compile(dialect=mysql.dialect()))
+    # LAST_INSERT_ID(id) antes que el resto: lastrowid es el id de la fila existente
+    assert "ON DUPLICATE KEY UPDATE id = last_insert_id(products.id), updated_at = " in sql
+
+
+def test_merge_moves_items_and_prices_and_keeps_the_latest_price(client, admin, db, family_id):
+    headers = admin["headers"]
+    calendar_id = client.post(f"/families/{family_id}/calendars", json={"nombre": "Fusión"}, headers=headers).json()["id"]
+    list_id = client.post("/listas/", json={"name": "Compra", "calendar_id": calendar_id}, headers=headers).json()["id"]
+
+    old = datetime.datetime(2026, 1, 1)
+    survivor = models.Product(name="Leche", normalized_name="leche", family_id=family_id, last_price=1.0,
+                              category="Lácteos", created_at=old, updated_at=old)
+    # Duplicado de antes de la clave normalizada: su normalized_name no es el calculado
+    duplicate = models.Product(name="leche ", normalized_name="leche (legacy)", family_id=family_id, last_price=1.25,
+                               brand="Pascual", created_at=old, updated_at=old + datetime.timedelta(days=30))
+    db.add_all([survivor, duplicate])
+    db.flush()
+    db.add_all([
+        models.ListItem(list_id=list_id, product_id=survivor.id, nombre="Leche", cantidad=1, status="pendiente"),
+        models.ListItem(list_id=list_id, product_id=duplicate.id, nombre="leche", cantidad=2, status="pendiente"),
+        models.PriceHistory(product_id=survivor.id, price=1.0, created_at=old),
+        models.PriceHistory(product_id=duplicate.id, price=1.25, created_at=old + datetime.timedelta(days=30)),
+    ])
+    db.execute(models.list_items_archive.insert(), {
+        "id": 10_000_000 + duplicate.id, "list_id": list_id, "product_id": duplicate.id, "nombre": "leche",
+        "cantidad": 1, "status": "comprado", "version": 0,
+    })
+    db.commit()
+    survivor_id, duplicate_id = survivor.id, duplicate.id
+
+    report = crud.merge_duplicate_products(db)
+    assert report["groups"] >= 1 and report["merged_products"] >= 1
+    db.expire_all()
+
+    assert db.get(models.Product, duplicate_id) is None
+    merged = db.get(models.Product, survivor_id)
+    assert merged.normalized_name == "leche"
+    assert merged.last_price == 1.25
+    assert (merged.category, merged.brand) == ("Lácteos", "Pascual")
+
+    items = db.query(models.ListItem).filter(models.ListItem.list_id == list_id).all()
+    assert {item.product_id for item in items} == {survivor_id}
+    archived = db.execute(models.list_items_archive.select().where(models.list_items_archive.c.list_id == list_id)).all()
+    assert {row.product_id for row in archived} == {survivor_id}
+    prices = db.query(models.PriceHistory.price).filter(models.PriceHistory.product_id == survivor_id).all()
+    assert sorted(price for (price,) in prices) == [1.0, 1.25]
+
+    counters = client.get(f"/listas/{list_id}", headers=headers).json()
+    assert counters["items_count"] == 2
+    facets = client.get(f"/families/{family_id}/facets", headers=headers).json()
+    assert facets["brands"] == [{"value": "Pascual", "count": 1}]
@@ -0,0 +1,34 @@
+"""
+Presupuesto de sentencias SQL de las rutas calientes: el número de consultas no debe
+crecer con el número de ítems (N+1).
+"""
+import pytest
+
+from app.query_stats import assert_max_queries
+
+
+def query_count(response) -> int:
+    return int(response.headers["X-DB-Queries"])
+
+
+@pytest.mark.parametrize("url, max_queries", [
+    ("/listas/{list_id}/items?page=1&size=50", 6),
+    ("/listas/{list_id}/items?size=50", 6),
+    ("/listas/{list_id}/items?size=50&status=pendiente&include_total=true", 6),
+    ("/listas/{list_id}/budget-details", 3),
+])
+def test_query_count_does_not_grow_with_items(client, admin, make_list, url, max_queries):
+    counts = []
+    for n_items in (3, 40):
+        list_id = make_list(n_items)
+        response = assert_max_queries(client, "get", url.format(list_id=list_id), max_queries, headers=admin["headers"])
+        assert response.status_code == 200, response.text
+        assert "X-DB-N-Plus-One" not in response.headers
+        counts.append(query_count(response))
+    assert counts[0] == counts[1], counts
+
+
+def test_counting_is_scoped_to_the_request(client, admin, make_list):
+    list_id = make_list(2)
+    response = client.get(f"/listas/{list_id}/items?size=5", headers=admin["headers"])
+    assert "X-DB-Queries" not in response.headers
@@ -0,0 +1,55 @@
+"""
+Lecturas en la réplica con read-your-writes: tras escribir, el usuario lee del
+primario aunque la siguiente petición la atienda otro worker.
+"""
+from app.database import READ_AFTER_WRITE_COOKIE, write_tracker
+
+from conftest import replicate
+
+
+def item_names(client, list_id: int, headers: dict) -> set:
+    response = client.get(f"/listas/{list_id}/items?size=50", headers=headers)
+    assert response.status_code == 200, response.text
+    return {item["nombre"] for item in response.json()["items"]}
+
+
+def add_item(client, list_id: int, headers: dict, nombre: str):
+    response = client.post(f"/listas/{list_id}/items/bulk", json={"items": [{"nombre": nombre, "cantidad": 1}]}, headers=headers)
+    assert response.status_code == 200, response.text
+    return response
+
+
+def forget_writes():
+    # Otro worker: no comparte el WriteTracker en memoria
+    write_tracker._last_write.clear()
+
+
+def test_reads_go_to_the_replica_without_recent_writes(client, admin, make_list):
+    headers = admin["headers"]
+    list_id = make_list(2)
+    replicate()
+    add_item(client, list_id, headers, "Solo en el primario")
+    forget_writes()
+    client.cookies.delete(READ_AFTER_WRITE_COOKIE)
+
+    assert "Solo en el primario" not in item_names(client, list_id, headers)
+    replicate()
+    assert "Solo en el primario" in item_names(client, list_id, headers)
+
+
+def test_write_cookie_keeps_reads_on_the_primary_across_workers(client, admin, make_list):
+    headers = admin["headers"]
+    list_id = make_list(2)
+    replicate()
+    response = add_item(client, list_id, headers, "Recién añadido")
+    assert READ_AFTER_WRITE_COOKIE in response.cookies
+    forget_writes()
+
+    assert "Recién añadido" in item_names(client, list_id, headers)
+
+
+def test_reads_do_not_set_the_cookie(client, admin, make_list):
+    list_id = make_list(1)
+    client.cookies.delete(READ_AFTER_WRITE_COOKIE)
+    response = client.get(f"/listas/{list_id}/items?size=5", headers=admin["headers"])
+    assert READ_AFTER_WRITE_COOKIE not in response.cookies
@@ -0,0 +1,36 @@
+"""
+Migraciones del arranque sobre una base SQLite propia (no la de la app).
+"""
+import datetime
+
+from sqlalchemy import DateTime, MetaData, create_engine, select
+
+from app import models
+from app.startup import _migrate
+
+
+def test_migrate_removes_time_from_date_columns_created_as_datetime(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    # Esquema de antes del cambio de shopping_lists.list_for_date a Date
+    old_metadata = MetaData()
+    for table in models.Base.metadata.sorted_tables:
+        table.to_metadata(old_metadata)
+    old_lists = old_metadata.tables["shopping_lists"]
+    old_lists.c.list_for_date.type = DateTime()
+    old_metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(old_lists.insert(), [
+            {"id": 1, "name": "Con hora", "list_for_date": datetime.datetime(2026, 3, 1, 18, 30)},
+            {"id": 2, "name": "Medianoche", "list_for_date": datetime.datetime(2026, 3, 2)},
+            {"id": 3, "name": "Sin fecha", "list_for_date": None},
+        ])
+
+    _migrate(engine)
+
+    lists = models.ShoppingList.__table__
+    with engine.connect() as conn:
+        rows = conn.execute(select(lists.c.id, lists.c.list_for_date).order_by(lists.c.id)).all()
+        in_march_first = conn.execute(select(lists.c.id).where(lists.c.list_for_date == datetime.date(2026, 3, 1))).scalars().all()
+    assert rows == [(1, datetime.date(2026, 3, 1)), (2, datetime.date(2026, 3, 2)), (3, None)]
+    assert in_march_first == [1]
+    engine.dispose()
@@ -22,7 +22,8 @@ const PreviousItemsModal = ({ show, handleClose, familyId, listId, handleAddItem
                     const response = await fetch(`/api/families/${familyId}/previous_lists?start_date=${startDate}&end_date=${endDate}`);
                     if (response.ok) {
                         const data = await response.json();
-                        const filteredLists = data.items.filter(list => list.id !== listId);
+                        // Archived lists are read-only: their items cannot be copied
+                        const filteredLists = data.items.filter(list => list.id !== listId && !list.archived);
                         setPreviousLists(filteredLists);
 
                         const itemsPromises = filteredLists.map(list =>
@@ -220,24 +220,20 @@ function ShoppingListView() {
         const listDetailsPromise = fetch(`/api/listas/${listId}`).then(res => res.json());
         const itemsPromise = fetch(`/api/listas/${listId}/items?${queryParams.toString()}`).then(res => res.json());
         const blamePromise = fetch(`/api/blame/lista/${listId}`).then(res => res.json());
-        const purchasedCountPromise = fetch(`/api/listas/${listId}/items?status=comprado&size=1`).then(res => res.json());
-        const totalItemsCountPromise = fetch(`/api/listas/${listId}/items?size=1`).then(res => res.json());
 
         Promise.all([
             listDetailsPromise,
             itemsPromise,
-            blamePromise,
-            purchasedCountPromise,
-            totalItemsCountPromise
+            blamePromise
         ])
-            .then(([listData, itemsData, blameData, purchasedCountData, totalItemsCountData]) => {
+            .then(([listData, itemsData, blameData]) => {
                 setListDetails(listData);
                 setItems(Array.isArray(itemsData.items) ? itemsData.items : []);
                 setSelectedItems(new Set());
                 setItemsPage(itemsData.page);
                 setItemsTotalPages(Math.ceil(itemsData.total / itemsData.size));
-                setItemsTotalCount(totalItemsCountData.total);
-                setPurchasedItemsCount(purchasedCountData.total);
+                setItemsTotalCount(listData.items_count);
+                setPurchasedItemsCount(listData.purchased_count);
                 setBlame(Array.isArray(blameData) ? blameData : []);
                 if (listData.calendar && listData.calendar.family_id) {
                     fetch(`/api/families/${listData.calendar.family_id}/products`)
@@ -371,16 +367,26 @@ function ShoppingListView() {
     const handleAddItemsFromModal = async (itemsToAdd) => {
         if (!listId) return;
         try {
-            await fetch(`/api/listas/${listId}/items/bulk`, {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ items: itemsToAdd })
-            });
-            fetchListAndBlame(); 
+            // The server copies the selected items per source list; only ids travel
+            const idsBySourceList = itemsToAdd.reduce((acc, item) => {
+                (acc[item.list_id] = acc[item.list_id] || []).push(item.id);
+                return acc;
+            }, {});
+            // One source list at a time: every request writes to the same target list
+            for (const [sourceId, ids] of Object.entries(idsBySourceList)) {
+                const params = new URLSearchParams();
+                ids.forEach(id => params.append('item_ids', id));
+                const res = await fetch(`/api/listas/${listId}/clone-from/${sourceId}?${params}`, { method: 'POST' });
+                if (!res.ok) throw new Error('Error al agregar items a la lista');
+            }
+            fetchListAndBlame();
             fetchBudgetDetails();
             showToast('Items agregados a la lista', 'success');
         } catch (err) {
             showToast('Error al agregar items a la lista', 'error');
+            // Some source lists may have been copied before the failure
+            fetchListAndBlame();
+            fetchBudgetDetails();
         }
     };
 
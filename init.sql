@@ -61,13 +61,22 @@ CREATE TABLE shopping_lists (
     owner_id INT,
     list_for_date DATE,
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    items_count INT NOT NULL DEFAULT 0,
+    pending_count INT NOT NULL DEFAULT 0,
+    purchased_count INT NOT NULL DEFAULT 0,
+    not_needed_count INT NOT NULL DEFAULT 0,
+    estimated_total FLOAT NOT NULL DEFAULT 0,
+    purchased_total FLOAT NOT NULL DEFAULT 0,
+    version INT NOT NULL DEFAULT 0,
     FOREIGN KEY (calendar_id) REFERENCES calendars (id),
-    FOREIGN KEY (owner_id) REFERENCES users (id)
+    FOREIGN KEY (owner_id) REFERENCES users (id),
+    INDEX ix_shopping_lists_calendar_date (calendar_id, list_for_date)
 );
 
 CREATE TABLE products (
     id INT AUTO_INCREMENT PRIMARY KEY,
     name VARCHAR(255) NOT NULL,
+    normalized_name VARCHAR(255) NULL,
     description TEXT,
     category VARCHAR(100),
     brand VARCHAR(100),
@@ -78,7 +87,18 @@ CREATE TABLE products (
     updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     FOREIGN KEY (family_id) REFERENCES families (id) ON DELETE CASCADE,
     FOREIGN KEY (shared_image_id) REFERENCES shared_images (id) ON DELETE SET NULL,
-    UNIQUE KEY (name, family_id)
+    UNIQUE KEY (name, family_id),
+    UNIQUE KEY uq_products_family_normalized_name (family_id, normalized_name),
+    INDEX ix_products_family_updated (family_id, updated_at)
+);
+
+CREATE TABLE product_facets (
+    family_id INT NOT NULL,
+    kind VARCHAR(20) NOT NULL,
+    value VARCHAR(100) NOT NULL,
+    count INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (family_id, kind, value),
+    FOREIGN KEY (family_id) REFERENCES families (id) ON DELETE CASCADE
 );
 
 CREATE TABLE price_history (
@@ -107,10 +127,23 @@ CREATE TABLE list_items (
     creado_por_id INT,
     shared_image_id INT NULL,
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    version INT NOT NULL DEFAULT 0,
     FOREIGN KEY (list_id) REFERENCES shopping_lists (id),
     FOREIGN KEY (creado_por_id) REFERENCES users (id),
     FOREIGN KEY (product_id) REFERENCES products (id) ON DELETE SET NULL,
-    FOREIGN KEY (shared_image_id) REFERENCES shared_images (id) ON DELETE SET NULL
+    FOREIGN KEY (shared_image_id) REFERENCES shared_images (id) ON DELETE SET NULL,
+    INDEX ix_list_items_list_created_id (list_id, created_at, id),
+    INDEX ix_list_items_list_version (list_id, version)
+);
+
+CREATE TABLE list_item_tombstones (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    list_id INT NOT NULL,
+    item_id INT NOT NULL,
+    version INT NOT NULL,
+    deleted_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (list_id) REFERENCES shopping_lists (id) ON DELETE CASCADE,
+    INDEX ix_list_item_tombstones_list_version (list_id, version)
 );
 
 CREATE TABLE blames (
@@ -162,3 +195,85 @@ CREATE TABLE image_search_configs (
     is_default BOOLEAN DEFAULT FALSE,
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP
 );
+
+-- Archivo histórico (python -m app.maintenance archive-lists): mismas columnas que las
+-- tablas calientes, con los ids originales y sin claves foráneas
+CREATE TABLE shopping_lists_archive (
+    id INT PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    notas TEXT,
+    comentarios TEXT,
+    status ENUM(
+        'pendiente',
+        'revisada',
+        'no revisada'
+    ),
+    budget FLOAT,
+    calendar_id INT,
+    owner_id INT,
+    list_for_date DATE,
+    created_at DATETIME,
+    items_count INT NOT NULL DEFAULT 0,
+    pending_count INT NOT NULL DEFAULT 0,
+    purchased_count INT NOT NULL DEFAULT 0,
+    not_needed_count INT NOT NULL DEFAULT 0,
+    estimated_total FLOAT NOT NULL DEFAULT 0,
+    purchased_total FLOAT NOT NULL DEFAULT 0,
+    version INT NOT NULL DEFAULT 0,
+    archived_at DATETIME,
+    INDEX ix_shopping_lists_archive_calendar_date (calendar_id, list_for_date)
+);
+
+CREATE TABLE list_items_archive (
+    id INT PRIMARY KEY,
+    list_id INT,
+    product_id INT NULL,
+    nombre VARCHAR(255) NOT NULL,
+    comentario TEXT,
+    cantidad FLOAT,
+    unit VARCHAR(50) NULL,
+    status ENUM(
+        'pendiente',
+        'comprado',
+        'ya no se necesita'
+    ),
+    precio_estimado FLOAT,
+    precio_confirmado FLOAT,
+    shared_image_id INT NULL,
+    creado_por_id INT,
+    created_at DATETIME,
+    version INT NOT NULL DEFAULT 0,
+    archived_at DATETIME,
+    INDEX ix_list_items_archive_list_id (list_id)
+);
+
+CREATE TABLE blames_archive (
+    id INT PRIMARY KEY,
+    user_id INT,
+    action VARCHAR(50),
+    entity_type VARCHAR(50),
+    entity_id INT,
+    timestamp DATETIME,
+    detalles TEXT,
+    archived_at DATETIME,
+    INDEX ix_blames_archive_entity (entity_type, entity_id)
+);
+
+CREATE TABLE notifications_archive (
+    id INT PRIMARY KEY,
+    user_id INT NOT NULL,
+    family_id INT,
+    message TEXT NOT NULL,
+    is_read BOOLEAN,
+    created_at DATETIME,
+    created_by_id INT,
+    link VARCHAR(255),
+    archived_at DATETIME,
+    INDEX ix_notifications_archive_user_id (user_id)
+);
+
+CREATE TABLE schema_info (
+    `key` VARCHAR(50) PRIMARY KEY,
+    value VARCHAR(255) NOT NULL,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);